@@ -6,6 +6,8 @@ from .upload_best_model_op import upload_best_model_op
 from .lookup_model_op import lookup_model_op
 from .model_batch_predict_op import model_batch_predict_op
 from .get_hyperparameter_tuning_results_op import get_hyperparameter_tuning_results_op
+from .hyperparameter_tuning_job_op import hyperparameter_tuning_job_op
+from .split_table_op import split_table_op
 
 __version__ = "0.0.1"
 __all__ = [
@@ -17,4 +19,6 @@ __all__ = [
     "lookup_model_op",
     "model_batch_predict_op",
     "get_hyperparameter_tuning_results_op",
+    "hyperparameter_tuning_job_op",
+    "split_table_op",
 ]
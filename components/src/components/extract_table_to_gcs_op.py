@@ -8,13 +8,48 @@ def extract_table_to_gcs_op(
     bq_table: Input[Artifact],
     dataset: Output[Dataset],
     location: str = "US",
+    destination_format: str = "CSV",
+    compression: str = "NONE",
+    num_shards: int = 0,
 ) -> None:
     """
     Extract a Big Query table into Google Cloud Storage.
+
+    The number of exported rows is stored in the `numRows` metadata of the
+    dataset.
+
+    Args:
+        bq_table (Artifact): BigQuery table to extract.
+        dataset (Dataset): Output dataset in Cloud Storage.
+        location (str): location of the BigQuery table.
+        destination_format (str): CSV, AVRO or PARQUET.
+        compression (str): NONE, GZIP (CSV, PARQUET), SNAPPY or DEFLATE (AVRO),
+            SNAPPY or ZSTD (PARQUET).
+        num_shards (int): 0 exports the table into the single file `dataset.uri`.
+            Otherwise `dataset.uri` is a directory and the table is exported to
+            `num_shards` wildcard URIs, each of which BigQuery splits into as many
+            files as needed (required for tables larger than 1 GB). The shard
+            manifest is stored in the `shards` metadata of the dataset.
     """
 
     import google.cloud.bigquery as bq
 
+    EXTENSIONS = {"CSV": "csv", "AVRO": "avro", "PARQUET": "parquet"}
+    COMPRESSIONS = {
+        "CSV": ["NONE", "GZIP"],
+        "AVRO": ["NONE", "DEFLATE", "SNAPPY"],
+        "PARQUET": ["NONE", "GZIP", "SNAPPY", "ZSTD"],
+    }
+
+    destination_format = destination_format.upper()
+    compression = compression.upper()
+    if destination_format not in EXTENSIONS:
+        raise ValueError(f"Destination format {destination_format} not supported")
+    if compression not in COMPRESSIONS[destination_format]:
+        raise ValueError(
+            f"Compression {compression} not supported for {destination_format}"
+        )
+
     project_id = bq_table.metadata["projectId"]
     dataset_id = bq_table.metadata["datasetId"]
     table_id = bq_table.metadata["tableId"]
@@ -24,11 +59,36 @@ def extract_table_to_gcs_op(
     table = bq.table.Table(table_ref=full_table_id)
 
     # Initiate the Big Query client to connect with the project
-    # job_config = bq.job.ExtractJobConfig(**{})
     client = bq.client.Client(project=project_id, location=location)
 
+    if num_shards > 0:
+        extension = EXTENSIONS[destination_format]
+        if compression == "GZIP" and destination_format == "CSV":
+            extension += ".gz"
+        destination_uris = [
+            f"{dataset.uri}/{shard:03d}-*.{extension}" for shard in range(num_shards)
+        ]
+    else:
+        destination_uris = dataset.uri
+
+    job_config = bq.job.ExtractJobConfig(
+        destination_format=destination_format,
+        compression=compression,
+    )
+
     # Submit the extract table job to store on GCS
-    extract_job = client.extract_table(table, dataset.uri)
+    extract_job = client.extract_table(table, destination_uris, job_config=job_config)
 
     # Wait for the extract job to complete
     extract_job.result()
+
+    dataset.metadata["numRows"] = client.get_table(full_table_id).num_rows
+    dataset.metadata["format"] = destination_format
+    dataset.metadata["compression"] = compression
+    if num_shards > 0:
+        dataset.metadata["shards"] = [
+            dict(uri=uri, fileCount=file_count)
+            for uri, file_count in zip(
+                destination_uris, extract_job.destination_uri_file_counts
+            )
+        ]
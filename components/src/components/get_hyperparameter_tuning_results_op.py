@@ -24,7 +24,9 @@ def get_hyperparameter_tuning_results_op(
 
     job_resource = aip.HyperparameterTuningJob.get(tuning_job_name).gca_resource
 
-    trials = job_resource.trials
+    # failed and infeasible trials have no final measurement, early stopped
+    # trials are measured at the step they were stopped at
+    trials = [trial for trial in job_resource.trials if trial.final_measurement.metrics]
 
     if len(study_spec_metrics) > 1:
         raise RuntimeError(
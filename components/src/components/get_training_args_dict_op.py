@@ -1,4 +1,4 @@
-from kfp.dsl import Input, component, Dataset
+from kfp.dsl import Input, component, Dataset, Model
 
 
 @component(base_image="python:3.10.14")
@@ -7,10 +7,67 @@ def get_training_args_dict_op(
     valid_data: Input[Dataset],
     test_data: Input[Dataset],
     hypertune: bool,
+    warm_start: bool = False,
+    champion_model: Input[Model] = None,
+    epochs: int = 0,
+    subsample_rate: float = 1.0,
+    subsample_schedule: list = [],
+    report_steps: int = 0,
+    optimized_prune_fraction: float = 0.0,
 ) -> dict:
-    return dict(
+    """
+    Create the command line arguments of the training job.
+
+    Args:
+        train_data (Dataset): training data
+        valid_data (Dataset): validation data
+        test_data (Dataset): test data
+        hypertune (bool): whether the job is a hyperparameter tuning trial
+        warm_start (bool): initialize the model from `champion_model`
+        champion_model (Model): model found by `lookup_model_op`, ignored if no
+            model was found
+        epochs (int): number of epochs, 0 for the default of the trainer
+        subsample_rate (float): fraction of the training data read in each epoch
+        subsample_schedule (list): `[rate, epochs]` stages training on growing
+            fractions of the training data, replaces `epochs` and
+            `subsample_rate`
+        report_steps (int): report an estimate of the hypertune metric every N
+            training steps for early stopping of trials, 0 to only report it
+            after each epoch
+        optimized_prune_fraction (float): fraction of the hidden units removed in
+            an optimized variant of the model for serving, 0 to not create it
+
+    Returns:
+        dict: arguments of `trainer.task`
+    """
+    import json
+
+    args = dict(
         train_data=train_data.path,
         valid_data=valid_data.path,
         test_data=test_data.path,
         hypertune=hypertune,
     )
+    # row counts recorded by `extract_table_to_gcs_op`, which make the number
+    # of batches of the training and validation datasets known
+    for split, data in [("train", train_data), ("valid", valid_data)]:
+        if "numRows" in data.metadata:
+            args[f"{split}_rows"] = data.metadata["numRows"]
+    # `lookup_model_op` only sets the resource name if a model was found
+    if warm_start and champion_model and champion_model.metadata.get("resourceName"):
+        args["warm_start_model"] = champion_model.uri
+
+    hparams = {}
+    if epochs > 0:
+        hparams["epochs"] = epochs
+    if subsample_rate < 1.0:
+        hparams["subsample_rate"] = subsample_rate
+    if subsample_schedule:
+        hparams["subsample_schedule"] = subsample_schedule
+    if report_steps > 0:
+        hparams["hypertune_report_steps"] = report_steps
+    if optimized_prune_fraction > 0:
+        hparams["optimized_prune_fraction"] = optimized_prune_fraction
+    if hparams:
+        args["hparams"] = json.dumps(hparams)
+    return args
@@ -0,0 +1,150 @@
+from kfp.dsl import component, OutputPath
+
+
+@component(
+    base_image="python:3.10.14",
+    packages_to_install=[
+        "google-cloud-pipeline-components==2.14.1",
+        "google-cloud-aiplatform==1.55.0",
+    ],
+)
+def hyperparameter_tuning_job_op(
+    gcp_resources: OutputPath(str),  # type: ignore
+    display_name: str,
+    project: str,
+    location: str,
+    base_output_directory: str,
+    worker_pool_specs: list,
+    study_spec_metrics: list,
+    study_spec_parameters: list,
+    max_trial_count: int,
+    parallel_trial_count: int,
+    max_failed_trial_count: int = 0,
+    study_spec_algorithm: str = "ALGORITHM_UNSPECIFIED",
+    study_spec_measurement_selection_type: str = "BEST_MEASUREMENT",
+    early_stopping: str = "",
+    service_account: str = "",
+):
+    """
+    Run a hyperparameter tuning job with automated early stopping of trials.
+
+    Unlike `HyperparameterTuningJobRunOp` the study spec can stop unpromising
+    trials based on the intermediate measurements they report (e.g. every N
+    training steps with `hypertune_report_steps`).
+
+    Args:
+        gcp_resources (OutputPath(str)): gcp_resources for Vertex AI UI integration.
+        display_name (str): Name of the hyperparameter tuning job.
+        project (str): project id of the Google Cloud project.
+        location (str): location of the Google Cloud project.
+        base_output_directory (str): gs:// URI of the outputs of the trials.
+        worker_pool_specs (list): worker pool specs of each trial.
+        study_spec_metrics (list): serialized metric specs, see
+            `hyperparameter_tuning_job.utils.serialize_metrics`.
+        study_spec_parameters (list): serialized parameter specs, see
+            `hyperparameter_tuning_job.utils.serialize_parameters`.
+        max_trial_count (int): number of trials.
+        parallel_trial_count (int): number of trials run in parallel.
+        max_failed_trial_count (int): number of failed trials before the job
+            fails, 0 lets Vertex AI decide.
+        study_spec_algorithm (str): search algorithm, e.g. "RANDOM_SEARCH".
+        study_spec_measurement_selection_type (str): "BEST_MEASUREMENT" or
+            "LAST_MEASUREMENT", measurement of a trial used to compare trials.
+        early_stopping (str): automated stopping of trials, "MEDIAN" stops a
+            trial worse than the median of the completed trials at the same
+            step, "DECAY_CURVE" when its predicted final objective is worse than
+            the best trial, "" to disable.
+        service_account (str): service account of the trials.
+    """
+
+    import logging
+    import time
+
+    from functools import partial
+    from google.protobuf.json_format import ParseDict, MessageToJson
+    from google.cloud.aiplatform_v1beta1.services.job_service import JobServiceClient
+    from google.cloud.aiplatform_v1beta1.types import HyperparameterTuningJob
+    from google.cloud.aiplatform_v1beta1.types.job_state import JobState
+    from google_cloud_pipeline_components.container.utils import execution_context
+    from google_cloud_pipeline_components.proto.gcp_resources_pb2 import GcpResources
+
+    _POLLING_INTERVAL_IN_SECONDS = 60
+    _JOB_FAILED_STATES = [
+        JobState.JOB_STATE_FAILED,
+        JobState.JOB_STATE_CANCELLED,
+        JobState.JOB_STATE_EXPIRED,
+    ]
+    _STOPPING_SPECS = {
+        "MEDIAN": "medianAutomatedStoppingSpec",
+        "DECAY_CURVE": "decayCurveStoppingSpec",
+    }
+
+    def send_cancel_request(client: JobServiceClient, job_name: str):
+        logging.info("Sending HyperparameterTuningJob cancel request")
+        client.cancel_hyperparameter_tuning_job(name=job_name)
+
+    study_spec = {
+        "metrics": study_spec_metrics,
+        "parameters": study_spec_parameters,
+        "algorithm": study_spec_algorithm,
+        "measurementSelectionType": study_spec_measurement_selection_type,
+    }
+    if early_stopping:
+        if early_stopping not in _STOPPING_SPECS:
+            raise ValueError(
+                f"Unknown early stopping {early_stopping}, "
+                f"expected one of {list(_STOPPING_SPECS)}"
+            )
+        # compare trials by their number of steps, not by their duration
+        study_spec[_STOPPING_SPECS[early_stopping]] = {"useElapsedDuration": False}
+
+    trial_job_spec = {
+        "workerPoolSpecs": worker_pool_specs,
+        "baseOutputDirectory": {"outputUriPrefix": base_output_directory},
+    }
+    if service_account:
+        trial_job_spec["serviceAccount"] = service_account
+
+    message = {
+        "displayName": display_name,
+        "studySpec": study_spec,
+        "maxTrialCount": max_trial_count,
+        "parallelTrialCount": parallel_trial_count,
+        "maxFailedTrialCount": max_failed_trial_count,
+        "trialJobSpec": trial_job_spec,
+    }
+    request = ParseDict(message, HyperparameterTuningJob()._pb)
+
+    logging.info(f"Submitting hyperparameter tuning job: {display_name}")
+    logging.info(request)
+    client = JobServiceClient(
+        client_options={"api_endpoint": f"{location}-aiplatform.googleapis.com"}
+    )
+    response = client.create_hyperparameter_tuning_job(
+        parent=f"projects/{project}/locations/{location}",
+        hyperparameter_tuning_job=request,
+    )
+    logging.info(f"Submitted hyperparameter tuning job: {response.name}")
+
+    # output GCP resource for Vertex AI UI integration
+    job_resources = GcpResources()
+    dr = job_resources.resources.add()
+    dr.resource_type = "HyperparameterTuningJob"
+    dr.resource_uri = f"https://{location}-aiplatform.googleapis.com/v1/{response.name}"
+    with open(gcp_resources, "w") as f:
+        f.write(MessageToJson(job_resources))
+
+    with execution_context.ExecutionContext(
+        on_cancel=partial(send_cancel_request, client, response.name)
+    ):
+        while True:
+            job = client.get_hyperparameter_tuning_job(name=response.name)
+            if job.state == JobState.JOB_STATE_SUCCEEDED:
+                logging.info(f"Job {response.name} completed")
+                break
+            if job.state in _JOB_FAILED_STATES:
+                raise RuntimeError(
+                    f"Job {response.name} failed with error state: {job.state}."
+                )
+            logging.info(f"Job {response.name} is in a non-final state {job.state}.")
+            time.sleep(_POLLING_INTERVAL_IN_SECONDS)
@@ -0,0 +1,60 @@
+from kfp.dsl import Artifact, component, Output
+
+
+@component(
+    base_image="python:3.10.14", packages_to_install=["google-cloud-bigquery==3.24.0"]
+)
+def split_table_op(
+    project: str,
+    location: str,
+    query: str,
+    dataset_id: str,
+    table_prefix: str,
+    train_table: Output[Artifact],
+    valid_table: Output[Artifact],
+    test_table: Output[Artifact],
+) -> None:
+    """
+    Split a BigQuery table into train, validation and test tables in one job.
+
+    The query (see `queries/repeatable_splitting.sql`) assigns each row of the
+    table to a lot in a single scan and writes the `{table_prefix}_train`,
+    `{table_prefix}_valid` and `{table_prefix}_test` tables, each of which only
+    reads the partitions of its lots.
+
+    Args:
+        project (str): project id of the Google Cloud project.
+        location (str): location of the BigQuery dataset.
+        query (str): splitting query (BigQuery script).
+        dataset_id (str): `project.dataset` of the split tables.
+        table_prefix (str): prefix of the names of the split tables.
+        train_table (Artifact): BigQuery table of the training data.
+        valid_table (Artifact): BigQuery table of the validation data.
+        test_table (Artifact): BigQuery table of the test data.
+    """
+
+    import logging
+    import google.cloud.bigquery as bq
+
+    client = bq.client.Client(project=project, location=location)
+    job = client.query(query)
+    job.result()
+    logging.info(
+        f"Split {dataset_id}.{table_prefix}, "
+        f"{job.total_bytes_processed} bytes processed"
+    )
+
+    table_project, table_dataset = dataset_id.split(".")
+    for split, table in [
+        ("train", train_table),
+        ("valid", valid_table),
+        ("test", test_table),
+    ]:
+        table_id = f"{table_prefix}_{split}"
+        table.uri = (
+            f"https://www.googleapis.com/bigquery/v2/projects/{table_project}"
+            f"/datasets/{table_dataset}/tables/{table_id}"
+        )
+        table.metadata["projectId"] = table_project
+        table.metadata["datasetId"] = table_dataset
+        table.metadata["tableId"] = table_id
@@ -23,6 +23,7 @@ def upload_best_model_op(
     serving_container_image: str,
     model_description: str = None,
     evaluation_name: str = "Imported evaluation",
+    optimized_model_tolerance: float = -1.0,
 ) -> None:
     """
     Args:
@@ -42,10 +43,15 @@ def upload_best_model_op(
         model_description (str): Optional. Description of model.
         evaluation_name (str): Optional. Name of evaluation results which are
             displayed in the Vertex AI UI of the challenger model.
+        optimized_model_tolerance (float): Optional. Register the optimized
+            variant of the challenger model written by the trainer instead, if
+            its `eval_metric` is worse by at most this fraction (e.g. 0.01 for
+            1%). Negative to always register the challenger model.
     """
 
     import json
     import logging
+    import os
     import google.cloud.aiplatform as aip
     from google.protobuf.json_format import MessageToDict
     from google.cloud.aiplatform_v1 import ModelEvaluation, ModelServiceClient
@@ -93,15 +99,43 @@ def upload_best_model_op(
 
         return challenger_wins
 
+    def optimized_variant(challenger_metrics: dict) -> tuple:
+        """Optimized variant of the challenger model, if accurate enough."""
+        path = os.path.join(model.path, "optimized_model.json")
+        if optimized_model_tolerance < 0 or not os.path.exists(path):
+            return None, None
+        with open(path, "r") as f:
+            optimized = json.load(f)
+
+        m_model = challenger_metrics[eval_metric]
+        m_optimized = optimized["metrics"][eval_metric]
+        loss = (
+            (m_optimized - m_model) if eval_lower_is_better else (m_model - m_optimized)
+        )
+        relative_loss = loss / abs(m_model) if m_model else loss
+        logging.info(
+            f"Optimized model {eval_metric}={m_optimized} (model={m_model}), "
+            f"latency {optimized.get('latency')}"
+        )
+        if relative_loss > optimized_model_tolerance:
+            logging.info(
+                f"Optimized model loses {relative_loss:.2%} of {eval_metric}, more "
+                f"than the tolerance of {optimized_model_tolerance:.2%}"
+            )
+            return None, None
+
+        logging.info("Registering the optimized model")
+        return f"{model.uri}/{optimized['path']}", optimized["metrics"]
+
     def upload_model_to_registry(
-        is_default_version: bool, parent_model_uri: str = None
+        is_default_version: bool, artifact_uri: str, parent_model_uri: str = None
     ) -> Model:
         """Upload model to registry."""
         logging.info(f"Uploading model {model_name} (default: {is_default_version}")
         uploaded_model = aip.Model.upload(
             display_name=model_name,
             description=model_description,
-            artifact_uri=model.uri,
+            artifact_uri=artifact_uri,
             serving_container_image_uri=serving_container_image,
             parent_model=parent_model_uri,
             is_default_version=is_default_version,
@@ -158,6 +192,12 @@ def upload_best_model_op(
     with open(model_eval_metrics.path, "r") as f:
         challenger_metrics = json.load(f)
 
+    # the registered artifact is compared and evaluated with its own metrics
+    artifact_uri = model.uri
+    optimized_uri, optimized_metrics = optimized_variant(challenger_metrics)
+    if optimized_uri:
+        artifact_uri, challenger_metrics = optimized_uri, optimized_metrics
+
     champion_model = lookup_model(model_name=model_name)
 
     challenger_wins = True
@@ -181,7 +221,7 @@ def upload_best_model_op(
         )
         parent_model_uri = champion_model.resource_name
 
-    model = upload_model_to_registry(challenger_wins, parent_model_uri)
+    model = upload_model_to_registry(challenger_wins, artifact_uri, parent_model_uri)
 
     import_evaluation(
         parsed_metrics=challenger_metrics,
@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import ANY, MagicMock
 from google.cloud.bigquery.job import ExtractJob
 
 import components
@@ -32,8 +32,11 @@ def test_extract_table_to_gcs_op(mocker):
     # Assert interactions with mocked objects
     mock_client.assert_called_once_with(project="test-project", location="US")
     mock_client.return_value.extract_table.assert_called_once_with(
-        mock_bq_table, "gs://test-bucket/test-file"
+        mock_bq_table, "gs://test-bucket/test-file", job_config=ANY
     )
+    job_config = mock_client.return_value.extract_table.call_args.kwargs["job_config"]
+    assert job_config.destination_format == "CSV"
+    assert job_config.compression == "NONE"
     mock_extract_job.result.assert_called_once_with()
 
 
@@ -65,3 +68,60 @@ def test_extract_table_to_gcs_op_handles_errors(mocker):
 
     # Assert that the function re-raised the exception from the extract job
     assert str(exc_info.value) == "Test exception"
+
+
+def test_extract_table_to_gcs_op_sharded(mocker):
+    mock_bq_table = MagicMock()
+    mock_bq_table.metadata = {
+        "projectId": "test-project",
+        "datasetId": "test-dataset",
+        "tableId": "test-table",
+    }
+    mock_dataset = MagicMock()
+    mock_dataset.uri = "gs://test-bucket/test-dir"
+    mock_dataset.metadata = {}
+
+    mock_extract_job = MagicMock(spec=ExtractJob)
+    mock_extract_job.destination_uri_file_counts = [2, 3]
+
+    mock_client = mocker.patch("google.cloud.bigquery.client.Client")
+    mock_client.return_value.get_table.return_value.num_rows = 42
+    mock_table = mocker.patch("google.cloud.bigquery.table.Table")
+    mock_table.return_value = mock_bq_table
+    mock_client.return_value.extract_table.return_value = mock_extract_job
+
+    extract_table_to_gcs_op(
+        mock_bq_table, mock_dataset, "US", "csv", "gzip", num_shards=2
+    )
+
+    destination_uris = [
+        "gs://test-bucket/test-dir/000-*.csv.gz",
+        "gs://test-bucket/test-dir/001-*.csv.gz",
+    ]
+    mock_client.return_value.extract_table.assert_called_once_with(
+        mock_bq_table, destination_uris, job_config=ANY
+    )
+    job_config = mock_client.return_value.extract_table.call_args.kwargs["job_config"]
+    assert job_config.destination_format == "CSV"
+    assert job_config.compression == "GZIP"
+    mock_client.return_value.get_table.assert_called_once_with(
+        "test-project.test-dataset.test-table"
+    )
+    assert mock_dataset.metadata == {
+        "numRows": 42,
+        "format": "CSV",
+        "compression": "GZIP",
+        "shards": [
+            {"uri": destination_uris[0], "fileCount": 2},
+            {"uri": destination_uris[1], "fileCount": 3},
+        ],
+    }
+
+
+def test_extract_table_to_gcs_op_rejects_invalid_compression(mocker):
+    mock_client = mocker.patch("google.cloud.bigquery.client.Client")
+
+    with pytest.raises(ValueError, match="Compression SNAPPY not supported for CSV"):
+        extract_table_to_gcs_op(MagicMock(), MagicMock(), "US", "CSV", "SNAPPY")
+
+    mock_client.return_value.extract_table.assert_not_called()
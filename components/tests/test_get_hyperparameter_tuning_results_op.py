@@ -138,3 +138,38 @@ def test_get_hyperparameter_tuning_results_op_multi_objective(mocker):
         get_hyperparameter_tuning_results_op(
             project, location, job_resource, study_spec_metrics
         )
+
+
+def test_get_hyperparameter_tuning_results_op_skips_unmeasured_trials(mocker):
+    mock_aip = mocker.patch("google.cloud.aiplatform")
+    mock_Parse = mocker.patch("google.protobuf.json_format.Parse")
+
+    mock_job_resource = mocker.Mock()
+    mock_job_resource.trials = [
+        mocker.Mock(
+            final_measurement=mocker.Mock(metrics=[mocker.Mock(value=2)]),
+            parameters=[mocker.Mock(parameter_id="param1", value=2)],
+        ),
+        # failed trial
+        mocker.Mock(
+            final_measurement=mocker.Mock(metrics=[]),
+            parameters=[mocker.Mock(parameter_id="param1", value=3)],
+        ),
+    ]
+    mock_gcp_resources_proto = mocker.Mock()
+    mock_gcp_resources_proto.resources = [
+        mocker.Mock(
+            resource_uri="projects/project1/locations/location1/hyperparameterTuningJobs/job1"  # noqa: E501
+        )
+    ]
+    mock_Parse.return_value = mock_gcp_resources_proto
+    mock_aip.HyperparameterTuningJob.get.return_value.gca_resource = mock_job_resource
+
+    job_resource = '{"resources": [{"resource_uri": "projects/project1/locations/location1/hyperparameterTuningJobs/job1"}]}'  # noqa: E501
+    study_spec_metrics = [{"goal": study.StudySpec.MetricSpec.GoalType.MINIMIZE}]
+
+    result = get_hyperparameter_tuning_results_op(
+        "project1", "location1", job_resource, study_spec_metrics
+    )
+
+    assert result == {"param1": 2}
@@ -1,11 +1,20 @@
+import json
+
 import components
 
 get_training_args_dict_op = components.get_training_args_dict_op.python_func
 
 
 class MockDataset:
-    def __init__(self, path):
+    def __init__(self, path, metadata=None):
         self.path = path
+        self.metadata = metadata or {}
+
+
+class MockModel:
+    def __init__(self, uri, metadata=None):
+        self.uri = uri
+        self.metadata = metadata or {}
 
 
 def test_get_training_args_dict_op():
@@ -25,3 +34,105 @@ def test_get_training_args_dict_op():
         "test_data": "test_data_path",
         "hypertune": True,
     }
+
+
+def test_get_training_args_dict_op_with_row_counts():
+    train_data = MockDataset("train_data_path", {"numRows": 80})
+    valid_data = MockDataset("valid_data_path", {"numRows": 10})
+    test_data = MockDataset("test_data_path", {"numRows": 12})
+
+    result = get_training_args_dict_op(train_data, valid_data, test_data, False)
+
+    assert result == {
+        "train_data": "train_data_path",
+        "valid_data": "valid_data_path",
+        "test_data": "test_data_path",
+        "hypertune": False,
+        "train_rows": 80,
+        "valid_rows": 10,
+    }
+
+
+def test_get_training_args_dict_op_with_warm_start():
+    train_data = MockDataset("train_data_path")
+    valid_data = MockDataset("valid_data_path")
+    test_data = MockDataset("test_data_path")
+    champion_model = MockModel(
+        "gs://bucket/champion/model", {"resourceName": "projects/p/models/1"}
+    )
+
+    result = get_training_args_dict_op(
+        train_data,
+        valid_data,
+        test_data,
+        False,
+        warm_start=True,
+        champion_model=champion_model,
+    )
+
+    assert result["warm_start_model"] == "gs://bucket/champion/model"
+
+
+def test_get_training_args_dict_op_warm_start_without_champion():
+    train_data = MockDataset("train_data_path")
+    valid_data = MockDataset("valid_data_path")
+    test_data = MockDataset("test_data_path")
+    # output artifact of `lookup_model_op` if no model was found
+    champion_model = MockModel("gs://bucket/pipeline-root/lookup-model-op/model")
+
+    result = get_training_args_dict_op(
+        train_data,
+        valid_data,
+        test_data,
+        False,
+        warm_start=True,
+        champion_model=champion_model,
+    )
+
+    assert "warm_start_model" not in result
+
+
+def test_get_training_args_dict_op_with_subsampling():
+    train_data = MockDataset("train_data_path")
+    valid_data = MockDataset("valid_data_path")
+    test_data = MockDataset("test_data_path")
+
+    result = get_training_args_dict_op(
+        train_data,
+        valid_data,
+        test_data,
+        True,
+        epochs=3,
+        subsample_rate=0.25,
+        subsample_schedule=[[0.1, 1], [1.0, 2]],
+    )
+
+    assert json.loads(result["hparams"]) == {
+        "epochs": 3,
+        "subsample_rate": 0.25,
+        "subsample_schedule": [[0.1, 1], [1.0, 2]],
+    }
+
+
+def test_get_training_args_dict_op_with_report_steps():
+    train_data = MockDataset("train_data_path")
+    valid_data = MockDataset("valid_data_path")
+    test_data = MockDataset("test_data_path")
+
+    result = get_training_args_dict_op(
+        train_data, valid_data, test_data, True, report_steps=50
+    )
+
+    assert json.loads(result["hparams"]) == {"hypertune_report_steps": 50}
+
+
+def test_get_training_args_dict_op_with_optimized_model():
+    train_data = MockDataset("train_data_path")
+    valid_data = MockDataset("valid_data_path")
+    test_data = MockDataset("test_data_path")
+
+    result = get_training_args_dict_op(
+        train_data, valid_data, test_data, False, optimized_prune_fraction=0.5
+    )
+
+    assert json.loads(result["hparams"]) == {"optimized_prune_fraction": 0.5}
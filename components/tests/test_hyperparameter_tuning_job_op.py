@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from google.cloud.aiplatform_v1beta1.types import JobState, StudySpec
+
+import components
+
+hyperparameter_tuning_job_op = components.hyperparameter_tuning_job_op.python_func
+
+JOB_NAME = "projects/my-project/locations/us-central1/hyperparameterTuningJobs/123"
+WORKER_POOL_SPECS = [
+    {
+        "machine_spec": {"machine_type": "n1-standard-4"},
+        "replica_count": 1,
+        "container_spec": {"image_uri": "gcr.io/image", "args": ["--hypertune=True"]},
+    }
+]
+METRICS = [{"metric_id": "val_root_mean_squared_error", "goal": 2}]
+PARAMETERS = [
+    {
+        "parameter_id": "learning_rate",
+        "double_value_spec": {"min_value": 0.0001, "max_value": 0.1},
+        "scale_type": 2,
+        "conditional_parameter_specs": [],
+    }
+]
+
+
+@pytest.fixture
+def mock_create_hyperparameter_tuning_job(mock_job_service_client):
+    mock = mock_job_service_client.return_value.create_hyperparameter_tuning_job
+    mock.return_value.name = JOB_NAME
+    return mock
+
+
+@pytest.fixture
+def mock_get_hyperparameter_tuning_job(mock_job_service_client):
+    return mock_job_service_client.return_value.get_hyperparameter_tuning_job
+
+
+def run_op(tmp_path, **kwargs):
+    gcp_resources = str(tmp_path / "gcp_resources.json")
+    hyperparameter_tuning_job_op(
+        gcp_resources=gcp_resources,
+        display_name="hypertune-job",
+        project="my-project",
+        location="us-central1",
+        base_output_directory="gs://bucket/hypertune-job",
+        worker_pool_specs=WORKER_POOL_SPECS,
+        study_spec_metrics=METRICS,
+        study_spec_parameters=PARAMETERS,
+        max_trial_count=6,
+        parallel_trial_count=3,
+        **kwargs,
+    )
+    with open(gcp_resources) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize(
+    "early_stopping, stopping_spec",
+    [
+        ("", None),
+        ("MEDIAN", "median_automated_stopping_spec"),
+        ("DECAY_CURVE", "decay_curve_stopping_spec"),
+    ],
+)
+def test_hyperparameter_tuning_job_op_successful(
+    mock_create_hyperparameter_tuning_job,
+    mock_get_hyperparameter_tuning_job,
+    tmp_path,
+    early_stopping,
+    stopping_spec,
+):
+    mock_get_hyperparameter_tuning_job.return_value.state = JobState.JOB_STATE_SUCCEEDED
+
+    gcp_resources = run_op(
+        tmp_path,
+        study_spec_measurement_selection_type="LAST_MEASUREMENT",
+        early_stopping=early_stopping,
+    )
+
+    resource = gcp_resources["resources"][0]
+    assert resource["resourceType"] == "HyperparameterTuningJob"
+    assert resource["resourceUri"].endswith(JOB_NAME)
+
+    job = mock_create_hyperparameter_tuning_job.call_args.kwargs[
+        "hyperparameter_tuning_job"
+    ]
+    assert job.max_trial_count == 6
+    assert job.parallel_trial_count == 3
+    assert job.study_spec.metrics[0].metric_id == "val_root_mean_squared_error"
+    assert job.study_spec.parameters[0].parameter_id == "learning_rate"
+    assert (
+        job.study_spec.measurement_selection_type
+        == StudySpec.MeasurementSelectionType.LAST_MEASUREMENT
+    )
+    assert job.trial_job_spec.worker_pool_specs[0].container_spec.args == [
+        "--hypertune=True"
+    ]
+    if stopping_spec:
+        assert job.study_spec.WhichOneof("automated_stopping_spec") == stopping_spec
+    else:
+        assert job.study_spec.WhichOneof("automated_stopping_spec") is None
+
+
+def test_hyperparameter_tuning_job_op_failed(
+    mock_create_hyperparameter_tuning_job, mock_get_hyperparameter_tuning_job, tmp_path
+):
+    mock_get_hyperparameter_tuning_job.return_value.state = JobState.JOB_STATE_FAILED
+
+    with pytest.raises(RuntimeError):
+        run_op(tmp_path)
+
+
+def test_hyperparameter_tuning_job_op_unknown_early_stopping(
+    mock_create_hyperparameter_tuning_job, tmp_path
+):
+    with pytest.raises(ValueError):
+        run_op(tmp_path, early_stopping="PATIENCE")
+
+    mock_create_hyperparameter_tuning_job.assert_not_called()
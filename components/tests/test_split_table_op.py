@@ -0,0 +1,65 @@
+import pytest
+from unittest.mock import MagicMock
+
+import components
+
+split_table_op = components.split_table_op.python_func
+
+
+def test_split_table_op(mocker):
+    mock_client = mocker.patch("google.cloud.bigquery.client.Client")
+    tables = dict(
+        train_table=MagicMock(metadata={}),
+        valid_table=MagicMock(metadata={}),
+        test_table=MagicMock(metadata={}),
+    )
+
+    split_table_op(
+        project="test-project",
+        location="US",
+        query="SELECT 1",
+        dataset_id="test-project.test-dataset",
+        table_prefix="test-table",
+        **tables,
+    )
+
+    # the three splits are written by a single query job
+    mock_client.assert_called_once_with(project="test-project", location="US")
+    mock_client.return_value.query.assert_called_once_with("SELECT 1")
+    mock_client.return_value.query.return_value.result.assert_called_once_with()
+
+    for split in ["train", "valid", "test"]:
+        table = tables[f"{split}_table"]
+        assert table.metadata == {
+            "projectId": "test-project",
+            "datasetId": "test-dataset",
+            "tableId": f"test-table_{split}",
+        }
+        assert table.uri.endswith(
+            f"/projects/test-project/datasets/test-dataset/tables/test-table_{split}"
+        )
+
+
+def test_split_table_op_handles_errors(mocker):
+    mock_client = mocker.patch("google.cloud.bigquery.client.Client")
+    mock_client.return_value.query.return_value.result.side_effect = Exception(
+        "Query failed"
+    )
+    tables = dict(
+        train_table=MagicMock(metadata={}),
+        valid_table=MagicMock(metadata={}),
+        test_table=MagicMock(metadata={}),
+    )
+
+    with pytest.raises(Exception) as exc_info:
+        split_table_op(
+            project="test-project",
+            location="US",
+            query="SELECT 1",
+            dataset_id="test-project.test-dataset",
+            table_prefix="test-table",
+            **tables,
+        )
+
+    assert str(exc_info.value) == "Query failed"
+    assert tables["train_table"].metadata == {}
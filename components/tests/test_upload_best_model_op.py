@@ -1,8 +1,10 @@
 import json
 import logging
+
+import pytest
 from kfp.dsl import Dataset, Metrics, Model
 from unittest import mock
-from google.protobuf.json_format import ParseDict
+from google.protobuf.json_format import MessageToDict, ParseDict
 from google.cloud.aiplatform_v1 import ModelEvaluation
 from google_cloud_pipeline_components.types.artifact_types import VertexModel
 
@@ -309,3 +311,73 @@ def test_model_upload_champion_wins(
         parent=mock_model_class.upload.return_value.versioned_resource_name,
         model_evaluation=mock.ANY,
     )
+
+
+@pytest.mark.parametrize(
+    "optimized_rmse, tolerance, expected_uri",
+    [
+        (10.05, 0.01, "optimized"),  # 0.5% worse
+        (10.5, 0.01, None),  # 5% worse
+        (9.0, -1.0, None),  # disabled
+    ],
+)
+def test_model_upload_optimized_variant(
+    mock_model_class,
+    mock_model_service_client,
+    tmp_path,
+    optimized_rmse,
+    tolerance,
+    expected_uri,
+):
+    metrics_file_path = tmp_path / "metrics.json"
+    metrics_file_path.write_text(
+        json.dumps({"problemType": "regression", "rootMeanSquaredError": 10.0})
+    )
+    model_dir = tmp_path / "model"
+    model_dir.mkdir()
+    optimized_metrics = {
+        "problemType": "regression",
+        "rootMeanSquaredError": optimized_rmse,
+    }
+    (model_dir / "optimized_model.json").write_text(
+        json.dumps(
+            {
+                "path": "optimized",
+                "metrics": optimized_metrics,
+                "latency": {"model": {"p50_ms": 2.0}, "optimized": {"p50_ms": 1.0}},
+            }
+        )
+    )
+    mock_model_class.list.return_value = []
+
+    model_evaluation = Metrics(uri="")
+    model_evaluation.path = str(metrics_file_path)
+
+    upload_model(
+        model=Model(uri=str(model_dir)),
+        serving_container_image="dummy_image:latest",
+        vertex_model=VertexModel.create(
+            name="dummy-model-name", uri="chall_uri", model_resource_name="chall"
+        ),
+        project="dummy-project",
+        location="dummy-location",
+        model_eval_metrics=model_evaluation,
+        eval_metric="rootMeanSquaredError",
+        eval_lower_is_better=True,
+        model_name="dummy-model-name",
+        pipeline_job_id="dummy-pipeline-job-id",
+        test_data=Dataset(uri="test-dataset-uri"),
+        optimized_model_tolerance=tolerance,
+    )
+
+    artifact_uri = mock_model_class.upload.call_args.kwargs["artifact_uri"]
+    if expected_uri:
+        assert artifact_uri == f"{model_dir}/{expected_uri}"
+    else:
+        assert artifact_uri == str(model_dir)
+
+    # the imported evaluation is the one of the registered artifact
+    evaluation = mock_model_service_client.return_value.import_model_evaluation
+    imported = MessageToDict(evaluation.call_args.kwargs["model_evaluation"])
+    expected_rmse = optimized_rmse if expected_uri else 10.0
+    assert imported["metrics"]["rootMeanSquaredError"] == pytest.approx(expected_rmse)
@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from trainer import checkpointing
+from trainer.checkpointing import ResumableCheckpoint
+
+# 10 batches per epoch
+STEPS_PER_EPOCH = 10
+
+
+class Interrupt(Exception):
+    pass
+
+
+class InterruptCallback(tf.keras.callbacks.Callback):
+    """Interrupt the training after `steps` steps, records the weights."""
+
+    def __init__(self, steps: int):
+        super().__init__()
+        self.steps = steps
+        self.weights = []
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.weights.append(self.model.get_weights())
+        if len(self.weights) == self.steps:
+            raise Interrupt()
+
+
+def dataset() -> tf.data.Dataset:
+    features = np.arange(4 * STEPS_PER_EPOCH, dtype=np.float32).reshape(-1, 1)
+    return tf.data.Dataset.from_tensor_slices((features, 2 * features)).batch(4)
+
+
+def compiled_model() -> tf.keras.Model:
+    keras_model = tf.keras.Sequential([tf.keras.layers.Dense(1, input_shape=(1,))])
+    keras_model.compile(optimizer="adam", loss="mse")
+    return keras_model
+
+
+def test_interrupt_and_resume(tmp_path):
+    checkpoint_dir = str(tmp_path / "resume")
+    keras_model = compiled_model()
+    resumable = ResumableCheckpoint(keras_model, checkpoint_dir, save_steps=4)
+    interrupt = InterruptCallback(steps=15)
+
+    # the last checkpoint is the one of step 12: epoch 1, 2 batches in
+    with pytest.raises(Interrupt):
+        keras_model.fit(
+            dataset(), epochs=3, verbose=0, callbacks=[resumable, interrupt]
+        )
+    resumable.checkpoint.sync()
+
+    keras_model = compiled_model()
+    resumable = ResumableCheckpoint(keras_model, checkpoint_dir, save_steps=4)
+    assert resumable.restore(STEPS_PER_EPOCH) == (1, 2)
+    for restored, saved in zip(keras_model.get_weights(), interrupt.weights[11]):
+        np.testing.assert_array_equal(restored, saved)
+    assert int(keras_model.optimizer.iterations.numpy()) == 12
+
+    # finish the interrupted epoch, then train the last one
+    keras_model.fit(
+        dataset().take(STEPS_PER_EPOCH - 2),
+        epochs=2,
+        initial_epoch=1,
+        verbose=0,
+        callbacks=[resumable],
+    )
+    keras_model.fit(
+        dataset(), epochs=3, initial_epoch=2, verbose=0, callbacks=[resumable]
+    )
+
+    assert int(resumable.global_step.numpy()) == 3 * STEPS_PER_EPOCH
+    # the checkpoint of the end of the training is written (`on_train_end`)
+    restored = ResumableCheckpoint(compiled_model(), checkpoint_dir, save_steps=4)
+    assert restored.restore(STEPS_PER_EPOCH) == (3, 0)
+    assert int(restored.global_step.numpy()) == 3 * STEPS_PER_EPOCH
+
+
+def test_restore_unknown_steps_per_epoch(tmp_path):
+    checkpoint_dir = str(tmp_path / "resume")
+    keras_model = compiled_model()
+    resumable = ResumableCheckpoint(keras_model, checkpoint_dir, save_steps=4)
+    with pytest.raises(Interrupt):
+        keras_model.fit(
+            dataset(), epochs=3, verbose=0, callbacks=[resumable, InterruptCallback(15)]
+        )
+    resumable.checkpoint.sync()
+
+    # the interrupted epoch is trained again from its beginning
+    resumable = ResumableCheckpoint(compiled_model(), checkpoint_dir, save_steps=4)
+    assert resumable.restore() == (1, 0)
+
+
+def test_restore_not_chief(tmp_path):
+    checkpoint_dir = str(tmp_path / "resume")
+    keras_model = compiled_model()
+    resumable = ResumableCheckpoint(keras_model, checkpoint_dir, save_steps=4)
+    keras_model.fit(dataset(), epochs=1, verbose=0, callbacks=[resumable])
+    checkpoints = sorted(os.listdir(checkpoint_dir))
+
+    # the other workers resume from the checkpoints of the chief
+    worker = ResumableCheckpoint(
+        compiled_model(), checkpoint_dir, save_steps=4, chief=False
+    )
+    assert worker.restore(STEPS_PER_EPOCH) == (1, 0)
+    assert int(worker.global_step.numpy()) == STEPS_PER_EPOCH
+
+    # but do not write to them
+    worker.save()
+    worker.finish()
+    assert sorted(os.listdir(checkpoint_dir)) == checkpoints
+
+
+def test_finish(tmp_path):
+    checkpoint_dir = str(tmp_path / "resume")
+    keras_model = compiled_model()
+    resumable = ResumableCheckpoint(keras_model, checkpoint_dir, save_steps=4)
+    keras_model.fit(dataset(), epochs=1, verbose=0, callbacks=[resumable])
+
+    resumable.finish()
+
+    resumable = ResumableCheckpoint(compiled_model(), checkpoint_dir, save_steps=4)
+    assert resumable.restore(STEPS_PER_EPOCH) == (0, 0)
+
+
+def test_resume_dir(monkeypatch):
+    monkeypatch.setenv("CLOUD_ML_JOB_ID", "123")
+    assert checkpointing.resume_dir("/ckpt") == "/ckpt/resume/123"
+
+    monkeypatch.delenv("CLOUD_ML_JOB_ID")
+    assert checkpointing.resume_dir("/ckpt") == "/ckpt/resume/local"
+
+
+def test_train_again_after_finished_run(tmp_path, monkeypatch):
+    checkpoints_dir = str(tmp_path / "checkpoints")
+    monkeypatch.setenv("CLOUD_ML_JOB_ID", "previous")
+    keras_model = compiled_model()
+    resumable = ResumableCheckpoint(
+        keras_model, checkpointing.resume_dir(checkpoints_dir), save_steps=4
+    )
+    keras_model.fit(dataset(), epochs=2, verbose=0, callbacks=[resumable])
+    # a job interrupted after the training is done, before `finish`
+    resumable.checkpoint.sync()
+
+    # the job of the next pipeline run does not resume the finished training
+    monkeypatch.setenv("CLOUD_ML_JOB_ID", "next")
+    keras_model = compiled_model()
+    resumable = ResumableCheckpoint(
+        keras_model, checkpointing.resume_dir(checkpoints_dir), save_steps=4
+    )
+    initial_epoch, _ = resumable.restore(STEPS_PER_EPOCH)
+    history = keras_model.fit(
+        dataset(), epochs=2, initial_epoch=initial_epoch, verbose=0
+    )
+    assert history.epoch == [0, 1]
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from trainer.evaluation import RegressionMetrics
+
+Y_TRUE = np.array([1.0, 2.0, 0.0, 4.0])
+Y_PRED = np.array([2.0, 2.0, 1.0, 2.0])
+# payment_type of each row: "Cash", "Cash", "Card", "Cash"
+PAYMENT_TYPE = np.array([1, 1, 2, 1])
+
+
+def test_regression_metrics():
+    metrics = RegressionMetrics({})
+    metrics.update(Y_TRUE, Y_PRED, {})
+
+    result = metrics.result()
+
+    # errors 1, 0, 1, -2
+    assert result["problemType"] == "regression"
+    assert result["rootMeanSquaredError"] == pytest.approx(np.sqrt(6 / 4))
+    assert result["meanAbsoluteError"] == pytest.approx(4 / 4)
+    # sum of squares around the mean 1.75: 21 - 7 ** 2 / 4
+    assert result["rSquared"] == pytest.approx(1 - 6 / 8.75)
+    assert result["rootMeanSquaredLogError"] == pytest.approx(
+        np.sqrt(
+            (
+                (np.log(3) - np.log(2)) ** 2
+                + 0.0
+                + (np.log(2) - np.log1p(1e-7)) ** 2
+                + (np.log(3) - np.log(5)) ** 2
+            )
+            / 4
+        )
+    )
+
+
+def test_regression_metrics_zero_label_mape():
+    metrics = RegressionMetrics({})
+    metrics.update(Y_TRUE, Y_PRED, {})
+
+    # the percentage error of the zero label is divided by epsilon (as in Keras)
+    assert metrics.result()["meanAbsolutePercentageError"] == pytest.approx(
+        100 * (1 / 1 + 0 / 2 + 1 / 1e-7 + 2 / 4) / 4
+    )
+
+
+def test_regression_metrics_batches():
+    metrics = RegressionMetrics({"payment_type": ["Cash", "Card"]})
+    for rows in [slice(0, 1), slice(1, 4)]:
+        metrics.update(Y_TRUE[rows], Y_PRED[rows], {"payment_type": PAYMENT_TYPE[rows]})
+    single_batch = RegressionMetrics({"payment_type": ["Cash", "Card"]})
+    single_batch.update(Y_TRUE, Y_PRED, {"payment_type": PAYMENT_TYPE})
+
+    assert metrics.result() == pytest.approx(single_batch.result())
+    assert metrics.sliced_result() == single_batch.sliced_result()
+
+
+def test_regression_metrics_slices():
+    metrics = RegressionMetrics({"payment_type": ["Cash", "Card", "Unknown"]})
+    metrics.update(Y_TRUE, Y_PRED, {"payment_type": PAYMENT_TYPE})
+
+    sliced = metrics.sliced_result()
+
+    # the out of vocabulary and "Unknown" slices are empty, they are not reported
+    assert [s["slice"] for s in sliced] == [
+        {"column": "payment_type", "value": "Cash"},
+        {"column": "payment_type", "value": "Card"},
+    ]
+    cash, card = sliced
+    # Cash: labels 1, 2, 4 and errors 1, 0, -2
+    assert cash["count"] == 3
+    assert cash["rootMeanSquaredError"] == pytest.approx(np.sqrt(5 / 3))
+    assert cash["meanAbsoluteError"] == pytest.approx(3 / 3)
+    assert cash["meanAbsolutePercentageError"] == pytest.approx(
+        100 * (1 / 1 + 0 / 2 + 2 / 4) / 3
+    )
+    assert cash["rSquared"] == pytest.approx(1 - 5 / (21 - 7**2 / 3))
+    # a single row has no variance
+    assert card["count"] == 1
+    assert card["rSquared"] is None
+    assert card["meanAbsoluteError"] == pytest.approx(1.0)
+
+
+def test_regression_metrics_out_of_vocabulary_slice():
+    metrics = RegressionMetrics({"payment_type": ["Cash"]})
+    metrics.update(Y_TRUE, Y_PRED, {"payment_type": np.array([1, 1, 0, 1])})
+
+    sliced = metrics.sliced_result()
+
+    assert [(s["slice"]["value"], s["count"]) for s in sliced] == [
+        ("__OOV__", 1),
+        ("Cash", 3),
+    ]
+
+
+def test_regression_metrics_empty():
+    metrics = RegressionMetrics({"payment_type": ["Cash"]})
+    metrics.update(
+        np.array([]), np.array([]), {"payment_type": np.array([], dtype=np.int64)}
+    )
+
+    assert metrics.sliced_result() == []
+    with pytest.raises(RuntimeError):
+        metrics.result()
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from trainer import export, model, synthetic
+
+
+@pytest.fixture
+def test_data(tmp_path):
+    synthetic.write_shards(str(tmp_path / "test"), 64, "total_fare")
+    return str(tmp_path / "test")
+
+
+@pytest.mark.parametrize("jit_compile", [False, True])
+def test_export_model(tmp_path, test_data, jit_compile):
+    hparams = {
+        **model.DEFAULT_HPARAMS,
+        "jit_compile": jit_compile,
+        "batch_size": 16,
+        "stats_cache": False,
+    }
+    stats = model.get_preprocessing_stats(test_data, "total_fare", hparams)
+    keras_model = model.build_and_compile_model(stats, hparams)
+    train_model, prepare = model.training_model(keras_model, hparams)
+    dataset = model.create_dataset(test_data, "total_fare", hparams)
+    # the optimizers have variables to leave out
+    train_model.fit(prepare(dataset), epochs=1, verbose=0)
+    export_dir = str(tmp_path / "model")
+
+    export.export_model(keras_model, export_dir, dataset, num_warmup=2)
+
+    variables = [
+        name
+        for name, _ in tf.train.list_variables(
+            os.path.join(export_dir, "variables", "variables")
+        )
+    ]
+    assert variables and not any("optimizer" in name for name in variables)
+    # the trained model is still compiled
+    assert train_model.optimizer is not None
+
+    features, _ = next(iter(dataset))
+    serve = tf.saved_model.load(export_dir).signatures[export.SERVING_SIGNATURE]
+    (predictions,) = serve(**features).values()
+    np.testing.assert_allclose(
+        predictions.numpy(), keras_model(features).numpy(), rtol=1e-5
+    )
+    # warm start loads the exported model
+    assert model.warm_start(model.build_and_compile_model(stats, hparams), export_dir)
+    warmup = tf.data.TFRecordDataset(os.path.join(export_dir, export.WARMUP_REQUESTS))
+    assert len(list(warmup)) == 2
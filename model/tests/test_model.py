@@ -0,0 +1,166 @@
+import gzip
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from trainer import model, synthetic
+
+
+@pytest.mark.parametrize("data_format", ["CSV", "PARQUET"])
+def test_create_dataset_drop_remainder(tmp_path, data_format):
+    synthetic.write_shards(
+        str(tmp_path), 250, "total_fare", num_shards=3, data_format=data_format
+    )
+    hparams = {**model.DEFAULT_HPARAMS, "batch_size": 32}
+
+    dataset = model.create_dataset(
+        str(tmp_path), "total_fare", hparams, num_rows=250, drop_remainder=True
+    )
+
+    # batches of a single shape, across the files
+    sizes = [int(label.shape[0]) for _, label in dataset]
+    assert sizes == [32] * (250 // 32)
+    assert int(dataset.cardinality()) == len(sizes)
+
+
+@pytest.mark.parametrize("data_format", ["CSV", "PARQUET"])
+def test_create_dataset_keeps_remainder(tmp_path, data_format):
+    synthetic.write_shards(
+        str(tmp_path), 250, "total_fare", num_shards=3, data_format=data_format
+    )
+    hparams = {**model.DEFAULT_HPARAMS, "batch_size": 32}
+
+    dataset = model.create_dataset(str(tmp_path), "total_fare", hparams, num_rows=250)
+
+    assert sum(int(label.shape[0]) for _, label in dataset) == 250
+
+
+@pytest.fixture
+def stats(tmp_path):
+    synthetic.write_shards(str(tmp_path / "train"), 200, "total_fare")
+    hparams = {**model.DEFAULT_HPARAMS, "stats_cache": False}
+    return model.get_preprocessing_stats(str(tmp_path / "train"), "total_fare", hparams)
+
+
+def test_warm_start(tmp_path, stats):
+    hparams = model.DEFAULT_HPARAMS
+    champion = model.build_and_compile_model(stats, hparams)
+    champion.save(str(tmp_path / "champion"))
+    # the optimized variant of the champion is registered without the full model
+    champion.save(str(tmp_path / "champion" / model.OPTIMIZED_MODEL))
+
+    for path in ["champion", f"champion/{model.OPTIMIZED_MODEL}"]:
+        challenger = model.build_and_compile_model(stats, hparams)
+        assert model.warm_start(challenger, str(tmp_path / path))
+        for weights, champion_weights in zip(
+            challenger.get_weights(), champion.get_weights()
+        ):
+            np.testing.assert_array_equal(weights, champion_weights)
+
+
+def test_warm_start_architecture_mismatch(tmp_path, stats):
+    champion = model.build_and_compile_model(stats, model.DEFAULT_HPARAMS)
+    champion.save(str(tmp_path / "champion"))
+    challenger = model.build_and_compile_model(
+        stats, {**model.DEFAULT_HPARAMS, "hidden_units": [(16, "relu")]}
+    )
+    initial_weights = challenger.get_weights()
+
+    # cold start, the challenger keeps its initial weights
+    assert not model.warm_start(challenger, str(tmp_path / "champion"))
+    assert not model.warm_start(challenger, str(tmp_path / "missing"))
+    for weights, initial in zip(challenger.get_weights(), initial_weights):
+        np.testing.assert_array_equal(weights, initial)
+
+
+@pytest.mark.parametrize(
+    "schedule, max_epochs, stages",
+    [
+        ([], 0, [(1.0, 10)]),
+        ([], 3, [(1.0, 3)]),
+        ([[0.1, 2], [0.5, 2], [1.0, 6]], 0, [(0.1, 2), (0.5, 4), (1.0, 10)]),
+        ([[0.1, 2], [0.5, 2], [1.0, 6]], 3, [(0.1, 2), (0.5, 3)]),
+        ([[0.1, 2], [0.5, 2], [1.0, 6]], 4, [(0.1, 2), (0.5, 4)]),
+        ([[0.1, 2], [1.0, 2]], 20, [(0.1, 2), (1.0, 4)]),
+    ],
+)
+def test_subsample_stages(schedule, max_epochs, stages):
+    hparams = {**model.DEFAULT_HPARAMS, "epochs": 10, "subsample_schedule": schedule}
+
+    assert model.subsample_stages(hparams, max_epochs) == stages
+
+
+def test_monitoring_training_dataset(tmp_path):
+    train_data = str(tmp_path / "train")
+    synthetic.write_shards(train_data, 200, "total_fare", num_shards=2)
+    # cached next to the shards
+    hparams = {**model.DEFAULT_HPARAMS, "stats_cache": True}
+    model.get_preprocessing_stats(train_data, "total_fare", hparams)
+
+    dataset = model.monitoring_training_dataset(train_data, "total_fare")
+
+    assert dataset == {
+        "gcsSource": {"uris": [os.path.join(train_data, "*.csv*")]},
+        "dataFormat": "csv",
+        "targetField": "total_fare",
+    }
+    # the statistics cache is not part of the training data
+    assert len(os.listdir(train_data)) == 3
+    assert tf.io.gfile.glob(dataset["gcsSource"]["uris"][0]) == model.list_files(
+        train_data
+    )
+
+
+def test_monitoring_training_dataset_parquet(tmp_path):
+    synthetic.write_shards(str(tmp_path), 10, "total_fare", data_format="PARQUET")
+
+    assert model.monitoring_training_dataset(str(tmp_path), "total_fare") is None
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        (b"dayofweek,hourofday\n", ("CSV", "")),
+        (gzip.compress(b"dayofweek,hourofday\n"), ("CSV", "GZIP")),
+        (b"PAR1\x15\x04", ("PARQUET", "")),
+    ],
+)
+def test_file_format(tmp_path, content, expected):
+    path = tmp_path / "data"
+    path.write_bytes(content)
+
+    assert model.file_format(str(path)) == expected
+
+
+def test_file_format_unsupported(tmp_path):
+    path = tmp_path / "000-000000000000.avro"
+    path.write_bytes(b"Obj\x01\x04\x14avro.codec")
+
+    with pytest.raises(ValueError, match="unsupported training data format"):
+        model.file_format(str(path))
+
+
+@pytest.mark.parametrize(
+    "compute_capabilities, supported",
+    [([(7, 5)], False), ([(7, 0)], False), ([(8, 0)], True), ([(9, 0), (7, 5)], False)],
+)
+def test_bfloat16_supported_gpu(monkeypatch, compute_capabilities, supported):
+    gpus = [f"GPU:{i}" for i in range(len(compute_capabilities))]
+    details = dict(zip(gpus, compute_capabilities))
+    monkeypatch.setattr(
+        tf.config,
+        "list_physical_devices",
+        lambda device_type=None: gpus if device_type == "GPU" else [],
+    )
+    monkeypatch.setattr(
+        tf.config.experimental,
+        "get_device_details",
+        lambda gpu: {"compute_capability": details[gpu]},
+    )
+
+    assert model.bfloat16_supported() == supported
+    assert model.dtype_policy("mixed_bfloat16") == (
+        "mixed_bfloat16" if supported else None
+    )
@@ -0,0 +1,60 @@
+import json
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from trainer.profiling import StepTimelineCallback
+
+
+class SlowCallback(tf.keras.callbacks.Callback):
+    def on_train_batch_begin(self, batch, logs=None):
+        time.sleep(0.05)
+
+    def on_train_batch_end(self, batch, logs=None):
+        time.sleep(0.05)
+
+
+def test_step_timeline(tmp_path):
+    timeline = StepTimelineCallback()
+    features = np.arange(100, dtype=np.float32).reshape(-1, 1)
+    # batches are prefetched ahead of the steps
+    dataset = timeline.instrument(
+        tf.data.Dataset.from_tensor_slices((features, 2 * features)).batch(8)
+    ).prefetch(4)
+    model = tf.keras.Sequential([tf.keras.layers.Dense(1, input_shape=(1,))])
+    model.compile(optimizer="sgd", loss="mse")
+
+    callbacks = [SlowCallback(), timeline, SlowCallback()]
+    model.fit(dataset, epochs=2, verbose=0, callbacks=callbacks)
+
+    assert [step["step"] for step in timeline.steps] == list(range(13)) * 2
+    assert [step["examples"] for step in timeline.steps] == ([8] * 12 + [4]) * 2
+    assert all(step["input_seconds"] >= 0 for step in timeline.steps)
+    # the time of the other callbacks is not part of the steps
+    assert all(step["seconds"] < 0.05 for step in timeline.steps[1:])
+    summary = timeline.summary()
+    assert summary["steps"] == 26
+    assert summary["unknown_input_steps"] == 0
+    assert summary["examples_per_sec"] > 0
+
+    timeline.save(str(tmp_path / "timeline.json"))
+    with open(tmp_path / "timeline.json") as fh:
+        assert json.load(fh)["summary"] == summary
+
+
+def test_step_timeline_summary_unknown_input():
+    timeline = StepTimelineCallback()
+    timeline.steps = [
+        dict(seconds=1.0, input_seconds=0.5, examples=10),
+        dict(seconds=1.0, input_seconds=0.5, examples=10),
+        dict(seconds=2.0, input_seconds=None, examples=None),
+    ]
+
+    summary = timeline.summary()
+
+    # the throughput and input stall are those of the recorded steps
+    assert summary["unknown_input_steps"] == 1
+    assert summary["seconds"] == 3.0
+    assert summary["input_stall_fraction"] == 0.5
+    assert summary["examples_per_sec"] == 10.0
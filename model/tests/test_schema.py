@@ -0,0 +1,71 @@
+import gzip
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from trainer import model, schema, synthetic
+
+COLUMNS = schema.column_names("total_fare")
+
+
+def write_csv(path, header: list, compression: str = "") -> str:
+    content = (",".join(header) + "\n" + ",".join(["1"] * len(header)) + "\n").encode()
+    if compression == "GZIP":
+        content = gzip.compress(content)
+    path.write_bytes(content)
+    return str(path)
+
+
+@pytest.mark.parametrize("compression", ["", "GZIP"])
+def test_validate_header(tmp_path, compression):
+    path = write_csv(tmp_path / "data.csv", COLUMNS, compression)
+
+    schema.validate_header(path, "total_fare", compression)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        # reordered
+        [COLUMNS[1], COLUMNS[0], *COLUMNS[2:]],
+        # missing column
+        COLUMNS[:-1],
+        [c for c in COLUMNS if c != "company"],
+        # extra column
+        [*COLUMNS, "tips"],
+        # other label
+        [*COLUMNS[:-1], "fare"],
+    ],
+)
+@pytest.mark.parametrize("compression", ["", "GZIP"])
+def test_validate_header_mismatch(tmp_path, header, compression):
+    path = write_csv(tmp_path / "data.csv", header, compression)
+
+    with pytest.raises(ValueError, match="do not match the feature schema"):
+        schema.validate_header(path, "total_fare", compression)
+
+
+def test_validate_columns():
+    schema.validate_columns(COLUMNS, "total_fare", "data.parquet")
+
+    with pytest.raises(ValueError, match="data.parquet"):
+        schema.validate_columns(list(reversed(COLUMNS)), "total_fare", "data.parquet")
+
+
+def test_create_dataset_validates_every_shard(tmp_path):
+    synthetic.write_shards(str(tmp_path), 100, "total_fare", num_shards=2)
+    write_csv(tmp_path / "002.csv", [*COLUMNS, "tips"])
+
+    with pytest.raises(ValueError, match="002.csv"):
+        model.create_dataset(str(tmp_path), "total_fare", model.DEFAULT_HPARAMS)
+
+
+def test_create_dataset_validates_parquet_columns(tmp_path):
+    table = pa.table({name: [1.0] for name in reversed(COLUMNS)})
+    pq.write_table(table, tmp_path / "data.parquet")
+
+    with pytest.raises(ValueError, match="do not match the feature schema"):
+        model.create_dataset(
+            str(tmp_path / "data.parquet"), "total_fare", model.DEFAULT_HPARAMS
+        )
@@ -0,0 +1,144 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+import tensorflow as tf
+
+from trainer import serving
+
+SPECS = {
+    "x": tf.TensorSpec([None], tf.float32, name="x"),
+    "s": tf.TensorSpec([None], tf.string, name="s"),
+}
+
+
+class FakeModel:
+    """Predict twice `x`, records the size of the predicted batches."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, instances: list) -> list:
+        self.batches.append(len(instances))
+        return [2.0 * instance["x"] for instance in instances]
+
+
+def predict_concurrently(batcher, requests: list) -> list:
+    results = [None] * len(requests)
+
+    def predict(i):
+        try:
+            results[i] = batcher.predict(requests[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [
+        threading.Thread(target=predict, args=(i,)) for i in range(len(requests))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+
+def test_micro_batcher_batches_requests(model):
+    # the first request waits long enough for all the others
+    batcher = serving.MicroBatcher(model, max_batch_size=64, max_wait_ms=500)
+    requests = [[{"x": float(i)}] * (1 + i % 3) for i in range(10)]
+    try:
+        results = predict_concurrently(batcher, requests)
+    finally:
+        batcher.close()
+
+    # each request gets its own predictions, in order
+    assert results == [[2.0 * i] * (1 + i % 3) for i in range(10)]
+    assert sum(model.batches) == 19
+    assert len(model.batches) < len(requests)
+    metrics = batcher.metrics()
+    assert (metrics["requests"], metrics["instances"]) == (10, 19)
+
+
+def test_micro_batcher_max_batch_size(model):
+    batcher = serving.MicroBatcher(model, max_batch_size=4, max_wait_ms=500)
+    try:
+        results = predict_concurrently(batcher, [[{"x": 1.0}] * 3] * 4)
+    finally:
+        batcher.close()
+
+    assert results == [[2.0] * 3] * 4
+    # requests are not split, a batch is full once it holds 4 instances or more
+    assert all(size in (3, 6) for size in model.batches)
+
+
+def test_micro_batcher_isolates_failed_requests(model):
+    # without specs, the invalid request reaches the model
+    batcher = serving.MicroBatcher(model, max_batch_size=64, max_wait_ms=500)
+    try:
+        results = predict_concurrently(
+            batcher, [[{"x": 1.0}], [{"y": 1.0}], [{"x": 2.0}, {"x": 3.0}]]
+        )
+    finally:
+        batcher.close()
+
+    assert results[0] == [2.0]
+    assert isinstance(results[1], KeyError)
+    assert results[2] == [4.0, 6.0]
+    assert batcher.metrics()["requests"] == 2
+
+
+@pytest.mark.parametrize(
+    "instances",
+    [
+        [],
+        {"x": 1.0, "s": "a"},
+        [{"x": 1.0}],
+        [{"x": "1", "s": "a"}],
+        [{"x": True, "s": "a"}],
+        [{"x": 1.0, "s": None}],
+        [{"x": 1.0, "s": "a"}, 1],
+    ],
+)
+def test_micro_batcher_validates_requests(model, instances):
+    batcher = serving.MicroBatcher(model, specs=SPECS)
+    try:
+        with pytest.raises(ValueError):
+            batcher.predict(instances)
+        assert batcher.predict([{"x": 1, "s": "a", "extra": 0}]) == [2.0]
+    finally:
+        batcher.close()
+
+    # invalid requests are not predicted
+    assert model.batches == [1]
+
+
+def test_server_invalid_request(model):
+    batcher = serving.MicroBatcher(model, specs=SPECS)
+    server = serving.make_server(batcher, 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_port}/predict"
+
+    def post(body: dict) -> tuple:
+        request = urllib.request.Request(url, data=json.dumps(body).encode())
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    try:
+        valid = post({"instances": [{"x": 1.0, "s": "a"}]})
+        invalid = post({"instances": [{"y": 1.0}]})
+    finally:
+        server.shutdown()
+        batcher.close()
+
+    assert valid == (200, {"predictions": [2.0]})
+    assert invalid[0] == 400
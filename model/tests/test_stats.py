@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from trainer.stats import LocalStatsCache, compute_stats, fingerprint
+
+
+def dataset(values: list, tokens: list, batch_size: int = 3) -> tf.data.Dataset:
+    features = dict(x=np.array(values, dtype=np.float32), s=np.array(tokens))
+    labels = np.zeros(len(values), dtype=np.float32)
+    return tf.data.Dataset.from_tensor_slices((features, labels)).batch(batch_size)
+
+
+def test_compute_stats():
+    values = [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0]
+    tokens = ["b", "a", "b", "c", "a", "b", "d"]
+
+    stats = compute_stats(dataset(values, tokens), ["x"], ["s"])
+
+    assert stats["count"] == 7
+    assert stats["mean"]["x"] == pytest.approx(np.mean(values))
+    assert stats["variance"]["x"] == pytest.approx(np.var(values))
+    # most frequent first, ties in alphabetical order
+    assert stats["vocabulary"] == {"s": ["b", "a", "c", "d"]}
+
+
+def test_compute_stats_does_not_depend_on_batches():
+    values = np.random.default_rng(0).normal(10.0, 3.0, size=100).tolist()
+    tokens = ["a"] * 100
+
+    stats = [
+        compute_stats(dataset(values, tokens, batch_size), ["x"], ["s"])
+        for batch_size in [1, 7, 100]
+    ]
+
+    for other in stats[1:]:
+        assert other["mean"]["x"] == pytest.approx(stats[0]["mean"]["x"])
+        assert other["variance"]["x"] == pytest.approx(stats[0]["variance"]["x"])
+
+
+def test_compute_stats_empty_dataset():
+    with pytest.raises(RuntimeError):
+        compute_stats(dataset([], []), ["x"], ["s"])
+
+
+def test_fingerprint(tmp_path):
+    files = [str(tmp_path / f"{i:03d}.csv") for i in range(2)]
+    for path in files:
+        with open(path, "w") as fh:
+            fh.write("x\n1\n")
+
+    key = fingerprint(files, ["x"])
+
+    assert fingerprint(list(reversed(files)), ["x"]) == key
+    assert fingerprint(files, ["x", "y"]) != key
+    assert fingerprint(files[:1], ["x"]) != key
+
+    # a rewritten shard has a new modification time
+    os.utime(files[0], ns=(0, 0))
+    assert fingerprint(files, ["x"]) != key
+
+
+def test_local_stats_cache(tmp_path):
+    cache = LocalStatsCache(tmp_path / "cache")
+    stats = dict(count=1, mean={"x": 1.0}, variance={"x": 0.0}, vocabulary={})
+
+    assert cache.load("key") is None
+    cache.save("key", stats)
+
+    assert cache.load("key") == stats
+    assert cache.load("other") is None
+    # no temporary file is left behind
+    assert os.listdir(tmp_path / "cache") == ["key.json"]
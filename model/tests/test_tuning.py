@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from trainer import model, synthetic, tuning
+
+
+class FakePool:
+    """Pool which runs the trials in process, the metric of a trial is its
+    learning rate divided by the number of epochs it was trained for."""
+
+    def __init__(self):
+        self.calls = []
+
+    def starmap(self, fn, args):
+        self.calls.append(args)
+        return [
+            parameters["learning-rate"] / epochs for _, parameters, epochs, _, _ in args
+        ]
+
+
+def trials(num_trials: int) -> list:
+    return [
+        dict(id=i, parameters={"learning-rate": i + 1.0}, epochs=0, metric=None)
+        for i in range(num_trials)
+    ]
+
+
+def test_sample_parameters():
+    rng = np.random.default_rng(0)
+
+    samples = [tuning.sample_parameters(tuning.PARAMETER_SPEC, rng) for _ in range(50)]
+
+    assert all(0.0001 <= s["learning-rate"] <= 1.0 for s in samples)
+    assert {s["batch-size"] for s in samples} == {128, 256, 512}
+    assert all(isinstance(s["batch-size"], int) for s in samples)
+
+
+def test_sample_parameters_unsupported_spec():
+    with pytest.raises(ValueError):
+        tuning.sample_parameters([dict(parameter_id="x")], np.random.default_rng(0))
+
+
+def test_share_arrays():
+    arrays = dict(x=np.arange(6, dtype=np.float32), s=np.array([b"a", b"bc"]))
+
+    blocks, descriptors = tuning.share_arrays(arrays)
+    try:
+        attached_blocks, attached = tuning.attach_arrays(descriptors)
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(attached[name], array)
+        del attached
+        for block in attached_blocks:
+            block.close()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def test_successive_halving():
+    pool = FakePool()
+
+    result = tuning.successive_halving(
+        pool, trials(9), 1, 9, 3, "minimize", weights_dir="weights"
+    )
+
+    # 9 trials for 1 epoch, the best 3 up to 3 epochs, the best one up to 9
+    assert [[args[2] for args in call] for call in pool.calls] == [
+        [1] * 9,
+        [3] * 3,
+        [9],
+    ]
+    assert [trial["epochs"] for trial in result] == [9, 3, 3] + [1] * 6
+    assert result[0]["metric"] == 1.0 / 9
+
+
+def test_successive_halving_maximize():
+    result = tuning.successive_halving(
+        FakePool(), trials(9), 1, 9, 3, "maximize", weights_dir="weights"
+    )
+
+    assert [trial["epochs"] for trial in result] == [1] * 6 + [3, 3, 9]
+
+
+def test_successive_halving_last_trial_reaches_max_epochs():
+    pool = FakePool()
+
+    # the rungs are 1 and 3 epochs, the last trial is not trained 9 but 10 epochs
+    result = tuning.successive_halving(
+        pool, trials(9), 1, 10, 3, "minimize", weights_dir="weights"
+    )
+
+    assert [[args[2:4] for args in call] for call in pool.calls][-1] == [(10, 3)]
+    assert max(trial["epochs"] for trial in result) == 10
+
+
+def test_tune(tmp_path):
+    for split, seed in [("train", 0), ("valid", 1)]:
+        synthetic.write_shards(str(tmp_path / split), 200, "total_fare", seed=seed)
+    hparams = {**model.DEFAULT_HPARAMS, "stats_cache": False}
+
+    # one bracket of 3 trials for 1 epoch, the best one is trained up to 4 epochs
+    best_parameters, result = tuning.tune(
+        str(tmp_path / "train"),
+        str(tmp_path / "valid"),
+        hparams,
+        max_epochs=4,
+        brackets=1,
+        workers=1,
+    )
+
+    assert sorted(trial["epochs"] for trial in result) == [1, 1, 4]
+    best_trial = next(trial for trial in result if trial["epochs"] == 4)
+    assert best_parameters == best_trial["parameters"]
+    assert all(np.isfinite(trial["metric"]) for trial in result)
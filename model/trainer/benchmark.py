@@ -0,0 +1,229 @@
+"""Benchmarks of the training input pipeline and training loop in `trainer.model`.
+
+Compare the throughput of the CSV and Parquet input paths, e.g.:
+
+    python -m trainer.benchmark --csv-data=data/csv --parquet-data=data/parquet
+
+or run the whole suite on CPU against synthetic trips (see `trainer.synthetic`)
+before pushing a new training image, e.g.:
+
+    python -m trainer.benchmark --synthetic-rows=200000 --fit-steps=200
+
+Add `--compare-modes` to also time the training steps in each of the
+`PERFORMANCE_MODES` (XLA, mixed precision). Each training benchmark runs in its
+own process, so that its peak memory is not the one of a previous benchmark.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import tensorflow as tf
+
+from trainer import model, synthetic
+
+# hyper-parameters of the performance modes compared by `--compare-modes`
+PERFORMANCE_MODES = {
+    "float32": dict(jit_compile=False, mixed_precision=""),
+    "xla": dict(jit_compile=True, mixed_precision=""),
+    "xla_mixed_bfloat16": dict(jit_compile=True, mixed_precision="mixed_bfloat16"),
+}
+
+
+def benchmark_input_pipeline(
+    input_data: str, label_name: str, model_params: dict, repeats: int = 3
+) -> dict:
+    """Measure how fast one epoch of the input data is read and decoded.
+    Args:
+        input_data (str): path, file pattern or directory of the data file(s)
+        label_name (str): name of the label column
+        model_params (dict): model hyper-parameters
+        repeats (int): number of timed epochs, the best one is reported
+    Returns:
+        results (dict): rows per epoch, best epoch time and rows per second
+    """
+    dataset = model.create_dataset(input_data, label_name, model_params)
+
+    timings = []
+    for _ in range(repeats):
+        rows = 0
+        start = time.perf_counter()
+        for _, label in dataset:
+            rows += int(label.shape[0])
+        timings.append(time.perf_counter() - start)
+
+    seconds = min(timings)
+    return dict(
+        input_data=str(input_data),
+        rows=rows,
+        seconds=seconds,
+        rows_per_sec=rows / seconds,
+    )
+
+
+class StepTimer(tf.keras.callbacks.Callback):
+    """Record the time at which each training batch ends."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.batch_end = []
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.batch_end.append(time.perf_counter())
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process in MiB (Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_in_subprocess(fn, *args):
+    """Run `fn(*args)` in a new process and return its result, e.g. so that the
+    peak RSS measured by `fn` is only its own."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(fn, args)
+
+
+def benchmark_training(
+    input_data: str, label_name: str, model_params: dict, fit_steps: int = 100
+) -> dict:
+    """Measure the setup time and throughput of a fixed number of training steps.
+
+    The preprocessing statistics are always computed (the cache is disabled) so
+    that their cost is part of the setup time.
+    Args:
+        input_data (str): path, file pattern or directory of the data file(s)
+        label_name (str): name of the label column
+        model_params (dict): model hyper-parameters
+        fit_steps (int): number of training steps
+    Returns:
+        results (dict): setup and first step times (seconds), examples per second
+            after the first step and peak RSS of the process so far (MiB), see
+            `run_in_subprocess` to only measure the RSS of this benchmark
+    """
+    model_params = {**model_params, "stats_cache": False}
+
+    start = time.perf_counter()
+    # repeat the data so that the benchmark does not depend on its size
+    dataset = model.create_dataset(
+        input_data, label_name, model_params, num_epochs=None
+    )
+    dataset_seconds = time.perf_counter() - start
+
+    stats = model.get_preprocessing_stats(input_data, label_name, model_params)
+    preprocessing_seconds = time.perf_counter() - start - dataset_seconds
+
+    keras_model = model.build_and_compile_model(stats, model_params)
+    train_model, prepare = model.training_model(keras_model, model_params)
+    setup_seconds = time.perf_counter() - start
+
+    timer = StepTimer()
+    train_model.fit(
+        prepare(dataset),
+        epochs=1,
+        steps_per_epoch=fit_steps,
+        verbose=0,
+        callbacks=[timer],
+    )
+
+    first_step = timer.batch_end[0]
+    steady_seconds = timer.batch_end[-1] - first_step
+    steady_examples = (len(timer.batch_end) - 1) * model_params["batch_size"]
+    return dict(
+        input_data=str(input_data),
+        fit_steps=len(timer.batch_end),
+        create_dataset_seconds=dataset_seconds,
+        preprocessing_seconds=preprocessing_seconds,
+        setup_seconds=setup_seconds,
+        time_to_first_step_seconds=first_step - start,
+        step_ms=(
+            1000 * steady_seconds / (len(timer.batch_end) - 1)
+            if len(timer.batch_end) > 1
+            else None
+        ),
+        examples_per_sec=(
+            steady_examples / steady_seconds if steady_seconds > 0 else None
+        ),
+        peak_rss_mb=peak_rss_mb(),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--csv-data", type=str, default="")
+
+    parser.add_argument("--parquet-data", type=str, default="")
+
+    parser.add_argument("--hparams", default={}, type=json.loads)
+
+    parser.add_argument("--repeats", type=int, default=3)
+
+    # generate CSV and Parquet data instead of reading --csv/parquet-data
+    parser.add_argument("--synthetic-rows", type=int, default=0)
+
+    parser.add_argument("--synthetic-shards", type=int, default=4)
+
+    # number of training steps of the training benchmark, 0 to skip it
+    parser.add_argument("--fit-steps", type=int, default=0)
+
+    parser.add_argument("--compare-modes", action="store_true")
+
+    args = parser.parse_args()
+
+    hparams = {**model.DEFAULT_HPARAMS, "batch_size": 1024, **args.hparams}
+    logging.info(f"Using model hyper-parameters: {hparams}")
+
+    if args.synthetic_rows > 0:
+        data_dir = tempfile.mkdtemp(prefix="synthetic-trips-")
+        for data_format in ["CSV", "PARQUET"]:
+            synthetic.write_shards(
+                os.path.join(data_dir, data_format.lower()),
+                args.synthetic_rows,
+                hparams["label"],
+                num_shards=args.synthetic_shards,
+                data_format=data_format,
+            )
+        args.csv_data = os.path.join(data_dir, "csv")
+        args.parquet_data = os.path.join(data_dir, "parquet")
+
+    results = {}
+    for name, input_data in [("csv", args.csv_data), ("parquet", args.parquet_data)]:
+        if input_data:
+            results[name] = benchmark_input_pipeline(
+                input_data, hparams["label"], hparams, args.repeats
+            )
+            logging.info(f"{name}: {results[name]}")
+            if args.fit_steps > 0:
+                results[name]["training"] = run_in_subprocess(
+                    benchmark_training,
+                    input_data,
+                    hparams["label"],
+                    hparams,
+                    args.fit_steps,
+                )
+                logging.info(f"{name} training: {results[name]['training']}")
+            if args.fit_steps > 0 and args.compare_modes:
+                results[name]["modes"] = {
+                    mode: run_in_subprocess(
+                        benchmark_training,
+                        input_data,
+                        hparams["label"],
+                        {**hparams, **mode_params},
+                        args.fit_steps,
+                    )
+                    for mode, mode_params in PERFORMANCE_MODES.items()
+                }
+
+    if "csv" in results and "parquet" in results:
+        results["parquet_speedup"] = (
+            results["parquet"]["rows_per_sec"] / results["csv"]["rows_per_sec"]
+        )
+
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,142 @@
+"""Step-based checkpoints to resume an interrupted training job."""
+
+import logging
+import os
+import tempfile
+
+import tensorflow as tf
+from tensorflow.keras import Model
+
+# sub-directory of the checkpoints directory with the resumable checkpoints
+RESUME_CHECKPOINTS = "resume"
+
+
+def resume_dir(checkpoints_dir: str) -> str:
+    """Directory of the resumable checkpoints of the current training job.
+
+    The checkpoints directory of the training job is the same for every run of
+    the pipeline, the checkpoints are kept per job (`CLOUD_ML_JOB_ID`, which a
+    restarted job keeps) so that a new job does not resume a previous one.
+    Args:
+        checkpoints_dir (str): checkpoints directory of the training job
+    Returns:
+        directory (str): directory of the resumable checkpoints
+    """
+    return os.path.join(
+        checkpoints_dir, RESUME_CHECKPOINTS, os.environ.get("CLOUD_ML_JOB_ID", "local")
+    )
+
+
+class ResumableCheckpoint(tf.keras.callbacks.Callback):
+    """Save model, optimizer and position in the training data every N steps.
+
+    The position in the training data is the current epoch and the number of
+    batches already trained on in that epoch. With `async_save` the checkpoint
+    files are written in a background thread, so that training steps are not
+    blocked on the (slow) `/gcs/` mount.
+
+    The resumed position is approximate: the batches of an epoch are shuffled
+    again when it is resumed, some examples of the interrupted epoch are seen
+    twice and others not at all.
+
+    In multi-worker training every worker restores from `checkpoint_dir` and
+    saves (variables can be shared across workers) but only the chief saves to
+    `checkpoint_dir`, the other workers to a temporary directory.
+
+    Args:
+        model (Model): compiled model, created in the distribution strategy scope
+        checkpoint_dir (str): directory of the checkpoints
+        save_steps (int): number of training steps between two checkpoints
+        chief (bool): whether the current worker is the chief
+        async_save (bool): write the checkpoints in a background thread
+        max_to_keep (int): number of checkpoints to keep
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        checkpoint_dir: str,
+        save_steps: int,
+        chief: bool = True,
+        async_save: bool = True,
+        max_to_keep: int = 2,
+    ) -> None:
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.chief = chief
+        self.save_steps = save_steps
+        self.epoch = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.step = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.global_step = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.checkpoint = tf.train.Checkpoint(
+            model=model,
+            optimizer=model.optimizer,
+            epoch=self.epoch,
+            step=self.step,
+            global_step=self.global_step,
+        )
+        self.manager = tf.train.CheckpointManager(
+            self.checkpoint,
+            checkpoint_dir if chief else tempfile.mkdtemp(),
+            max_to_keep=max_to_keep,
+        )
+        self.options = tf.train.CheckpointOptions(
+            experimental_enable_async_checkpoint=async_save
+        )
+
+    def restore(self, steps_per_epoch: int = None) -> tuple:
+        """Restore the latest checkpoint, if any.
+        Args:
+            steps_per_epoch (int): number of batches per epoch, if unknown an
+                interrupted epoch is trained again from its beginning
+        Returns:
+            position (tuple): epoch and number of batches trained on in that
+                epoch, `(0, 0)` without checkpoint
+        """
+        # the manager of the other workers writes to a temporary directory
+        latest = tf.train.latest_checkpoint(self.checkpoint_dir)
+        if latest is None:
+            logging.info("No checkpoint to resume from, training from scratch")
+            return 0, 0
+
+        self.checkpoint.restore(latest)
+        if not steps_per_epoch:
+            self.step.assign(0)
+        epoch, step = int(self.epoch.numpy()), int(self.step.numpy())
+        logging.info(f"Resume from {latest} at epoch {epoch}, step {step}")
+        return epoch, step
+
+    def save(self) -> None:
+        path = self.manager.save(
+            checkpoint_number=self.global_step, options=self.options
+        )
+        logging.info(f"Saving checkpoint {path}")
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if epoch != self.epoch.numpy():
+            self.epoch.assign(epoch)
+            self.step.assign(0)
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step.assign_add(1)
+        self.global_step.assign_add(1)
+        if self.global_step.numpy() % self.save_steps == 0:
+            self.save()
+
+    def on_epoch_end(self, epoch, logs=None):
+        # resume at the beginning of the next epoch
+        self.epoch.assign(epoch + 1)
+        self.step.assign(0)
+        self.save()
+
+    def on_train_end(self, logs=None):
+        # wait for the pending asynchronous writes
+        self.checkpoint.sync()
+
+    def finish(self) -> None:
+        """Delete the checkpoints once the training is done, so that a new run
+        of the same job (e.g. local runs) trains again from scratch."""
+        self.checkpoint.sync()
+        if self.chief and tf.io.gfile.exists(self.checkpoint_dir):
+            logging.info(f"Training done, deleting checkpoints {self.checkpoint_dir}")
+            tf.io.gfile.rmtree(self.checkpoint_dir)
@@ -0,0 +1,103 @@
+"""Streaming regression metrics computed in a single pass over predictions."""
+
+import numpy as np
+
+# index of the running sums kept per group of rows
+_COUNT, _SUM_Y, _SUM_Y2, _SSE, _SAE, _SAPE, _SSLE = range(7)
+
+_EPSILON = 1e-7
+
+
+def _row_stats(y_true: np.ndarray, y_pred: np.ndarray) -> np.ndarray:
+    """Per-row terms of all running sums, shape `(rows, 7)`."""
+    y_true = y_true.astype(np.float64).reshape(-1)
+    y_pred = y_pred.astype(np.float64).reshape(-1)
+    error = y_pred - y_true
+    # same clipping as the Keras MAPE / MSLE metrics
+    log_error = np.log1p(np.maximum(y_pred, _EPSILON)) - np.log1p(
+        np.maximum(y_true, _EPSILON)
+    )
+    return np.stack(
+        [
+            np.ones_like(y_true),
+            y_true,
+            y_true**2,
+            error**2,
+            np.abs(error),
+            np.abs(error) / np.maximum(np.abs(y_true), _EPSILON),
+            log_error**2,
+        ],
+        axis=-1,
+    )
+
+
+def _metrics(totals: np.ndarray) -> dict:
+    """Regression metrics (Vertex AI regression metrics schema) from sums."""
+    count = totals[_COUNT]
+    total_variance = totals[_SUM_Y2] - totals[_SUM_Y] ** 2 / count
+    return {
+        "rootMeanSquaredError": float(np.sqrt(totals[_SSE] / count)),
+        "meanAbsoluteError": float(totals[_SAE] / count),
+        "meanAbsolutePercentageError": float(100.0 * totals[_SAPE] / count),
+        "rSquared": (
+            float(1.0 - totals[_SSE] / total_variance) if total_variance > 0 else None
+        ),
+        "rootMeanSquaredLogError": float(np.sqrt(totals[_SSLE] / count)),
+    }
+
+
+class RegressionMetrics:
+    """Accumulate RMSE, MAE, MAPE, R² and RMSLE overall and per slice.
+
+    Only running sums are kept: one row of 7 sums overall and one per slice
+    value, updated with vectorized NumPy operations for each batch of
+    predictions.
+
+    Args:
+        slices (dict): known values of each slice column, `{column: [value]}`.
+            Rows are assigned to slices by index into these lists, index 0 is
+            reserved for values that are not in the list.
+    """
+
+    def __init__(self, slices: dict) -> None:
+        self.slices = {name: list(values) for name, values in slices.items()}
+        self.totals = np.zeros(7, dtype=np.float64)
+        self.sliced_totals = {
+            name: np.zeros((len(values) + 1, 7), dtype=np.float64)
+            for name, values in self.slices.items()
+        }
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray, slice_ids: dict):
+        """Add a batch of labels and predictions.
+        Args:
+            y_true (np.ndarray): labels
+            y_pred (np.ndarray): predictions
+            slice_ids (dict): `{column: np.ndarray}` index of the slice of each
+                row (0 for unknown values, `i + 1` for `slices[column][i]`)
+        """
+        stats = _row_stats(y_true, y_pred)
+        self.totals += stats.sum(axis=0)
+        for name, ids in slice_ids.items():
+            np.add.at(self.sliced_totals[name], np.asarray(ids).reshape(-1), stats)
+
+    def result(self) -> dict:
+        """Metrics over all rows, compatible with `metrics.json`."""
+        if self.totals[_COUNT] == 0:
+            raise RuntimeError("Cannot compute metrics: no predictions")
+        return {"problemType": "regression", **_metrics(self.totals)}
+
+    def sliced_result(self) -> list:
+        """Metrics of every non-empty slice."""
+        results = []
+        for name, totals in self.sliced_totals.items():
+            values = ["__OOV__"] + self.slices[name]
+            for value, slice_totals in zip(values, totals):
+                if slice_totals[_COUNT] > 0:
+                    results.append(
+                        {
+                            "slice": {"column": name, "value": value},
+                            "count": int(slice_totals[_COUNT]),
+                            **_metrics(slice_totals),
+                        }
+                    )
+        return results
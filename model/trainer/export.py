@@ -0,0 +1,110 @@
+"""Export of the trained model for TensorFlow Serving based prediction containers."""
+
+import logging
+import os
+
+import tensorflow as tf
+from tensorflow.data import Dataset
+from tensorflow.keras import Model
+from tensorflow_serving.apis import model_pb2, predict_pb2, prediction_log_pb2
+
+SERVING_SIGNATURE = "serving_default"
+
+# read by TensorFlow Serving when loading the model, see
+# https://www.tensorflow.org/tfx/serving/saved_model_warmup
+WARMUP_REQUESTS = os.path.join("assets.extra", "tf_serving_warmup_requests")
+
+
+def input_signature(model: Model) -> dict:
+    """Batched specs `[None]` of the (scalar) raw feature inputs of `model`."""
+    return {
+        tensor.name: tf.TensorSpec([None], tensor.dtype, name=tensor.name)
+        for tensor in model.inputs
+    }
+
+
+def serving_function(model: Model) -> tf.types.experimental.ConcreteFunction:
+    """Inference only `serving_default` signature of `model`.
+
+    The output is named as in the default signature of Keras, so that the
+    predictions keep their key.
+    """
+
+    @tf.function(input_signature=[input_signature(model)])
+    def serve(features):
+        return {model.output_names[0]: model(features, training=False)}
+
+    return serve.get_concrete_function()
+
+
+def warmup_requests(model: Model, dataset: Dataset, num_requests: int) -> list:
+    """Predict requests of the first batches of `dataset` (e.g. the test data).
+    Args:
+        model (Model): exported model
+        dataset (Dataset): batches of `(features, label)`
+        num_requests (int): number of requests (batches)
+    Returns:
+        requests (list): `PredictionLog` of each request
+    """
+    specs = input_signature(model)
+    logs = []
+    for features, _ in dataset.take(num_requests):
+        request = predict_pb2.PredictRequest(
+            model_spec=model_pb2.ModelSpec(signature_name=SERVING_SIGNATURE)
+        )
+        for name, spec in specs.items():
+            request.inputs[name].CopyFrom(
+                tf.make_tensor_proto(features[name], dtype=spec.dtype)
+            )
+        logs.append(
+            prediction_log_pb2.PredictionLog(
+                predict_log=prediction_log_pb2.PredictLog(request=request)
+            )
+        )
+    return logs
+
+
+def serving_model(model: Model) -> Model:
+    """Copy of `model` without optimizer, with the same weights.
+
+    The sub-models of a model built with `jit_compile` are compiled, and
+    `include_optimizer=False` only leaves out the optimizer of `model` itself.
+    """
+    clone = tf.keras.models.clone_model(model)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+def export_model(
+    model: Model, export_dir: str, warmup_data: Dataset = None, num_warmup: int = 0
+) -> None:
+    """Save `model` as a SavedModel for serving.
+
+    The `serving_default` signature takes batches of raw features, so that the
+    prediction containers do not trace the Keras call functions, and the
+    optimizer state is not saved. With `warmup_data` the first batches are
+    written as warm-up requests, which TensorFlow Serving runs before serving
+    the model, so that new replicas do not answer the first requests slowly.
+    Args:
+        model (Model): trained model
+        export_dir (str): SavedModel directory
+        warmup_data (Dataset): batches of `(features, label)`
+        num_warmup (int): number of warm-up requests, 0 to not write any
+    """
+    model = serving_model(model)
+    model.save(
+        export_dir,
+        save_format="tf",
+        include_optimizer=False,
+        signatures={SERVING_SIGNATURE: serving_function(model)},
+    )
+
+    if warmup_data is None or num_warmup <= 0:
+        return
+    path = os.path.join(export_dir, WARMUP_REQUESTS)
+    tf.io.gfile.makedirs(os.path.dirname(path))
+    logs = warmup_requests(model, warmup_data, num_warmup)
+    with tf.io.TFRecordWriter(path) as writer:
+        for log in logs:
+            writer.write(log.SerializeToString())
+    logging.info(f"Saved {len(logs)} warm-up requests to {path}")
@@ -4,35 +4,99 @@ import os
 import json
 import logging
 import sys
+import zlib
 
+import numpy as np
+import pyarrow.parquet as pq
 import tensorflow as tf
 from pathlib import Path
 from tensorflow.data import Dataset
 from tensorflow.keras import Input, Model, optimizers
 from tensorflow.keras.layers import Dense, Normalization, StringLookup, Concatenate
 
-# numeric/categorical features in Chicago trips dataset to be preprocessed
 import hypertune
 
+from trainer import schema
+from trainer.checkpointing import ResumableCheckpoint, resume_dir
+from trainer.evaluation import RegressionMetrics
+from trainer.export import export_model
+from trainer.optimization import copy_pruned_weights, hidden_units
+from trainer.optimization import prune_hidden_units, serving_latency
+from trainer.profiling import StepTimelineCallback
+from trainer.schema import NUM_COLS, ORD_COLS, OHE_COLS, SLICE_COLS
+from trainer.stats import STATS_CACHE_DIR, LocalStatsCache, compute_stats, fingerprint
+
+# `RegressionMetrics` estimate of the Keras validation metrics
+ESTIMATED_METRICS = {
+    "val_root_mean_squared_error": "rootMeanSquaredError",
+    "val_mean_absolute_error": "meanAbsoluteError",
+    "val_mean_absolute_percentage_error": "meanAbsolutePercentageError",
+}
+
 
 class HyperTuneCallback(tf.keras.callbacks.Callback):
-    def __init__(self, metric=None) -> None:
+    """Report the hypertune metric after each epoch and every N training steps.
+
+    The reports in between epochs are estimated on a fixed (cached) subsample
+    of the validation data, so that automated early stopping of the tuning job
+    can compare and stop trials before their first epoch ends. Predictions are
+    made with `predict_on_batch`, `model.evaluate` would reset the training
+    metrics of the current epoch.
+
+    Args:
+        metric (str): name of the reported validation metric
+        validation_data (Dataset): batches of the validation subsample
+        report_steps (int): number of training steps between two estimates, 0
+            to only report after each epoch
+        global_step (int): number of training steps already done (when resumed)
+    """
+
+    def __init__(
+        self, metric=None, validation_data=None, report_steps=0, global_step=0
+    ) -> None:
         super().__init__()
         self.metric = metric
+        self.validation_data = validation_data
+        self.report_steps = report_steps if metric in ESTIMATED_METRICS else 0
+        self.global_step = global_step
         self.hpt = hypertune.HyperTune()
 
+    def estimate(self) -> float:
+        metrics = RegressionMetrics({})
+        for features, label in self.validation_data:
+            metrics.update(label.numpy(), self.model.predict_on_batch(features), {})
+        return metrics.result()[ESTIMATED_METRICS[self.metric]]
+
+    def report(self, value, global_step):
+        self.hpt.report_hyperparameter_tuning_metric(
+            hyperparameter_metric_tag=self.metric,
+            metric_value=value,
+            global_step=global_step,
+        )
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.global_step += 1
+        if self.report_steps and self.global_step % self.report_steps == 0:
+            value = self.estimate()
+            logging.info(f"Step {self.global_step}: estimated {self.metric} {value}")
+            self.report(value, self.global_step)
+
     def on_epoch_end(self, epoch, logs=None):
         if logs and self.metric in logs:
-            self.hpt.report_hyperparameter_tuning_metric(
-                hyperparameter_metric_tag=self.metric,
-                metric_value=logs[self.metric],
-                global_step=epoch,
-            )
+            # steps of the estimates and of the epochs must be comparable
+            step = self.global_step if self.report_steps else epoch
+            self.report(logs[self.metric], step)
 
 
 # used for monitoring during prediction time
 TRAINING_DATASET_INFO = "training_dataset.json"
 
+# evaluation metrics of the model on the test data, sliced by `SLICE_COLS`
+SLICED_METRICS = "sliced_metrics.json"
+
+# per-step training timeline, written next to the metrics if `profile` is enabled
+TRAINING_TIMELINE = "training_timeline.json"
+
 DEFAULT_HPARAMS = dict(
     batch_size=100,
     epochs=10,
@@ -43,50 +107,461 @@ DEFAULT_HPARAMS = dict(
     early_stopping_epochs=5,
     label="total_fare",
     distribute_strategy="single",
+    stats_cache=True,
+    # input pipeline, -1 lets tf.data tune the value (tf.data.AUTOTUNE)
+    shuffle_files=True,
+    shuffle_buffer_size=10000,
+    interleave_cycle_length=-1,
+    num_parallel_calls=-1,
+    prefetch_buffer_size=-1,
+    deterministic=False,
+    parquet_read_batch_size=8192,
+    # record the training timeline, optionally trace `[first, last]` steps with
+    # the TensorBoard profiler
+    profile=False,
+    profile_steps=[],
+    # checkpoint every N training steps to resume an interrupted job, 0 to only
+    # save the weights at the end of each epoch
+    checkpoint_steps=0,
+    # number of epochs when initialized from `warm_start_model`, 0 to train for
+    # `epochs` as with a cold start
+    warm_start_epochs=3,
+    # performance mode: XLA compiled training step and Keras dtype policy of the
+    # hidden layers (e.g. "mixed_bfloat16"), "" keeps float32
+    jit_compile=False,
+    mixed_precision="",
+    # fraction of the training rows used in each epoch, or `[[rate, epochs]]`
+    # stages training on growing fractions (replaces `subsample_rate` and
+    # `epochs`), for cheaper low fidelity hypertune trials
+    subsample_rate=1.0,
+    subsample_schedule=[],
+    # hypertune trials report an estimate of the metric on the first N batches
+    # of the validation data every N training steps, 0 to only report the
+    # validation metric after each epoch
+    hypertune_report_steps=0,
+    hypertune_report_batches=10,
+    # number of batches of the test data saved as TensorFlow Serving warm-up
+    # requests with the model, 0 to not save any
+    serving_warmup_requests=10,
+    # fraction of the hidden units removed (structured pruning) in an optimized
+    # variant of the model for CPU serving, fine-tuned for N epochs, 0 to not
+    # create the variant
+    optimized_prune_fraction=0.0,
+    optimized_finetune_epochs=1,
 )
 
+# resolution of the subsampling of CSV lines by hash
+SUBSAMPLE_BUCKETS = 1_000_000
+
+# optimized variant of the model (sub-directory of the model directory) and its
+# evaluation, read by `upload_best_model_op`
+OPTIMIZED_MODEL = "optimized"
+OPTIMIZED_MODEL_INFO = "optimized_model.json"
+
+# names of the sub-models of a model built with `jit_compile`
+PREPROCESSING_MODEL = "preprocessing"
+DENSE_MODEL = "dense"
+
 logging.getLogger().setLevel(logging.INFO)
 
 
-def create_dataset(input_data: str, label_name: str, model_params: dict) -> Dataset:
-    logging.info(f"Creating dataset from CSV file(s) at {input_data}...")
-    created_dataset = tf.data.experimental.make_csv_dataset(
-        file_pattern=str(input_data),
-        batch_size=model_params["batch_size"],
-        label_name=label_name,
-        num_epochs=model_params["epochs"],
-        shuffle=True,
-        shuffle_buffer_size=1000,
-        num_rows_for_inference=20000,
+def list_files(input_data: str) -> list:
+    """List the data files of a (possibly sharded) dataset.
+    Args:
+        input_data (str): path of a file, a file pattern or a directory of shards
+            written by `extract_table_to_gcs_op`
+    Returns:
+        files (list): sorted paths of the data files
+    """
+    pattern = str(input_data)
+    if tf.io.gfile.isdir(pattern):
+        pattern = os.path.join(pattern, "*")
+    # skip side files like the preprocessing statistics cache
+    files = [
+        path
+        for path in tf.io.gfile.glob(pattern)
+        if not os.path.basename(path).startswith(("_", "."))
+        and not tf.io.gfile.isdir(path)
+    ]
+    if not files:
+        raise ValueError(f"No files found matching {input_data}")
+    return sorted(files)
+
+
+def file_format(path: str) -> tuple:
+    """Detect the format of a data file from its magic bytes.
+    Args:
+        path (str): path of the data file
+    Returns:
+        (format, compression) (tuple): ("PARQUET", ""), ("CSV", "GZIP") or
+            ("CSV", "")
+    Raises:
+        ValueError: if the file is neither Parquet nor (gzipped) CSV, e.g. AVRO
+    """
+    with tf.io.gfile.GFile(path, "rb") as fh:
+        magic = fh.read(4)
+    if magic == b"PAR1":
+        return "PARQUET", ""
+    if magic[:2] == b"\x1f\x8b":
+        return "CSV", "GZIP"
+    # the header of a CSV file is text
+    if all(32 <= byte < 127 or byte in b"\t\r\n" for byte in magic):
+        return "CSV", ""
+    raise ValueError(
+        f"unsupported training data format of {path} (starts with {magic!r}), "
+        "expected CSV or Parquet"
+    )
+
+
+def build_input_pipeline(
+    files: list,
+    read_fn,
+    decode_fn,
+    model_params: dict,
+    batched: bool = False,
+    num_epochs: int = 1,
+    num_batches: int = 0,
+    drop_remainder: bool = False,
+) -> Dataset:
+    """Build a parallel input pipeline over file shards.
+
+    Shards are shuffled at file level and read with a parallel interleave,
+    records are shuffled with a configurable buffer, then batches of records
+    are decoded with a parallel map and prefetched. All knobs are read from
+    `model_params` so they can be tuned per machine type via `--hparams`.
+    Args:
+        files (list): paths of the input file(s)
+        read_fn (Callable): maps a file path to a dataset of single records
+            (or of batches of records if `batched`)
+        decode_fn (Callable): maps a batch of records to a `(features, label)`
+            tuple
+        model_params (dict): model hyper-parameters
+        batched (bool): whether `read_fn` already yields batches of
+            `batch_size` records; the shuffle buffer then holds whole batches
+        num_epochs (int): number of passes over the data, None repeats forever
+        num_batches (int): number of batches per pass if known, which makes
+            the cardinality of the dataset known (and asserted)
+        drop_remainder (bool): only yield batches of exactly `batch_size`
+            records, the last records of each pass are dropped
+    Returns:
+        dataset (Dataset): batched dataset of `(features, label)` tuples
+    """
+    dataset = Dataset.from_tensor_slices(files)
+    if model_params["shuffle_files"]:
+        dataset = dataset.shuffle(len(files), reshuffle_each_iteration=True)
+
+    dataset = dataset.interleave(
+        read_fn,
+        cycle_length=model_params["interleave_cycle_length"],
+        num_parallel_calls=model_params["num_parallel_calls"],
+        deterministic=model_params["deterministic"],
+    )
+    buffer_size = model_params["shuffle_buffer_size"]
+    if batched:
+        buffer_size = -(-buffer_size // model_params["batch_size"])
+    if buffer_size:
+        dataset = dataset.shuffle(buffer_size=buffer_size)
+
+    if batched and drop_remainder:
+        # the batches of each file end with a smaller one
+        dataset = dataset.unbatch().batch(
+            model_params["batch_size"], drop_remainder=True
+        )
+    dataset = dataset.repeat(num_epochs)
+    if not batched:
+        dataset = dataset.batch(
+            model_params["batch_size"], drop_remainder=drop_remainder
+        )
+    if num_batches and num_epochs:
+        dataset = dataset.apply(
+            tf.data.experimental.assert_cardinality(num_batches * num_epochs)
+        )
+
+    return dataset.map(
+        decode_fn,
+        num_parallel_calls=model_params["num_parallel_calls"],
+        deterministic=model_params["deterministic"],
+    ).prefetch(model_params["prefetch_buffer_size"])
+
+
+def read_parquet(
+    path: bytes,
+    columns: list,
+    batch_size: int,
+    read_batch_size: int,
+    shuffle: bool,
+    subsample_rate: float = 1.0,
+):
+    """Yield batches of a Parquet file as tuples of NumPy column arrays.
+
+    Record batches are read with Arrow; numeric columns without nulls are
+    exposed without copying the Arrow buffers unless rows are shuffled. Rows
+    are shuffled within each record batch and re-chunked to `batch_size` rows,
+    so that tf.data never has to handle single rows. Arguments are passed as
+    NumPy values by `Dataset.from_generator`.
+
+    Rows are subsampled with random numbers seeded by the file path, so the
+    same rows are kept in every epoch and the rows kept at a lower rate are a
+    subset of the rows kept at a higher rate.
+    """
+    parquet_file = pq.ParquetFile(path.decode("utf-8"))
+    columns = [name.decode("utf-8") for name in columns]
+    rng = np.random.default_rng()
+    subsample_rng = np.random.default_rng(zlib.crc32(path))
+
+    leftover = None
+    for record_batch in parquet_file.iter_batches(
+        batch_size=read_batch_size, columns=columns
+    ):
+        arrays = [c.to_numpy(zero_copy_only=False) for c in record_batch.columns]
+        if subsample_rate < 1.0:
+            keep = subsample_rng.random(record_batch.num_rows) < subsample_rate
+            arrays = [array[keep] for array in arrays]
+        if shuffle:
+            order = rng.permutation(len(arrays[0]))
+            arrays = [array[order] for array in arrays]
+        if leftover is not None:
+            arrays = [np.concatenate(pair) for pair in zip(leftover, arrays)]
+
+        num_rows = len(arrays[0])
+        end = num_rows - num_rows % batch_size
+        for start in range(0, end, batch_size):
+            yield tuple(array[start : start + batch_size] for array in arrays)
+        leftover = [array[end:] for array in arrays] if end < num_rows else None
+
+    if leftover is not None:
+        yield tuple(leftover)
+
+
+def create_parquet_dataset(
+    files: list,
+    label_name: str,
+    model_params: dict,
+    num_epochs: int = 1,
+    subsample_rate: float = 1.0,
+    drop_remainder: bool = False,
+) -> Dataset:
+    """Create a batched `(features, label)` dataset from Parquet file(s).
+
+    Record batches are read with Arrow and handed to tf.data as whole columns,
+    so there is no per-row text parsing and no per-row tf.data overhead.
+    Numeric columns are cast to the types declared in `trainer.schema` one
+    batch at a time. The number of batches is known from the file footers.
+    Args:
+        files (list): paths of the Parquet file(s)
+        label_name (str): name of the label column
+        model_params (dict): model hyper-parameters
+        num_epochs (int): number of passes over the data, None repeats forever
+        subsample_rate (float): fraction of the rows to read, see `read_parquet`
+        drop_remainder (bool): re-batch the rows of all files to batches of
+            exactly `batch_size` rows, see `build_input_pipeline`
+    Returns:
+        dataset (Dataset): batched dataset of `(features, label)` tuples
+    """
+    columns = schema.column_names(label_name)
+    batch_size = model_params["batch_size"]
+    num_batches = num_rows = 0
+    for path in files:
+        metadata = pq.read_metadata(path)
+        schema.validate_columns(metadata.schema.names, label_name, path)
+        # batches do not span files, see `read_parquet`
+        num_batches += -(-metadata.num_rows // batch_size)
+        num_rows += metadata.num_rows
+    if drop_remainder:
+        num_batches = num_rows // batch_size
+
+    dtypes = list(schema.FEATURE_SCHEMA.values()) + [schema.LABEL_DTYPE]
+    # BigQuery exports FLOAT64 columns, which are cast to float32 after reading
+    signature = tuple(
+        tf.TensorSpec(shape=(None,), dtype=tf.float64 if d.is_floating else d)
+        for d in dtypes
+    )
+
+    def read(path):
+        return Dataset.from_generator(
+            read_parquet,
+            args=(
+                path,
+                columns,
+                model_params["batch_size"],
+                model_params["parquet_read_batch_size"],
+                bool(model_params["shuffle_buffer_size"]),
+                subsample_rate,
+            ),
+            output_signature=signature,
+        )
+
+    def decode(*values):
+        values = [tf.cast(v, dtype) for v, dtype in zip(values, dtypes)]
+        features = dict(zip(columns, values))
+        label = features.pop(label_name)
+        return features, label
+
+    return build_input_pipeline(
+        files,
+        read,
+        decode,
+        model_params,
+        batched=True,
+        num_epochs=num_epochs,
+        # the number of subsampled rows is not known in advance
+        num_batches=num_batches if subsample_rate >= 1.0 else 0,
+        drop_remainder=drop_remainder,
+    )
+
+
+def create_dataset(
+    input_data: str,
+    label_name: str,
+    model_params: dict,
+    num_epochs: int = 1,
+    num_rows: int = 0,
+    subsample_rate: float = 1.0,
+    drop_remainder: bool = False,
+) -> Dataset:
+    """Create a batched `(features, label)` dataset from CSV or Parquet file(s).
+
+    Columns are decoded with the types declared in `trainer.schema`, so no
+    rows have to be read for type inference. Each batch of CSV lines is decoded
+    with a single vectorized `tf.io.decode_csv` call. Sharded and GZIP
+    compressed exports of `extract_table_to_gcs_op` are supported, Parquet
+    exports are read through `create_parquet_dataset`.
+    Args:
+        input_data (str): path, file pattern or directory of the data file(s)
+        label_name (str): name of the label column
+        model_params (dict): model hyper-parameters
+        num_epochs (int): number of passes over the data, None repeats forever
+        num_rows (int): number of rows of CSV data as recorded by
+            `extract_table_to_gcs_op`, 0 if unknown. Makes the number of
+            batches of the dataset known.
+        subsample_rate (float): fraction of the rows to read. Rows are kept
+            based on a hash of their content (of their position in the file
+            for Parquet), so that the same rows are read in every epoch.
+        drop_remainder (bool): only yield batches of exactly `batch_size` rows,
+            e.g. to train an XLA compiled model (`jit_compile`) which is
+            compiled again for every new batch shape
+    Returns:
+        dataset (Dataset): batched dataset of `(features, label)` tuples
+    """
+    files = list_files(input_data)
+    data_format, compression = file_format(files[0])
+    logging.info(f"Creating dataset from {data_format} file(s) at {input_data}...")
+    if data_format == "PARQUET":
+        return create_parquet_dataset(
+            files, label_name, model_params, num_epochs, subsample_rate, drop_remainder
+        )
+
+    for path in files:
+        schema.validate_header(path, label_name, compression)
+
+    columns = schema.column_names(label_name)
+    defaults = schema.record_defaults(label_name)
+    batch_size = model_params["batch_size"]
+
+    def decode(lines):
+        values = tf.io.decode_csv(lines, record_defaults=defaults)
+        features = dict(zip(columns, values))
+        label = features.pop(label_name)
+        return features, label
+
+    def keep(line):
+        bucket = tf.strings.to_hash_bucket_fast(line, SUBSAMPLE_BUCKETS)
+        return bucket < int(subsample_rate * SUBSAMPLE_BUCKETS)
+
+    def read(path):
+        lines = tf.data.TextLineDataset(path, compression).skip(1)
+        return lines.filter(keep) if subsample_rate < 1.0 else lines
+
+    return build_input_pipeline(
+        files,
+        read,
+        decode,
+        model_params,
+        num_epochs=num_epochs,
+        num_batches=(
+            (num_rows // batch_size if drop_remainder else -(-num_rows // batch_size))
+            if subsample_rate >= 1.0
+            else 0
+        ),
+        drop_remainder=drop_remainder,
     )
-    return created_dataset
 
 
-def normalization(name: str, dataset: Dataset) -> Normalization:
+def num_steps(dataset: Dataset) -> int:
+    """Number of batches of a dataset, None if unknown or infinite."""
+    cardinality = int(dataset.cardinality())
+    return cardinality if cardinality > 0 else None
+
+
+def preprocessing_stats(dataset: Dataset) -> dict:
+    """Compute the statistics of all preprocessing layers in a single pass.
+    Args:
+        dataset (Dataset): training dataset, iterated exactly once
+    Returns:
+        stats (dict): see `trainer.stats.compute_stats`
+    """
+    return compute_stats(dataset, NUM_COLS, ORD_COLS + OHE_COLS)
+
+
+def get_preprocessing_stats(
+    input_data: str, label_name: str, model_params: dict
+) -> dict:
+    """Load the preprocessing statistics of the input data or compute them.
+
+    If `stats_cache` is enabled, the statistics are persisted next to the input
+    data keyed by a fingerprint of the metadata of the input file(s), so that all
+    hypertune trials and the final training job only compute them once.
+    Args:
+        input_data (str): file pattern of the training data
+        label_name (str): name of the label column
+        model_params (dict): model hyper-parameters
+    Returns:
+        stats (dict): see `trainer.stats.compute_stats`
+    """
+    cache = None
+    if model_params["stats_cache"]:
+        files = list_files(input_data)
+        key = fingerprint(files, NUM_COLS + ORD_COLS + OHE_COLS)
+        cache = LocalStatsCache(
+            os.path.join(os.path.dirname(files[0]), STATS_CACHE_DIR)
+        )
+        stats = cache.load(key)
+        if stats is not None:
+            return stats
+
+    # one pass over a single epoch of the data for all preprocessing layers
+    dataset = create_dataset(input_data, label_name, model_params)
+    stats = preprocessing_stats(dataset)
+
+    if cache is not None:
+        cache.save(key, stats)
+    return stats
+
+
+def normalization(name: str, stats: dict) -> Normalization:
     logging.info(f"Normalizing numerical input '{name}'...")
-    normalizer = Normalization(axis=None, name=f"normalize_{name}")
-    normalizer.adapt(dataset.map(lambda x, _: x[name]))
+    normalizer = Normalization(
+        axis=None,
+        mean=stats["mean"][name],
+        variance=stats["variance"][name],
+        name=f"normalize_{name}",
+    )
     return normalizer
 
 
-def str_lookup(name: str, dataset: Dataset, output_mode: str) -> StringLookup:
+def str_lookup(name: str, stats: dict, output_mode: str) -> StringLookup:
     logging.info(f"Encoding categorical input '{name}' ({output_mode})...")
     index = StringLookup(
-        output_mode=output_mode, name=f"str_lookup_{output_mode}_{name}"
+        vocabulary=stats["vocabulary"][name],
+        output_mode=output_mode,
+        name=f"str_lookup_{output_mode}_{name}",
     )
-    index.adapt(dataset.map(lambda x, _: x[name]))
     logging.info(f"Vocabulary: {index.get_vocabulary()}")
     return index
 
 
-def transform(dataset):
+def transform(stats: dict):
     # create inputs (scalars with shape `()`)
-    NUM_COLS = ["dayofweek", "hourofday", "trip_distance", "trip_miles", "trip_seconds"]
-
-    ORD_COLS = ["company"]
-
-    OHE_COLS = ["payment_type"]
-
     num_ins = {name: Input(shape=(), name=name, dtype=tf.float32) for name in NUM_COLS}
     ord_ins = {name: Input(shape=(), name=name, dtype=tf.string) for name in ORD_COLS}
     cat_ins = {name: Input(shape=(), name=name, dtype=tf.string) for name in OHE_COLS}
@@ -95,9 +570,9 @@ def transform(dataset):
     exp_ins = {n: tf.expand_dims(i, axis=-1) for n, i in all_ins.items()}
 
     # preprocess expanded inputs
-    num_encoded = [normalization(n, dataset)(exp_ins[n]) for n in NUM_COLS]
-    ord_encoded = [str_lookup(n, dataset, "int")(exp_ins[n]) for n in ORD_COLS]
-    ohe_encoded = [str_lookup(n, dataset, "one_hot")(exp_ins[n]) for n in OHE_COLS]
+    num_encoded = [normalization(n, stats)(exp_ins[n]) for n in NUM_COLS]
+    ord_encoded = [str_lookup(n, stats, "int")(exp_ins[n]) for n in ORD_COLS]
+    ohe_encoded = [str_lookup(n, stats, "one_hot")(exp_ins[n]) for n in OHE_COLS]
 
     # ensure ordinal encoded layers is of type float32 (like the other layers)
     ord_encoded = [tf.cast(x, tf.float32) for x in ord_encoded]
@@ -108,19 +583,79 @@ def transform(dataset):
     return x, all_ins
 
 
-def build_and_compile_model(dataset: Dataset, model_params: dict) -> Model:
-    x, all_ins = transform(dataset)
+def bfloat16_supported() -> bool:
+    """Whether bfloat16 runs natively: on TPUs, GPUs from Ampere (compute
+    capability 8.0) on or CPUs with AVX512/AMX BF16."""
+    if tf.config.list_physical_devices("TPU"):
+        return True
+    gpus = tf.config.list_physical_devices("GPU")
+    if gpus:
+        # e.g. T4 or V100 GPUs emulate bfloat16
+        return all(
+            tf.config.experimental.get_device_details(gpu).get(
+                "compute_capability", (0, 0)
+            )
+            >= (8, 0)
+            for gpu in gpus
+        )
+    try:
+        with open("/proc/cpuinfo") as fh:
+            flags = fh.read().split()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def dtype_policy(mixed_precision: str) -> str:
+    """Dtype policy of the hidden layers, `None` for the default float32."""
+    if not mixed_precision:
+        return None
+    if mixed_precision == "mixed_bfloat16" and not bfloat16_supported():
+        logging.warning("bfloat16 is emulated on this device, keep float32")
+        return None
+    logging.info(f"Use dtype policy {mixed_precision} in hidden layers")
+    return mixed_precision
+
+
+def build_and_compile_model(stats: dict, model_params: dict) -> Model:
+    """Build and compile the model, with raw features as inputs.
+
+    With `jit_compile`, the model consists of a preprocessing model and a dense
+    model: XLA cannot compile string lookups, so only the dense model is
+    compiled and trained, on batches preprocessed by the input pipeline (see
+    `training_model`). The hidden layers compute in the `mixed_precision` dtype
+    policy, if any, the output layer always computes in float32.
+    Args:
+        stats (dict): preprocessing statistics
+        model_params (dict): model hyper-parameters
+    Returns:
+        model (Model): model from raw features to predictions
+    """
+    x, all_ins = transform(stats)
     x = Concatenate()(x)
+    if model_params["jit_compile"]:
+        preprocessing = Model(inputs=all_ins, outputs=x, name=PREPROCESSING_MODEL)
+        x = dense_in = Input(shape=x.shape[1:], name="features")
+
+    policy = dtype_policy(model_params["mixed_precision"])
     for units, activation in model_params["hidden_units"]:
-        x = Dense(units, activation=activation)(x)
-    x = Dense(1, name="output", activation="linear")(x)
+        x = Dense(units, activation=activation, dtype=policy)(x)
+    x = Dense(1, name="output", activation="linear", dtype="float32")(x)
+
+    if model_params["jit_compile"]:
+        train_model = Model(inputs=dense_in, outputs=x, name=DENSE_MODEL)
+        x = train_model(preprocessing(all_ins))
 
     model = Model(inputs=all_ins, outputs=x, name="nn_model")
+    if not model_params["jit_compile"]:
+        train_model = model
     model.summary()
 
     logging.info(f"Use optimizer {model_params['optimizer']}")
     optimizer = optimizers.get(model_params["optimizer"])
     optimizer.learning_rate = model_params["learning_rate"]
+    if policy == "mixed_float16":
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
 
     # Create metrics within the distribution strategy scope
     with tf.distribute.get_strategy().scope():
@@ -135,15 +670,99 @@ def build_and_compile_model(dataset: Dataset, model_params: dict) -> Model:
             ),
         ]
 
-    model.compile(
+    train_model.compile(
         loss=model_params["loss_fn"],
         optimizer=optimizer,
         metrics=metrics,
+        jit_compile=model_params["jit_compile"],
     )
 
     return model
 
 
+def training_model(model: Model, model_params: dict) -> tuple:
+    """Model trained by `fit` and the preprocessing of its input datasets.
+    Args:
+        model (Model): model built by `build_and_compile_model`
+        model_params (dict): model hyper-parameters
+    Returns:
+        train_model (Model): `model`, or its dense model with `jit_compile`
+        prepare (callable): maps a dataset of raw features to the inputs of
+            `train_model`
+    """
+    if not model_params["jit_compile"]:
+        return model, lambda dataset: dataset
+
+    preprocessing = model.get_layer(PREPROCESSING_MODEL)
+
+    def prepare(dataset: Dataset) -> Dataset:
+        return dataset.map(
+            lambda features, label: (preprocessing(features), label),
+            num_parallel_calls=model_params["num_parallel_calls"],
+            deterministic=model_params["deterministic"],
+        )
+
+    return model.get_layer(DENSE_MODEL), prepare
+
+
+def _architecture(model: Model) -> list:
+    """Class, weight shapes and vocabulary of every layer of `model`."""
+    return [
+        (
+            type(layer).__name__,
+            [tuple(weight.shape) for weight in layer.weights],
+            layer.get_vocabulary() if isinstance(layer, StringLookup) else None,
+        )
+        for layer in model.layers
+    ]
+
+
+def warm_start(model: Model, path: str) -> bool:
+    """Initialize the weights of `model` from a previously trained model.
+
+    The weights are only copied if the architecture matches: the same layers,
+    with weights of the same shapes and, for a SavedModel, the same vocabularies
+    (the vocabularies are not part of weight checkpoints). Otherwise the model
+    keeps its initial weights (cold start).
+
+    The optimized variant of a model (`OPTIMIZED_MODEL`, e.g. registered as the
+    champion) has fewer hidden units, the model is initialized from the full
+    model exported next to it instead.
+    Args:
+        model (Model): compiled model
+        path (str): SavedModel directory (e.g. of the champion model), weights
+            checkpoint (see `tf.keras.Model.save_weights`) or its directory
+    Returns:
+        warm_started (bool): whether the weights were loaded from `path`
+    """
+    if path.startswith("gs://"):
+        path = "/gcs/" + path[len("gs://") :]
+
+    path = path.rstrip("/")
+    if os.path.basename(
+        path
+    ) == OPTIMIZED_MODEL and tf.saved_model.contains_saved_model(os.path.dirname(path)):
+        logging.info(f"{path} is an optimized model, warm start from the full model")
+        path = os.path.dirname(path)
+
+    try:
+        if tf.saved_model.contains_saved_model(path):
+            source = tf.keras.models.load_model(path, compile=False)
+            if _architecture(source) != _architecture(model):
+                logging.warning(f"Cold start: architecture of {path} does not match")
+                return False
+            model.set_weights(source.get_weights())
+        else:
+            checkpoint = tf.train.latest_checkpoint(path) or path
+            model.load_weights(checkpoint).assert_existing_objects_matched()
+    except (AssertionError, OSError, ValueError, tf.errors.OpError) as e:
+        logging.warning(f"Cold start: cannot load weights from {path}: {e}")
+        return False
+
+    logging.info(f"Warm start from {path}")
+    return True
+
+
 def configure_keras_callbacks(
     checkpoints_dir,
     hypertune,
@@ -202,6 +821,47 @@ def get_distribution_strategy(distribute_strategy: str) -> tf.distribute.Strateg
     return strategy
 
 
+def build_pruned_model(
+    model: Model, stats: dict, model_params: dict, train_ds: Dataset
+) -> Model:
+    """Smaller copy of a trained model for CPU serving.
+
+    A fraction (`optimized_prune_fraction`) of the units of each hidden layer
+    is removed, the remaining weights are copied and the pruned model is
+    fine-tuned on the training data to recover from the pruning. The pruned
+    model is always built without `jit_compile` and in float32.
+    Args:
+        model (Model): trained model
+        stats (dict): preprocessing statistics
+        model_params (dict): model hyper-parameters
+        train_ds (Dataset): training data
+    Returns:
+        pruned (Model): pruned model
+    """
+    hidden_units, kept = prune_hidden_units(
+        model, model_params["optimized_prune_fraction"]
+    )
+    logging.info(f"Prune hidden units to {hidden_units}")
+    pruned = build_and_compile_model(
+        stats,
+        {
+            **model_params,
+            "hidden_units": hidden_units,
+            "jit_compile": False,
+            "mixed_precision": "",
+        },
+    )
+    copy_pruned_weights(model, pruned, kept)
+    if model_params["optimized_finetune_epochs"] > 0:
+        pruned.fit(
+            train_ds,
+            epochs=model_params["optimized_finetune_epochs"],
+            steps_per_epoch=num_steps(train_ds),
+            verbose=2,
+        )
+    return pruned
+
+
 def _is_chief(strategy: tf.distribute.Strategy) -> bool:
     """Determine whether current worker is the chief (master). See more info:
     - https://www.tensorflow.org/tutorials/distribute/multi_worker_with_keras
@@ -215,6 +875,137 @@ def _is_chief(strategy: tf.distribute.Strategy) -> bool:
     return (cr is None) or (cr.task_type == "chief" and cr.task_id == 0)
 
 
+def slice_values(stats: dict) -> dict:
+    """Known values of the columns evaluation metrics are sliced by.
+    Args:
+        stats (dict): preprocessing statistics with the vocabularies
+    Returns:
+        slices (dict): `{column: [value]}` for each column of `SLICE_COLS`
+    """
+    values = {name: stats["vocabulary"][name] for name in ORD_COLS + OHE_COLS}
+    values["hourofday"] = [str(hour) for hour in range(24)]
+    return {name: values[name] for name in SLICE_COLS}
+
+
+def evaluate_model(
+    model: Model, dataset: Dataset, strategy: tf.distribute.Strategy, stats: dict
+) -> tuple:
+    """Evaluate the model in a single pass over the dataset, sharded across all
+    replicas of the active distribution strategy.
+
+    Must be called on every worker: the batches are auto-sharded (by file if
+    there are enough files, otherwise by batch) and each replica predicts its
+    share. Labels, predictions and slice indices are gathered from all
+    replicas and fed to a streaming `RegressionMetrics` accumulator, which
+    computes the overall and the sliced metrics in the same pass.
+    Args:
+        model (Model): trained model
+        dataset (Dataset): single epoch of the test data
+        strategy (tf.distribute.Strategy): active distribution strategy
+        stats (dict): preprocessing statistics with the vocabularies
+    Returns:
+        (metrics, sliced_metrics) (tuple): metrics over all rows (dict) and
+            per slice (list)
+    """
+    slices = slice_values(stats)
+    with strategy.scope():
+        lookups = {
+            name: StringLookup(vocabulary=values, name=f"slice_{name}")
+            for name, values in slices.items()
+        }
+
+    def predict_step(features, label):
+        y_pred = tf.reshape(model(features, training=False), [-1])
+        slice_ids = {}
+        for name, lookup in lookups.items():
+            value = features[name]
+            if value.dtype != tf.string:
+                value = tf.strings.as_string(tf.cast(value, tf.int64))
+            slice_ids[name] = lookup(value)
+        return label, y_pred, slice_ids
+
+    @tf.function
+    def distributed_predict_step(features, label):
+        outputs = strategy.run(predict_step, args=(features, label))
+        return tf.nest.map_structure(lambda v: strategy.gather(v, axis=0), outputs)
+
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = (
+        tf.data.experimental.AutoShardPolicy.AUTO
+    )
+    dist_dataset = strategy.experimental_distribute_dataset(
+        dataset.with_options(options)
+    )
+
+    logging.info("Evaluate model on test data")
+    accumulator = RegressionMetrics(slices)
+    for features, label in dist_dataset:
+        y_true, y_pred, slice_ids = distributed_predict_step(features, label)
+        accumulator.update(
+            y_true.numpy(),
+            y_pred.numpy(),
+            {name: ids.numpy() for name, ids in slice_ids.items()},
+        )
+
+    metrics = accumulator.result()
+    logging.info(f"Evaluation metrics: {metrics}")
+    return metrics, accumulator.sliced_result()
+
+
+def monitoring_training_dataset(train_data: str, label_name: str) -> dict:
+    """Training dataset of the model monitoring of batch predictions.
+
+    See https://cloud.google.com/python/docs/reference/aiplatform/latest/google.cloud.aiplatform_v1beta1.types.ModelMonitoringObjectiveConfig.TrainingDataset  # noqa: E501
+    for the expected schema.
+    Args:
+        train_data (str): path, file pattern or directory of the training data
+        label_name (str): name of the label column
+    Returns:
+        training_dataset (dict): training dataset, None if its format is not
+            supported by model monitoring (Parquet)
+    """
+    data_format, _ = file_format(list_files(train_data)[0])
+    if data_format != "CSV":
+        logging.warning(
+            f"No training dataset for model monitoring: {data_format} is not a "
+            "training dataset format of model monitoring"
+        )
+        return None
+
+    uri = str(train_data)
+    if tf.io.gfile.isdir(uri):
+        # shards extracted by `extract_table_to_gcs_op` with `num_shards`, not
+        # the side files like the preprocessing statistics cache
+        uri = os.path.join(uri, "*.csv*")
+    return {
+        "gcsSource": {"uris": [uri]},
+        "dataFormat": "csv",
+        "targetField": label_name,
+    }
+
+
+def subsample_stages(model_params: dict, max_epochs: int = 0) -> list:
+    """Stages of the training as `(subsample rate, last epoch)` tuples.
+    Args:
+        model_params (dict): model hyper-parameters
+        max_epochs (int): total number of epochs the stages are truncated to,
+            0 to train every stage
+    Returns:
+        stages (list): `(subsample rate, last epoch)` of each stage
+    """
+    schedule = model_params["subsample_schedule"] or [
+        (model_params["subsample_rate"], model_params["epochs"])
+    ]
+    stages, last_epoch = [], 0
+    for subsample_rate, epochs in schedule:
+        last_epoch += int(epochs)
+        if max_epochs > 0 and last_epoch >= max_epochs:
+            stages.append((float(subsample_rate), max_epochs))
+            break
+        stages.append((float(subsample_rate), last_epoch))
+    return stages
+
+
 def train_and_evaluate(params):
     if params["model"].startswith("gs://"):
         if params["metrics"] == "":
@@ -250,39 +1041,170 @@ def train_and_evaluate(params):
     # Set distribute strategy before any TF operations
     strategy = get_distribution_strategy(hparams["distribute_strategy"])
 
-    train_ds = create_dataset(params["train_data"], label, hparams)
-    valid_ds = create_dataset(params["valid_data"], label, hparams)
-    test_ds = create_dataset(params["test_data"], label, hparams)
+    # finite datasets of a single epoch, `model.fit` iterates them once per epoch.
+    # The XLA compiled model is compiled again for every batch shape, it is
+    # trained on batches of a single shape
+    train_ds = create_dataset(
+        params["train_data"],
+        label,
+        hparams,
+        num_rows=params.get("train_rows", 0),
+        drop_remainder=hparams["jit_compile"],
+    )
+    valid_ds = create_dataset(
+        params["valid_data"], label, hparams, num_rows=params.get("valid_rows", 0)
+    )
+    # read once for evaluation, in file order and without asserted cardinality
+    # as it is sharded across workers (see `evaluate_model`)
+    test_ds = create_dataset(
+        params["test_data"],
+        label,
+        {**hparams, "shuffle_files": False, "shuffle_buffer_size": 0},
+    )
 
     train_features = list(train_ds.element_spec[0].keys())
     valid_features = list(valid_ds.element_spec[0].keys())
     logging.info(f"Training feature names: {train_features}")
     logging.info(f"Validation feature names: {valid_features}")
 
+    stats = get_preprocessing_stats(params["train_data"], label, hparams)
+
     with strategy.scope():
-        model = build_and_compile_model(train_ds, hparams)
+        model = build_and_compile_model(stats, hparams)
+
+    warm_started = bool(params.get("warm_start_model")) and warm_start(
+        model, params["warm_start_model"]
+    )
+
+    train_model, prepare = training_model(model, hparams)
+    valid_ds = prepare(valid_ds)
+
+    # a warm started model is trained for (at most) `warm_start_epochs`
+    stages = subsample_stages(
+        hparams, max_epochs=hparams["warm_start_epochs"] if warm_started else 0
+    )
+    hparams["epochs"] = stages[-1][1]
+    if warm_started:
+        logging.info(f"Train warm started model for {hparams['epochs']} epochs")
+    logging.info(f"Training stages (subsample rate, last epoch): {stages}")
+
+    # the number of batches of subsampled data is not known
+    full_data = all(subsample_rate >= 1.0 for subsample_rate, _ in stages)
+    steps_per_epoch = num_steps(train_ds) if full_data else None
+    validation_steps = num_steps(valid_ds)
+    logging.info(f"Steps per epoch: {steps_per_epoch} (validation: {validation_steps})")
+
+    resumable = None
+    initial_epoch, initial_step = 0, 0
+    if hparams["checkpoint_steps"] > 0 and params["checkpoints"]:
+        with strategy.scope():
+            resumable = ResumableCheckpoint(
+                train_model,
+                resume_dir(params["checkpoints"]),
+                hparams["checkpoint_steps"],
+                chief=_is_chief(strategy),
+                async_save=hparams["distribute_strategy"] == "single",
+            )
+            initial_epoch, initial_step = resumable.restore(steps_per_epoch)
 
-    # steps_per_epoch = len(train_ds) // (hparams["batch_size"] * hparams["epochs"])
     # Define the callbacks
 
+    hypertune_kwargs = dict(metric="val_root_mean_squared_error")
+    if params.get("hypertune") and hparams["hypertune_report_steps"] > 0:
+        # same rows for every report of every trial
+        report_ds = create_dataset(
+            params["valid_data"],
+            label,
+            {**hparams, "shuffle_files": False, "shuffle_buffer_size": 0},
+        )
+        hypertune_kwargs.update(
+            validation_data=prepare(report_ds)
+            .take(hparams["hypertune_report_batches"])
+            .cache(),
+            report_steps=hparams["hypertune_report_steps"],
+            global_step=initial_epoch * (steps_per_epoch or 0) + initial_step,
+        )
+
     callbacks = configure_keras_callbacks(
-        checkpoints_dir=params["checkpoints"],
+        # the resumable checkpoints replace the weights saved after each epoch
+        checkpoints_dir=params["checkpoints"] if resumable is None else "",
         hypertune=params.get("hypertune"),
-        hypertune_kwargs=dict(metric="val_root_mean_squared_error"),
+        hypertune_kwargs=hypertune_kwargs,
         earlystopping=True,
         earlystopping_kwargs=hparams["early_stopping_epochs"],
     )
 
-    history = model.fit(
-        train_ds,
+    timeline = None
+    if hparams["profile"]:
+        profile_dir = os.environ.get(
+            "AIP_TENSORBOARD_LOG_DIR", os.path.join(params["metrics"], "profile")
+        )
+        timeline = StepTimelineCallback(hparams["profile_steps"], profile_dir)
+        callbacks.append(timeline)
+
+    if resumable is not None:
+        callbacks.append(resumable)
+
+    def training_data(subsample_rate: float) -> Dataset:
+        dataset = train_ds
+        if subsample_rate < 1.0:
+            dataset = create_dataset(
+                params["train_data"],
+                label,
+                hparams,
+                subsample_rate=subsample_rate,
+                drop_remainder=hparams["jit_compile"],
+            )
+        dataset = prepare(dataset)
+        return timeline.instrument(dataset) if timeline is not None else dataset
+
+    fit_kwargs = dict(
         validation_data=valid_ds,
         batch_size=hparams["batch_size"],
-        epochs=hparams["epochs"],
-        # steps_per_epoch=max(1, steps_per_epoch),
+        validation_steps=validation_steps,
         verbose=2,  # 0=silent, 1=progress bar, 2=one line per epoch
         callbacks=callbacks,
     )
 
+    history = None
+    for subsample_rate, last_epoch in stages:
+        if initial_epoch >= last_epoch:
+            continue
+        stage_ds = training_data(subsample_rate)
+
+        if initial_step > 0:
+            # finish the interrupted epoch with its remaining number of batches.
+            # The epoch is shuffled again, this is an approximate resume: some
+            # of its examples are seen twice and others not at all
+            remaining_steps = steps_per_epoch - initial_step
+            logging.info(f"Resume epoch {initial_epoch} for {remaining_steps} steps")
+            train_model.fit(
+                stage_ds.take(remaining_steps),
+                epochs=initial_epoch + 1,
+                initial_epoch=initial_epoch,
+                steps_per_epoch=remaining_steps,
+                **fit_kwargs,
+            )
+            initial_epoch, initial_step = initial_epoch + 1, 0
+
+        history = train_model.fit(
+            stage_ds,
+            epochs=last_epoch,
+            initial_epoch=initial_epoch,
+            steps_per_epoch=num_steps(stage_ds),
+            **fit_kwargs,
+        )
+        initial_epoch = last_epoch
+        # early stopping ends the training, not only the stage
+        if train_model.stop_training:
+            break
+
+    if resumable is not None:
+        resumable.finish()
+
+    # all workers take part in the evaluation, each on its own shard
+    metrics, sliced_metrics = evaluate_model(model, test_ds, strategy, stats)
+
     # only persist output files if current worker is chief
     if not _is_chief(strategy):
         logging.info("not chief node, exiting now")
@@ -292,18 +1214,35 @@ def train_and_evaluate(params):
     if not os.path.exists(params["model"]):
         logging.info(f"Create model directory : {params['model']}")
         params["model"].mkdir(parents=True)
-    model.save(str(params["model"]), save_format="tf")
-
-    eval_metrics = dict(zip(model.metrics_names, model.evaluate(test_ds)))
+    export_model(
+        model, str(params["model"]), test_ds, hparams["serving_warmup_requests"]
+    )
 
-    metrics = {
-        "problemType": "regression",
-        "rootMeanSquaredError": eval_metrics["root_mean_squared_error"],
-        "meanAbsoluteError": eval_metrics["mean_absolute_error"],
-        "meanAbsolutePercentageError": eval_metrics["mean_absolute_percentage_error"],
-        "rSquared": None,
-        "rootMeanSquaredLogError": eval_metrics["mean_squared_logarithmic_error"],
-    }
+    if hparams["optimized_prune_fraction"] > 0:
+        # trained and evaluated on the chief only, outside of the strategy scope
+        pruned = build_pruned_model(model, stats, hparams, train_ds)
+        pruned_metrics, _ = evaluate_model(
+            pruned, test_ds, tf.distribute.get_strategy(), stats
+        )
+        logging.info(f"Evaluation metrics of the optimized model: {pruned_metrics}")
+        export_model(
+            pruned,
+            str(params["model"] / OPTIMIZED_MODEL),
+            test_ds,
+            hparams["serving_warmup_requests"],
+        )
+        optimized_info = dict(
+            path=OPTIMIZED_MODEL,
+            hidden_units=hidden_units(pruned),
+            metrics=pruned_metrics,
+            latency=dict(
+                model=serving_latency(model, test_ds),
+                optimized=serving_latency(pruned, test_ds),
+            ),
+        )
+        logging.info(f"Optimized model: {optimized_info}")
+        with open(params["model"] / OPTIMIZED_MODEL_INFO, "w") as fh:
+            json.dump(optimized_info, fh)
 
     if not os.path.exists(params["metrics"]):
         logging.info(f"Create metrics directory : {params['metrics']}")
@@ -314,19 +1253,29 @@ def train_and_evaluate(params):
     with open(os.path.join(params["metrics"], "metrics.json"), "w") as fh:
         json.dump(metrics, fh)
 
-    # Persist URIs of training file(s) for model monitoring in batch predictions
-    # See https://cloud.google.com/python/docs/reference/aiplatform/latest/google.cloud.aiplatform_v1beta1.types.ModelMonitoringObjectiveConfig.TrainingDataset  # noqa: E501
-    # for the expected schema.
-    path = params["model"] / TRAINING_DATASET_INFO
-    training_dataset_for_monitoring = {
-        "gcsSource": {"uris": [params["train_data"]]},
-        "dataFormat": "csv",
-        "targetField": label,
-    }
-    logging.info(f"Save training dataset info for model monitoring: {path}")
-    logging.info(f"Training dataset: {training_dataset_for_monitoring}")
+    with open(os.path.join(params["metrics"], SLICED_METRICS), "w") as fh:
+        json.dump(sliced_metrics, fh)
+
+    if timeline is not None:
+        timeline.save(os.path.join(params["metrics"], TRAINING_TIMELINE))
 
-    with open(path, "w") as fp:
-        json.dump(training_dataset_for_monitoring, fp)
+    # Persist URIs of training file(s) for model monitoring in batch predictions.
+    # The optimized model has its own copy, as it is registered (and looked up)
+    # without the full model.
+    training_dataset_for_monitoring = monitoring_training_dataset(
+        params["train_data"], label
+    )
+    if training_dataset_for_monitoring is None:
+        return history
+
+    logging.info(f"Training dataset: {training_dataset_for_monitoring}")
+    model_dirs = [params["model"]]
+    if hparams["optimized_prune_fraction"] > 0:
+        model_dirs.append(params["model"] / OPTIMIZED_MODEL)
+    for model_dir in model_dirs:
+        path = model_dir / TRAINING_DATASET_INFO
+        logging.info(f"Save training dataset info for model monitoring: {path}")
+        with open(path, "w") as fp:
+            json.dump(training_dataset_for_monitoring, fp)
 
     return history
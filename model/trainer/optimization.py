@@ -0,0 +1,116 @@
+"""Smaller variant of a trained model for CPU batch prediction."""
+
+import math
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.data import Dataset
+from tensorflow.keras import Model
+from tensorflow.keras.layers import Dense, InputLayer
+
+from trainer.export import input_signature, serving_function
+
+
+def flat_layers(model: Model) -> list:
+    """Layers of `model` with the layers of nested models, without inputs."""
+    layers = []
+    for layer in model.layers:
+        if isinstance(layer, Model):
+            layers.extend(flat_layers(layer))
+        elif not isinstance(layer, InputLayer):
+            layers.append(layer)
+    return layers
+
+
+def _hidden_layers(model: Model) -> tuple:
+    dense = [layer for layer in flat_layers(model) if isinstance(layer, Dense)]
+    # the last layer is the output layer
+    return dense[:-1], dense[-1]
+
+
+def hidden_units(model: Model) -> list:
+    """Number of units of each hidden layer of `model`."""
+    return [layer.units for layer in _hidden_layers(model)[0]]
+
+
+def prune_hidden_units(model: Model, fraction: float) -> tuple:
+    """Select the units of each hidden layer to keep.
+
+    The units with the smallest L2 norm of their outgoing weights contribute
+    the least to the next layer and are removed (structured pruning), which
+    shrinks the matrix multiplications instead of only zeroing weights.
+    Args:
+        model (Model): trained model
+        fraction (float): fraction of the units of each hidden layer to remove
+    Returns:
+        (hidden_units, kept) (tuple): `[(units, activation)]` of the pruned
+            model and the sorted indices of the kept units of each layer
+    """
+    hidden, output = _hidden_layers(model)
+    hidden_units, kept = [], []
+    for layer, next_layer in zip(hidden, hidden[1:] + [output]):
+        kernel = next_layer.get_weights()[0]
+        num_units = max(1, math.ceil(layer.units * (1.0 - fraction)))
+        norms = np.linalg.norm(kernel, axis=1)
+        kept.append(np.sort(np.argsort(-norms, kind="stable")[:num_units]))
+        hidden_units.append((num_units, layer.get_config()["activation"]))
+    return hidden_units, kept
+
+
+def copy_pruned_weights(model: Model, pruned: Model, kept: list) -> None:
+    """Initialize `pruned` with the weights of the kept units of `model`.
+    Args:
+        model (Model): trained model
+        pruned (Model): model built with the hidden units of `prune_hidden_units`
+        kept (list): indices of the kept units of each hidden layer
+    """
+    source, target = flat_layers(model), flat_layers(pruned)
+    if [type(layer) for layer in source] != [type(layer) for layer in target]:
+        raise ValueError("The pruned model has other layers than the model")
+
+    dense_index = 0
+    for layer, pruned_layer in zip(source, target):
+        weights = layer.get_weights()
+        if isinstance(layer, Dense):
+            kernel, bias = weights
+            if dense_index > 0:
+                kernel = kernel[kept[dense_index - 1], :]
+            if dense_index < len(kept):
+                kernel, bias = kernel[:, kept[dense_index]], bias[kept[dense_index]]
+            weights = [kernel, bias]
+            dense_index += 1
+        pruned_layer.set_weights(weights)
+
+
+def serving_latency(model: Model, dataset: Dataset, num_batches: int = 50) -> dict:
+    """Latency of the serving signature of `model` on batches of `dataset`.
+    Args:
+        model (Model): model
+        dataset (Dataset): batches of `(features, label)`, e.g. the test data
+        num_batches (int): number of timed batches
+    Returns:
+        latency (dict): median and 99th percentile of the batch latency in
+            milliseconds and the throughput in examples per second
+    """
+    serve = serving_function(model)
+    names = list(input_signature(model))
+    batches = [
+        {name: features[name] for name in names}
+        for features, _ in dataset.take(num_batches)
+    ]
+    # the first call initializes the function
+    serve(batches[0])
+
+    seconds, examples = [], 0
+    for batch in batches:
+        start = time.perf_counter()
+        serve(batch)
+        seconds.append(time.perf_counter() - start)
+        examples += int(tf.shape(batch[names[0]])[0])
+    return dict(
+        batches=len(batches),
+        p50_ms=float(np.percentile(seconds, 50) * 1000.0),
+        p99_ms=float(np.percentile(seconds, 99) * 1000.0),
+        examples_per_sec=examples / sum(seconds),
+    )
@@ -0,0 +1,153 @@
+"""Per-step timeline of the training loop to locate input pipeline bottlenecks."""
+
+import json
+import logging
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.data import Dataset
+
+
+class StepTimelineCallback(tf.keras.callbacks.Callback):
+    """Record the wall time, throughput and input stall of every training step.
+
+    A step is timed around the train function of the model, without the time
+    spent in the callbacks. The input stall is the time between the start of a
+    step and the moment its batch leaves the input pipeline, which is recorded
+    by a last `map` added to the training dataset with `instrument` (0 if the
+    batch was prefetched before the step). The rest of the step is spent in the
+    model (forward, backward pass and optimizer update).
+
+    Args:
+        profile_steps (list): optional `[first, last]` steps (counted over all
+            epochs) traced with the TensorBoard profiler
+        profile_dir (str): log directory of the profiler traces
+    """
+
+    def __init__(self, profile_steps=None, profile_dir=None) -> None:
+        super().__init__()
+        self.profile_steps = profile_steps or []
+        self.profile_dir = profile_dir
+        self.steps = []
+        self._epoch = 0
+        self._global_step = 0
+        self._begin = 0.0
+        self._end = 0.0
+        # time and size of the batches handed to the model, by batch index
+        self._fetched = {}
+        self._train_function = None
+        self._tracing = False
+
+    def instrument(self, dataset: Dataset) -> Dataset:
+        """Record when each batch of `dataset` is handed to the model.
+
+        The batches are numbered from 0 in each epoch (the training loop
+        iterates over the dataset again in each epoch), like the steps.
+        """
+
+        def record(index, batch_size):
+            self._fetched[int(index)] = (time.perf_counter(), int(batch_size))
+            return np.int64(batch_size)
+
+        def fetched(index, element):
+            features, label = element
+            batch_size = tf.numpy_function(
+                record, [index, tf.shape(label)[0]], tf.int64
+            )
+            with tf.control_dependencies([batch_size]):
+                return features, tf.identity(label)
+
+        return dataset.enumerate().map(fetched)
+
+    def on_train_begin(self, logs=None):
+        # `fit` creates the train function before this call, and calls it
+        # between the batch callbacks
+        self._train_function = self.model.train_function
+
+        def timed_train_function(iterator):
+            self._begin = time.perf_counter()
+            try:
+                return self._train_function(iterator)
+            finally:
+                self._end = time.perf_counter()
+
+        self.model.train_function = timed_train_function
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.profile_steps and self._global_step == self.profile_steps[0]:
+            logging.info(f"Start profiler trace at step {self._global_step}")
+            tf.profiler.experimental.start(self.profile_dir)
+            self._tracing = True
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self._tracing and self._global_step == self.profile_steps[1]:
+            self._stop_trace()
+
+        # without `instrument` (or with prefetching to devices) the input stall
+        # of the step is unknown
+        fetched, batch_size = self._fetched.pop(batch, (None, None))
+        seconds = self._end - self._begin
+        self.steps.append(
+            dict(
+                epoch=self._epoch,
+                step=batch,
+                global_step=self._global_step,
+                start=self._begin,
+                seconds=seconds,
+                input_seconds=(
+                    max(0.0, fetched - self._begin) if fetched is not None else None
+                ),
+                examples=batch_size,
+                examples_per_sec=batch_size / seconds if batch_size else None,
+            )
+        )
+        self._global_step += 1
+
+    def on_train_end(self, logs=None):
+        self.model.train_function = self._train_function
+        # records of the batches prefetched after the last step
+        self._fetched.clear()
+        # training ended inside of the traced steps
+        if self._tracing:
+            self._stop_trace()
+
+    def _stop_trace(self):
+        tf.profiler.experimental.stop()
+        self._tracing = False
+        logging.info(f"Saved profiler trace to {self.profile_dir}")
+
+    def summary(self) -> dict:
+        """Totals over all steps, excluding the first one (tracing, warm-up).
+
+        The input stall and the throughput are computed over the steps whose
+        batch was recorded (see `instrument`), `unknown_input_steps` counts the
+        other ones.
+        """
+        steps = self.steps[1:]
+        known = [step for step in steps if step["examples"] is not None]
+        seconds = sum(step["seconds"] for step in steps)
+        known_seconds = sum(step["seconds"] for step in known)
+        input_seconds = sum(step["input_seconds"] for step in known)
+        examples = sum(step["examples"] for step in known)
+        return dict(
+            steps=len(self.steps),
+            unknown_input_steps=len(steps) - len(known),
+            first_step_seconds=self.steps[0]["seconds"] if self.steps else None,
+            seconds=seconds,
+            input_seconds=input_seconds,
+            input_stall_fraction=(
+                input_seconds / known_seconds if known_seconds else None
+            ),
+            examples_per_sec=examples / known_seconds if known_seconds else None,
+        )
+
+    def save(self, path: str) -> None:
+        """Write the summary and the timeline of all steps to a JSON file."""
+        summary = self.summary()
+        logging.info(f"Training timeline summary: {summary}")
+        with open(path, "w") as fh:
+            json.dump(dict(summary=summary, steps=self.steps), fh)
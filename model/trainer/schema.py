@@ -0,0 +1,79 @@
+"""Column schema of the Chicago taxi trips data produced by `ingest.sql`."""
+
+import csv
+import gzip
+
+import tensorflow as tf
+
+# features in the column order of `ingest.sql`, the label column comes last.
+# FLOAT64 columns are decoded as float32 which is what the model consumes.
+FEATURE_SCHEMA = {
+    "dayofweek": tf.float32,
+    "hourofday": tf.float32,
+    "trip_distance": tf.float32,
+    "trip_miles": tf.float32,
+    "trip_seconds": tf.float32,
+    "payment_type": tf.string,
+    "company": tf.string,
+}
+
+LABEL_DTYPE = tf.float32
+
+# numeric/categorical features in Chicago trips dataset to be preprocessed
+NUM_COLS = ["dayofweek", "hourofday", "trip_distance", "trip_miles", "trip_seconds"]
+
+ORD_COLS = ["company"]
+
+OHE_COLS = ["payment_type"]
+
+# columns evaluation metrics are sliced by
+SLICE_COLS = ["payment_type", "company", "hourofday"]
+
+# value used for empty (NULL) fields
+_DEFAULTS = {tf.float32: 0.0, tf.string: ""}
+
+
+def column_names(label_name: str) -> list:
+    """Names of all columns (features followed by the label) in file order."""
+    return list(FEATURE_SCHEMA) + [label_name]
+
+
+def record_defaults(label_name: str) -> list:
+    """Typed defaults for `tf.io.decode_csv`, one per column in file order."""
+    dtypes = list(FEATURE_SCHEMA.values()) + [LABEL_DTYPE]
+    return [tf.constant([_DEFAULTS[dtype]], dtype=dtype) for dtype in dtypes]
+
+
+def validate_header(path: str, label_name: str, compression: str = "") -> None:
+    """Ensure the header of a CSV file matches the declared schema.
+    Args:
+        path (str): path of the CSV file
+        label_name (str): name of the label column
+        compression (str): compression of the file, "" or GZIP
+    Raises:
+        ValueError: if the header differs from `column_names(label_name)`
+    """
+    with tf.io.gfile.GFile(path, "rb") as fh:
+        if compression == "GZIP":
+            line = gzip.GzipFile(fileobj=fh).readline()
+        else:
+            line = fh.readline()
+    header = next(csv.reader([line.decode("utf-8")]), [])
+    validate_columns(header, label_name, path)
+
+
+def validate_columns(names: list, label_name: str, path: str) -> None:
+    """Ensure the column names of a data file match the declared schema.
+    Args:
+        names (list): column names of the file, in file order
+        label_name (str): name of the label column
+        path (str): path of the file, used in the error message
+    Raises:
+        ValueError: if `names` differs from `column_names(label_name)`
+    """
+    expected = column_names(label_name)
+    if list(names) != expected:
+        raise ValueError(
+            f"Columns of {path} do not match the feature schema: "
+            f"expected {expected}, got {list(names)}"
+        )
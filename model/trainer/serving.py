@@ -0,0 +1,392 @@
+"""Local HTTP prediction server with dynamic micro-batching of requests.
+
+Loads the SavedModel exported by `trainer.model` and serves the prediction
+API of the Vertex AI prediction containers, e.g.:
+
+    python -m trainer.serving --model-dir=model --port=8080
+
+    curl -X POST localhost:8080/predict -d '{"instances": [{"dayofweek": 1, ...}]}'
+
+Concurrent requests are coalesced into batches of up to `--max-batch-size`
+instances, waiting at most `--max-wait-ms` for a batch to fill up, and the
+batches are predicted on a pool of `--workers` threads. `GET /metrics`
+returns the latency percentiles and the throughput of the server.
+
+Load test the server on synthetic trips (see `trainer.synthetic`) before
+sizing the prediction endpoint, e.g.:
+
+    python -m trainer.serving --model-dir=model --load-test-requests=2000 \
+        --concurrency=32
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import tensorflow as tf
+from tensorflow_serving.apis import prediction_log_pb2
+
+from trainer import synthetic
+from trainer.export import SERVING_SIGNATURE, WARMUP_REQUESTS
+
+
+def load_predict_fn(model_dir: str) -> tuple:
+    """Prediction function of the `serving_default` signature of a SavedModel.
+    Args:
+        model_dir (str): SavedModel directory
+    Returns:
+        predict_fn (callable): list of instances (dicts of raw features) to the
+            list of their predictions
+        specs (dict): `tf.TensorSpec` of each input of the signature
+    """
+    signature = tf.saved_model.load(model_dir).signatures[SERVING_SIGNATURE]
+    specs = signature.structured_input_signature[1]
+    (output,) = signature.structured_outputs
+
+    # replay the warm-up requests like TensorFlow Serving does
+    warmup = os.path.join(model_dir, WARMUP_REQUESTS)
+    if tf.io.gfile.exists(warmup):
+        for record in tf.data.TFRecordDataset(warmup):
+            request = prediction_log_pb2.PredictionLog.FromString(record.numpy())
+            inputs = request.predict_log.request.inputs
+            signature(**{name: tf.make_ndarray(inputs[name]) for name in specs})
+
+    def predict_fn(instances: list) -> list:
+        features = {
+            name: tf.constant([instance[name] for instance in instances], spec.dtype)
+            for name, spec in specs.items()
+        }
+        return signature(**features)[output].numpy().tolist()
+
+    return predict_fn, specs
+
+
+def validate_instances(instances, specs: dict) -> None:
+    """Check instances have a value of the type of each input of the signature.
+    Args:
+        instances: instances of a prediction request
+        specs (dict): `tf.TensorSpec` of each input, by name
+    Raises:
+        ValueError: if an instance does not match the inputs
+    """
+    if not isinstance(instances, list) or not instances:
+        raise ValueError("instances must be a non-empty list")
+    for i, instance in enumerate(instances):
+        if not isinstance(instance, dict):
+            raise ValueError(f"Instance {i} is not an object: {instance!r}")
+        for name, spec in specs.items():
+            if name not in instance:
+                raise ValueError(f"Instance {i} has no {name}")
+            value = instance[name]
+            if spec.dtype == tf.string:
+                valid = isinstance(value, str)
+            elif spec.dtype.is_bool:
+                valid = isinstance(value, bool)
+            else:
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if not valid:
+                raise ValueError(
+                    f"Instance {i} has an invalid {name} for {spec.dtype.name}: "
+                    f"{value!r}"
+                )
+
+
+def _percentiles(seconds) -> dict:
+    if not seconds:
+        return dict(p50_ms=None, p99_ms=None)
+    return dict(
+        p50_ms=float(np.percentile(seconds, 50) * 1000.0),
+        p99_ms=float(np.percentile(seconds, 99) * 1000.0),
+    )
+
+
+class MicroBatcher:
+    """Coalesce concurrent prediction requests into batches.
+
+    A single thread collects the pending requests until the batch holds
+    `max_batch_size` instances or the first request waited `max_wait_ms`, and
+    submits the batch to a pool of `workers` threads. Requests are never
+    split: a request larger than `max_batch_size` is predicted alone.
+
+    Requests are validated against `specs` before they join a batch. If the
+    prediction of a batch fails anyway, each of its requests is predicted
+    alone, so that a bad request only fails itself.
+
+    Args:
+        predict_fn (callable): list of instances to the list of predictions
+        specs (dict): `tf.TensorSpec` of each input of the model, by name, None
+            to not validate the requests
+        max_batch_size (int): maximum number of instances of a batch
+        max_wait_ms (float): maximum time a request waits for a batch to fill
+        workers (int): number of batches predicted in parallel
+        window (int): number of recent requests the metrics are computed on
+    """
+
+    def __init__(
+        self,
+        predict_fn,
+        specs: dict = None,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        workers: int = 2,
+        window: int = 10000,
+    ) -> None:
+        self.predict_fn = predict_fn
+        self.specs = specs
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.requests = 0
+        self.instances = 0
+        self.started = None
+        self._running = True
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def predict(self, instances: list) -> list:
+        """Predict `instances` in the next batch, blocks until done.
+        Raises:
+            ValueError: if the instances do not match `specs`
+        """
+        if self.specs is not None:
+            validate_instances(instances, self.specs)
+        future = Future()
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.pending.put((instances, future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self):
+        while self._running:
+            try:
+                batch = [self.pending.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            size = len(batch[0][0])
+            deadline = batch[0][2] + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self.pool.submit(self._predict, batch)
+
+    def _predict(self, batch: list):
+        instances = [instance for request, _, _ in batch for instance in request]
+        try:
+            predictions = self.predict_fn(instances)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # isolate the request(s) which failed the batch
+            logging.warning(f"Batch of {len(batch)} requests failed, retrying: {e}")
+            for request in batch:
+                self._predict([request])
+            return
+
+        end, offset = time.perf_counter(), 0
+        for request, future, enqueued in batch:
+            future.set_result(predictions[offset : offset + len(request)])
+            offset += len(request)
+            with self.lock:
+                self.latencies.append(end - enqueued)
+        with self.lock:
+            self.batch_sizes.append(len(instances))
+            self.requests += len(batch)
+            self.instances += len(instances)
+
+    def metrics(self) -> dict:
+        """Latency of the recent requests and throughput since the first one."""
+        with self.lock:
+            latencies, batch_sizes = list(self.latencies), list(self.batch_sizes)
+            requests, instances = self.requests, self.instances
+        seconds = time.perf_counter() - (self.started or time.perf_counter())
+        return dict(
+            requests=requests,
+            instances=instances,
+            **_percentiles(latencies),
+            mean_batch_size=float(np.mean(batch_sizes)) if batch_sizes else None,
+            requests_per_sec=requests / seconds if seconds else None,
+            instances_per_sec=instances / seconds if seconds else None,
+        )
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self.pool.shutdown()
+
+
+def make_server(batcher: MicroBatcher, port: int) -> ThreadingHTTPServer:
+    """HTTP server of `POST /predict` (`{"instances": [...]}`) and `GET /metrics`."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._reply(200, batcher.metrics())
+            elif self.path == "/health":
+                self._reply(200, {})
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            # also accept the path of the Vertex AI / TF Serving REST API
+            if not (self.path == "/predict" or self.path.endswith(":predict")):
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                instances = json.loads(self.rfile.read(length))["instances"]
+            except (ValueError, KeyError) as e:
+                self._reply(400, {"error": f"Invalid request: {e}"})
+                return
+            try:
+                predictions = batcher.predict(instances)
+            except ValueError as e:
+                self._reply(400, {"error": f"Invalid request: {e}"})
+                return
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+                return
+            self._reply(200, {"predictions": predictions})
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    class Server(ThreadingHTTPServer):
+        # connections waiting to be accepted, the default of 5 resets
+        # connections under load
+        request_queue_size = 1024
+        daemon_threads = True
+
+    return Server(("", port), Handler)
+
+
+def load_test(
+    url: str, instances: list, requests: int, concurrency: int, batch_size: int = 1
+) -> dict:
+    """Send concurrent prediction requests and measure them on the client side.
+    Args:
+        url (str): URL of the predict method
+        instances (list): instances sent in turn
+        requests (int): total number of requests
+        concurrency (int): number of requests in flight
+        batch_size (int): number of instances of each request
+    Returns:
+        metrics (dict): latency percentiles and throughput of the requests
+    """
+    bodies = [
+        json.dumps(
+            {
+                "instances": [
+                    instances[(i + j) % len(instances)] for j in range(batch_size)
+                ]
+            }
+        ).encode()
+        for i in range(0, requests * batch_size, batch_size)
+    ]
+
+    def send(body: bytes) -> float:
+        start = time.perf_counter()
+        request = urllib.request.Request(
+            url, data=body, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request) as response:
+            response.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(send, bodies))
+    seconds = time.perf_counter() - start
+    return dict(
+        requests=requests,
+        concurrency=concurrency,
+        **_percentiles(latencies),
+        requests_per_sec=requests / seconds,
+        instances_per_sec=requests * batch_size / seconds,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--model-dir", type=str, required=True)
+
+    parser.add_argument("--port", type=int, default=8080)
+
+    parser.add_argument("--max-batch-size", type=int, default=64)
+
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+
+    parser.add_argument("--workers", type=int, default=2)
+
+    # send requests of synthetic trips to the server, print the metrics and exit
+    parser.add_argument("--load-test-requests", type=int, default=0)
+
+    parser.add_argument("--concurrency", type=int, default=16)
+
+    parser.add_argument("--instances-per-request", type=int, default=1)
+
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+
+    predict_fn, specs = load_predict_fn(args.model_dir)
+    batcher = MicroBatcher(
+        predict_fn,
+        specs=specs,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        workers=args.workers,
+    )
+    server = make_server(batcher, args.port)
+    logging.info(f"Serving {args.model_dir} on port {server.server_port}")
+
+    if not args.load_test_requests:
+        try:
+            server.serve_forever()
+        finally:
+            batcher.close()
+    else:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        trips = [
+            {name: value for name, value in trip.items() if name != "label"}
+            for trip in synthetic.generate_trips(1000, "label").to_pylist()
+        ]
+        client = load_test(
+            f"http://localhost:{server.server_port}/predict",
+            trips,
+            args.load_test_requests,
+            args.concurrency,
+            args.instances_per_request,
+        )
+        server.shutdown()
+        batcher.close()
+        print(json.dumps(dict(client=client, server=batcher.metrics()), indent=2))
@@ -0,0 +1,138 @@
+"""Single-pass preprocessing statistics used by `trainer.model.transform`."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import Counter
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.data import Dataset
+
+# bump whenever the layout of the stats dict or the way it is computed changes
+STATS_VERSION = 1
+
+# directory (next to the input data) holding the persisted statistics
+STATS_CACHE_DIR = "_preprocessing_stats"
+
+
+def compute_stats(dataset: Dataset, num_cols: list, cat_cols: list) -> dict:
+    """Collect normalization and vocabulary statistics in one pass.
+
+    The dataset is streamed exactly once. For every batch the mean and sum of
+    squared deviations of each numerical column are merged into running totals
+    (parallel variance algorithm), and the value counts of each categorical
+    column are added to a counter.
+
+    Args:
+        dataset (Dataset): batched dataset of `(features, label)` tuples
+        num_cols (list): names of numerical columns (mean / variance)
+        cat_cols (list): names of categorical columns (vocabulary)
+    Returns:
+        stats (dict): `{"count": int, "mean": {col: float},
+            "variance": {col: float}, "vocabulary": {col: [str, ...]}}`
+    """
+    logging.info(f"Computing preprocessing statistics for {num_cols + cat_cols}...")
+    cols = num_cols + cat_cols
+    features = dataset.map(lambda x, _: {name: x[name] for name in cols})
+
+    count = 0
+    mean = np.zeros(len(num_cols), dtype=np.float64)
+    m2 = np.zeros(len(num_cols), dtype=np.float64)
+    counters = {name: Counter() for name in cat_cols}
+
+    for batch in features.as_numpy_iterator():
+        values = np.stack([batch[name] for name in num_cols], axis=-1).astype(
+            np.float64
+        )
+        batch_count = values.shape[0]
+        if batch_count == 0:
+            continue
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+
+        total = count + batch_count
+        delta = batch_mean - mean
+        mean += delta * batch_count / total
+        m2 += batch_m2 + delta**2 * count * batch_count / total
+        count = total
+
+        for name in cat_cols:
+            tokens, token_counts = np.unique(batch[name], return_counts=True)
+            counters[name].update(dict(zip(tokens, token_counts.tolist())))
+
+    if count == 0:
+        raise RuntimeError("Cannot compute preprocessing statistics: empty dataset")
+
+    variance = m2 / count
+    stats = dict(
+        count=count,
+        mean={name: float(mean[i]) for i, name in enumerate(num_cols)},
+        variance={name: float(variance[i]) for i, name in enumerate(num_cols)},
+        # same ordering as `StringLookup.adapt`: most frequent tokens first
+        vocabulary={
+            name: [
+                token.decode("utf-8")
+                for token, _ in sorted(c.items(), key=lambda kv: (-kv[1], kv[0]))
+            ]
+            for name, c in counters.items()
+        },
+    )
+    logging.info(f"Preprocessing statistics computed over {count} rows")
+    return stats
+
+
+def fingerprint(files: list, columns: list) -> str:
+    """Fingerprint the input shards and the requested columns.
+
+    Only the metadata of the shards is read (name, size and modification time,
+    which changes when a Cloud Storage object is rewritten), not their content.
+    Args:
+        files (list): paths of the input file(s)
+        columns (list): names of the columns the statistics are computed for
+    Returns:
+        key (str): hex digest identifying the statistics of `files`
+    """
+    digest = hashlib.sha256(f"v{STATS_VERSION}:{','.join(columns)}".encode())
+    for path in sorted(files):
+        stat = tf.io.gfile.stat(path)
+        name = os.path.basename(path)
+        digest.update(f"{name}:{stat.length}:{stat.mtime_nsec}\n".encode())
+    return digest.hexdigest()
+
+
+class LocalStatsCache:
+    """Preprocessing statistics persisted as JSON files in a local directory.
+
+    Cloud Storage buckets are accessed through their Cloud Storage FUSE mount
+    (`/gcs/<bucket>`), so the same implementation is shared by all hypertune
+    trials and the final training job of a pipeline run.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = str(cache_dir)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, key: str) -> dict:
+        """Return the statistics stored under `key` or None if there are none."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            logging.info(f"No cached preprocessing statistics at {path}")
+            return None
+        logging.info(f"Load cached preprocessing statistics from {path}")
+        with open(path, "r") as fh:
+            return json.load(fh)
+
+    def save(self, key: str, stats: dict) -> None:
+        """Store `stats` under `key` (atomic, concurrent writers are fine)."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        logging.info(f"Save preprocessing statistics to {path}")
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as fh:
+            json.dump(stats, fh)
+        os.replace(tmp_path, path)
@@ -0,0 +1,123 @@
+"""Synthetic Chicago taxi trips matching the output schema of `ingest.sql`."""
+
+import logging
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from trainer import schema
+
+PAYMENT_TYPES = {
+    "Credit Card": 0.45,
+    "Cash": 0.35,
+    "Mobile": 0.08,
+    "Prcard": 0.08,
+    "Unknown": 0.02,
+    "No Charge": 0.01,
+    "Dispute": 0.01,
+}
+
+COMPANIES = [
+    "Flash Cab",
+    "Taxi Affiliation Services",
+    "Sun Taxi",
+    "City Service",
+    "Chicago Carriage Cab Corp",
+    "Medallion Leasin",
+    "Globe Taxi",
+    "Blue Ribbon Taxi Association Inc.",
+    "Star North Management LLC",
+    "Choice Taxi Association",
+    "Taxicab Insurance Agency, LLC",
+    "Top Cab Affiliation",
+]
+
+# relative number of trips per hour of the day
+_HOURLY_TRIPS = np.array(
+    [3, 2, 2, 1, 1, 1, 2, 4, 6, 6, 6, 7, 8, 8, 8, 9, 10, 10, 9, 8, 7, 6, 5, 4],
+    dtype=np.float64,
+)
+
+
+def generate_trips(num_rows: int, label_name: str, seed: int = 0) -> pa.Table:
+    """Generate taxi trips with the columns and types of `ingest.sql`.
+    Args:
+        num_rows (int): number of trips
+        label_name (str): name of the label column (total fare)
+        seed (int): random seed
+    Returns:
+        table (pa.Table): trips, columns in the order of `schema.column_names`
+    """
+    rng = np.random.default_rng(seed)
+
+    hourofday = rng.choice(24, size=num_rows, p=_HOURLY_TRIPS / _HOURLY_TRIPS.sum())
+    trip_miles = np.round(rng.lognormal(mean=0.8, sigma=0.9, size=num_rows), 2) + 0.1
+    # straight line distance in meters is shorter than the driven route
+    trip_distance = trip_miles * 1609.34 * rng.uniform(0.55, 0.95, size=num_rows)
+    mph = rng.uniform(8.0, 30.0, size=num_rows)
+    trip_seconds = np.round(trip_miles / mph * 3600.0 + rng.uniform(60, 300, num_rows))
+
+    payment_type = rng.choice(
+        list(PAYMENT_TYPES), size=num_rows, p=list(PAYMENT_TYPES.values())
+    )
+    company = rng.choice(COMPANIES, size=num_rows)
+
+    fare = 3.25 + 2.25 * trip_miles + 0.25 * trip_seconds / 36.0
+    tips = np.where(
+        payment_type == "Credit Card", fare * rng.uniform(0.0, 0.25, num_rows), 0.0
+    )
+    extras = rng.choice([0.0, 1.0, 4.0], size=num_rows, p=[0.8, 0.15, 0.05])
+    total_fare = np.round(fare + tips + extras, 2)
+
+    columns = {
+        "dayofweek": rng.integers(1, 8, size=num_rows).astype(np.float64),
+        "hourofday": hourofday.astype(np.float64),
+        "trip_distance": trip_distance,
+        "trip_miles": trip_miles,
+        "trip_seconds": trip_seconds,
+        "payment_type": payment_type,
+        "company": company,
+        label_name: total_fare,
+    }
+    return pa.table({name: columns[name] for name in schema.column_names(label_name)})
+
+
+def write_shards(
+    output_dir: str,
+    num_rows: int,
+    label_name: str,
+    num_shards: int = 1,
+    data_format: str = "CSV",
+    seed: int = 0,
+) -> list:
+    """Write synthetic trips as shards like `extract_table_to_gcs_op` does.
+    Args:
+        output_dir (str): directory of the shards
+        num_rows (int): total number of trips
+        label_name (str): name of the label column
+        num_shards (int): number of files
+        data_format (str): CSV or PARQUET
+        seed (int): random seed
+    Returns:
+        files (list): paths of the written shards
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    extension = {"CSV": "csv", "PARQUET": "parquet"}[data_format.upper()]
+    table = generate_trips(num_rows, label_name, seed)
+
+    files = []
+    rows_per_shard = -(-num_rows // num_shards)
+    for shard in range(num_shards):
+        path = os.path.join(output_dir, f"{shard:03d}-000000000000.{extension}")
+        part = table.slice(shard * rows_per_shard, rows_per_shard)
+        if extension == "csv":
+            pa_csv.write_csv(part, path)
+        else:
+            pq.write_table(part, path)
+        files.append(path)
+
+    logging.info(f"Wrote {num_rows} synthetic trips to {num_shards} file(s)")
+    return files
@@ -16,6 +16,12 @@ if __name__ == "__main__":
 
     parser.add_argument("--test-data", type=str, required=True)
 
+    # number of rows of the training and validation splits, 0 if unknown (the
+    # test split is sharded across workers for evaluation, its size is unused)
+    parser.add_argument("--train-rows", type=int, default=0)
+
+    parser.add_argument("--valid-rows", type=int, default=0)
+
     parser.add_argument(
         "--model", default=os.getenv("AIP_MODEL_DIR"), type=str, help=""
     )
@@ -24,6 +30,9 @@ if __name__ == "__main__":
         "--checkpoints", default=os.getenv("AIP_CHECKPOINT_DIR"), type=str, help=""
     )
 
+    # SavedModel or checkpoint to initialize the model from, e.g. the champion
+    parser.add_argument("--warm-start-model", type=str, default="")
+
     parser.add_argument("--metrics", type=str, default="")
     # required=True)
 
@@ -0,0 +1,369 @@
+"""Local hyperparameter tuning with successive halving (Hyperband).
+
+The trials run in a pool of processes on one machine. The training and
+validation data are read and decoded once, and the preprocessing statistics
+computed once, then passed to the worker processes through shared memory (each
+worker copies the arrays into its own tensors once, when it starts).
+Weak trials are stopped early: each Hyperband bracket trains a number of trials
+for a few epochs and only continues the best `1 / eta` of them, e.g.:
+
+    python -m trainer.tuning --train-data=data/train --valid-data=data/valid \
+        --max-epochs=9 --workers=4
+
+prints the best parameters in the format of the Vertex AI hyperparameter tuning
+results (see `get_hyperparameter_tuning_results_op`).
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from trainer import model
+
+# search space of the training pipeline (`PARAMETER_SPEC` of `pipelines.training`)
+# as serialized by `hyperparameter_tuning_job.utils.serialize_parameters`, kept a
+# literal to be checked against the pipeline (pipelines/tests/test_training.py)
+PARAMETER_SPEC = [
+    {
+        "parameter_id": "learning-rate",
+        "double_value_spec": {"min_value": 0.0001, "max_value": 1.0},
+        "scale_type": "UNIT_LOG_SCALE",
+    },
+    {
+        "parameter_id": "batch-size",
+        "discrete_value_spec": {"values": [128, 256, 512]},
+        "scale_type": "UNIT_LINEAR_SCALE",
+    },
+]
+
+METRIC = "val_root_mean_squared_error"
+
+# `ScaleType.UNIT_LOG_SCALE` by name or by value
+_LOG_SCALE = ("UNIT_LOG_SCALE", 2)
+
+# state of a worker process, set by `_init_worker`
+_WORKER = {}
+
+
+def sample_parameters(parameter_spec: list, rng: np.random.Generator) -> dict:
+    """Draw random parameters from the search space.
+    Args:
+        parameter_spec (list): serialized Vertex AI parameter specs
+        rng (np.random.Generator): random generator
+    Returns:
+        parameters (dict): value of each parameter, by parameter id
+    """
+    parameters = {}
+    for spec in parameter_spec:
+        log = spec.get("scale_type") in _LOG_SCALE
+        if "double_value_spec" in spec:
+            low = float(spec["double_value_spec"]["min_value"])
+            high = float(spec["double_value_spec"]["max_value"])
+            if log:
+                value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                value = float(rng.uniform(low, high))
+        elif "integer_value_spec" in spec:
+            low = int(spec["integer_value_spec"]["min_value"])
+            high = int(spec["integer_value_spec"]["max_value"])
+            value = int(rng.integers(low, high + 1))
+        elif "discrete_value_spec" in spec:
+            value = float(rng.choice(spec["discrete_value_spec"]["values"]))
+            value = int(value) if value.is_integer() else value
+        elif "categorical_value_spec" in spec:
+            value = str(rng.choice(spec["categorical_value_spec"]["values"]))
+        else:
+            raise ValueError(f"Unsupported parameter spec: {spec}")
+        parameters[spec["parameter_id"]] = value
+    return parameters
+
+
+def load_arrays(input_data: str, label_name: str, model_params: dict) -> dict:
+    """Read all rows of the input data into NumPy arrays, one per column."""
+    dataset = model.create_dataset(
+        input_data,
+        label_name,
+        {**model_params, "shuffle_files": False, "shuffle_buffer_size": 0},
+    )
+    batches = list(dataset.as_numpy_iterator())
+    arrays = {
+        name: np.concatenate([features[name] for features, _ in batches])
+        for name in batches[0][0]
+    }
+    arrays[label_name] = np.concatenate([label for _, label in batches])
+    # fixed width strings can be stored in shared memory
+    return {
+        name: array.astype(np.bytes_) if array.dtype == object else array
+        for name, array in arrays.items()
+    }
+
+
+def share_arrays(arrays: dict) -> tuple:
+    """Copy arrays to shared memory.
+    Returns:
+        blocks (list): shared memory blocks, to be unlinked by the caller
+        descriptors (dict): `{name: (block name, shape, dtype)}` of each array
+    """
+    blocks, descriptors = [], {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        descriptors[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, descriptors
+
+
+def attach_arrays(descriptors: dict) -> tuple:
+    """Arrays in shared memory described by `share_arrays`, without copy."""
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _init_worker(data: dict, stats: dict, hparams: dict, threads: int) -> None:
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    label = hparams["label"]
+    _WORKER.update(stats=stats, hparams=hparams, blocks=[], data={})
+    for split, descriptors in data.items():
+        blocks, arrays = attach_arrays(descriptors)
+        _WORKER["blocks"] += blocks
+        # tensors are a copy of the shared arrays, made once per worker
+        features = {
+            name: tf.constant(array) for name, array in arrays.items() if name != label
+        }
+        _WORKER["data"][split] = (features, tf.constant(arrays[label]))
+
+
+def _dataset(split: str, batch_size: int, shuffle: bool):
+    import tensorflow as tf
+
+    features, labels = _WORKER["data"][split]
+    dataset = tf.data.Dataset.from_tensor_slices((features, labels))
+    if shuffle:
+        dataset = dataset.shuffle(_WORKER["hparams"]["shuffle_buffer_size"])
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def _run_trial(
+    trial_id: int, parameters: dict, epochs: int, initial_epoch: int, weights_dir: str
+) -> float:
+    """Train a trial up to `epochs`, continuing from its weights if any."""
+    hparams = {
+        **_WORKER["hparams"],
+        **{name.replace("-", "_"): value for name, value in parameters.items()},
+    }
+    keras_model = model.build_and_compile_model(_WORKER["stats"], hparams)
+    train_model, prepare = model.training_model(keras_model, hparams)
+
+    path = os.path.join(weights_dir, f"trial_{trial_id}")
+    if initial_epoch > 0:
+        train_model.load_weights(path)
+
+    history = train_model.fit(
+        prepare(_dataset("train", hparams["batch_size"], True)),
+        validation_data=prepare(_dataset("valid", hparams["batch_size"], False)),
+        epochs=epochs,
+        initial_epoch=initial_epoch,
+        verbose=0,
+    )
+    train_model.save_weights(path)
+    return float(history.history[hparams["metric"]][-1])
+
+
+def successive_halving(
+    pool,
+    trials: list,
+    min_epochs: int,
+    max_epochs: int,
+    eta: int,
+    goal: str,
+    weights_dir: str,
+) -> list:
+    """Train trials for `min_epochs`, keep the best `1 / eta`, train them `eta`
+    times longer and so on, until `max_epochs`. The last remaining trial is
+    trained up to `max_epochs`, so that a trial of each bracket reaches it.
+    Args:
+        pool (multiprocessing.Pool): worker processes (see `_init_worker`)
+        trials (list): trials with `id` and `parameters`
+        min_epochs (int): number of epochs of all trials
+        max_epochs (int): number of epochs of the remaining trials
+        eta (int): reduction factor
+        goal (str): "minimize" or "maximize" the metric
+        weights_dir (str): directory of the weights of the trials
+    Returns:
+        trials (list): all trials with the number of `epochs` they were trained
+            for and their last `metric`
+    """
+    sign = 1.0 if goal == "minimize" else -1.0
+    epochs, rung = min_epochs, trials
+    while True:
+        metrics = pool.starmap(
+            _run_trial,
+            [
+                (trial["id"], trial["parameters"], epochs, trial["epochs"], weights_dir)
+                for trial in rung
+            ],
+        )
+        for trial, metric in zip(rung, metrics):
+            trial.update(epochs=epochs, metric=metric)
+            logging.info(f"Trial {trial['id']} after {epochs} epoch(s): {metric}")
+
+        if epochs >= max_epochs:
+            return trials
+        rung = sorted(rung, key=lambda trial: sign * trial["metric"])
+        rung = rung[: max(1, len(rung) // eta)]
+        epochs = min(max_epochs, epochs * eta) if len(rung) > 1 else max_epochs
+
+
+def tune(
+    train_data: str,
+    valid_data: str,
+    hparams: dict,
+    parameter_spec: list = PARAMETER_SPEC,
+    metric: str = METRIC,
+    goal: str = "minimize",
+    max_epochs: int = 9,
+    eta: int = 3,
+    brackets: int = 0,
+    workers: int = 2,
+    seed: int = 0,
+) -> tuple:
+    """Search the best parameters with Hyperband.
+    Args:
+        train_data (str): path, file pattern or directory of the training data
+        valid_data (str): path, file pattern or directory of the validation data
+        hparams (dict): model hyper-parameters of all trials
+        parameter_spec (list): search space, serialized Vertex AI parameter specs
+        metric (str): Keras metric to optimize
+        goal (str): "minimize" or "maximize" the metric
+        max_epochs (int): maximum number of epochs of a trial
+        eta (int): reduction factor of successive halving
+        brackets (int): number of brackets, starting with the one with the most
+            trials and fewest epochs per trial, 0 runs all brackets
+        workers (int): number of worker processes
+        seed (int): random seed of the parameters
+    Returns:
+        best_parameters (dict): `{parameter_id: value}` of the best trial
+        trials (list): all trials
+    """
+    label = hparams["label"]
+    rng = np.random.default_rng(seed)
+    stats = model.get_preprocessing_stats(train_data, label, hparams)
+
+    s_max = int(math.floor(math.log(max_epochs, eta) + 1e-9))
+    num_brackets = min(brackets or s_max + 1, s_max + 1)
+
+    blocks, trials = [], []
+    try:
+        data = {}
+        for split, input_data in [("train", train_data), ("valid", valid_data)]:
+            split_blocks, data[split] = share_arrays(
+                load_arrays(input_data, label, hparams)
+            )
+            blocks += split_blocks
+
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        context = multiprocessing.get_context("spawn")
+        with tempfile.TemporaryDirectory() as weights_dir, context.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(data, stats, {**hparams, "metric": metric}, threads),
+        ) as pool:
+            for s in reversed(range(s_max + 1 - num_brackets, s_max + 1)):
+                num_trials = int(math.ceil((s_max + 1) / (s + 1) * eta**s))
+                min_epochs = max(1, int(round(max_epochs * eta**-s)))
+                logging.info(
+                    f"Bracket {s}: {num_trials} trial(s) from {min_epochs} epoch(s)"
+                )
+                bracket = [
+                    dict(
+                        id=len(trials) + i,
+                        bracket=s,
+                        parameters=sample_parameters(parameter_spec, rng),
+                        epochs=0,
+                        metric=None,
+                    )
+                    for i in range(num_trials)
+                ]
+                trials += successive_halving(
+                    pool, bracket, min_epochs, max_epochs, eta, goal, weights_dir
+                )
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    best_fn = min if goal == "minimize" else max
+    best_trial = best_fn(
+        [trial for trial in trials if trial["epochs"] == max_epochs],
+        key=lambda trial: trial["metric"],
+    )
+    logging.info(f"Best trial: {best_trial}")
+    return best_trial["parameters"], trials
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--train-data", type=str, required=True)
+
+    parser.add_argument("--valid-data", type=str, required=True)
+
+    parser.add_argument("--hparams", default={}, type=json.loads)
+
+    # serialized parameter specs, as passed to the hyperparameter tuning job
+    parser.add_argument("--parameter-spec", default=PARAMETER_SPEC, type=json.loads)
+
+    parser.add_argument("--metric", type=str, default=METRIC)
+
+    parser.add_argument("--goal", choices=["minimize", "maximize"], default="minimize")
+
+    parser.add_argument("--max-epochs", type=int, default=9)
+
+    parser.add_argument("--eta", type=int, default=3)
+
+    parser.add_argument("--brackets", type=int, default=0)
+
+    parser.add_argument("--workers", type=int, default=2)
+
+    parser.add_argument("--seed", type=int, default=0)
+
+    # file to write the best parameters and all trials to
+    parser.add_argument("--output", type=str, default="")
+
+    args = parser.parse_args()
+
+    hparams = {**model.DEFAULT_HPARAMS, **args.hparams}
+    best_parameters, trials = tune(
+        args.train_data,
+        args.valid_data,
+        hparams,
+        parameter_spec=args.parameter_spec,
+        metric=args.metric,
+        goal=args.goal,
+        max_epochs=args.max_epochs,
+        eta=args.eta,
+        brackets=args.brackets,
+        workers=args.workers,
+        seed=args.seed,
+    )
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(dict(best_parameters=best_parameters, trials=trials), fh)
+
+    print(json.dumps(best_parameters))
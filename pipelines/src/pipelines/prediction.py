@@ -8,7 +8,7 @@ from components import (
 )
 
 from google_cloud_pipeline_components.v1.bigquery import BigqueryQueryJobOp
-from pipelines.utils.query import generate_query
+from pipelines.utils.query import check_pipeline_scan_budget, generate_query
 
 # set training-serving skew thresholds and emails to receive alerts:
 ALERT_EMAILS = []
@@ -114,6 +114,7 @@ def pipeline(
 
 
 if __name__ == "__main__":
+    check_pipeline_scan_budget(pipeline)
     compiler.Compiler().compile(
         pipeline_func=pipeline, package_path="taxifare-prediction-pipeline.yaml"
     )
@@ -1,37 +1,135 @@
+-- Incremental ingestion keeps the tables and only ingests the new days,
+-- otherwise the tables are recreated
+DECLARE incremental BOOL DEFAULT {{ incremental }};
+-- Latest date of the source data of the previous ingestion, window of the
+-- ingested days, the days of the window which are not ingested yet and the
+-- mean trip_seconds of the window. Script variables are constants in the
+-- statements below, so that their filters prune the partitions
+DECLARE ingested_max_date, latest_date, window_start, window_end DATE;
+DECLARE new_days ARRAY<DATE>;
+DECLARE mean_trip_seconds INT64;
+
 -- Create dataset if it doesn't exist
 CREATE SCHEMA IF NOT EXISTS `{{ dataset }}`
   OPTIONS (
     description = 'Chicago Taxi Trips with Production-ready MLops on GCP Template',
     location = '{{ location }}');
 
--- Create (or replace) table with preprocessed data
-DROP TABLE IF EXISTS `{{ dataset }}.{{ table_ }}`;
-CREATE TABLE `{{ dataset }}.{{ table_ }}` AS (
--- Determine the latest available data date if use_latest_data is True
-WITH latest_data_date AS (
+-- Recreate the tables, also the ones of a previous ingestion without the
+-- date of the trips or the running sums of trip_seconds
+IF NOT incremental OR (
+    SELECT COUNT(*) FROM `{{ dataset }}.INFORMATION_SCHEMA.COLUMNS`
+    WHERE (table_name = '{{ table_ }}' AND column_name = 'trip_date')
+        OR (table_name = '{{ table_ }}_watermark'
+            AND column_name = 'trip_seconds_count')
+) < 2 THEN
+    DROP TABLE IF EXISTS `{{ dataset }}.{{ table_ }}`;
+    DROP TABLE IF EXISTS `{{ dataset }}.{{ table_ }}_watermark`;
+END IF;
+
+-- Table with preprocessed data, partitioned by the date of the trips
+CREATE TABLE IF NOT EXISTS `{{ dataset }}.{{ table_ }}` (
+    dayofweek FLOAT64,
+    hourofday FLOAT64,
+    trip_distance FLOAT64,
+    trip_miles FLOAT64,
+    trip_seconds FLOAT64,
+    payment_type STRING,
+    company STRING,
+    {% if label %}
+    `{{ label }}` FLOAT64,
+    {% endif %}
+    split_key INT64,
+    trip_date DATE
+)
+PARTITION BY trip_date;
+
+-- Watermark of the days of source data already in the preprocessed table,
+-- with the running sums of their trip_seconds
+CREATE TABLE IF NOT EXISTS `{{ dataset }}.{{ table_ }}_watermark` (
+    trip_date DATE,
+    max_date DATE,
+    trip_seconds_sum INT64,
+    trip_seconds_count INT64,
+    ingested_at TIMESTAMP
+);
+
+SET ingested_max_date = (
+    SELECT COALESCE(MAX(max_date), DATE '1970-01-01')
+    FROM `{{ dataset }}.{{ table_ }}_watermark`
+);
+
+-- Ingest data between 2 and 3 months ago from the latest available data date
+SET latest_date = (
     {% if use_latest_data %}
-    SELECT MAX(DATE(trip_start_timestamp)) AS max_date
+    SELECT MAX(DATE(trip_start_timestamp))
     FROM `{{ source }}`
+    -- The latest date only moves forward, only look at the data from the last one
+    WHERE trip_start_timestamp >= TIMESTAMP(ingested_max_date)
     {% else %}
-    SELECT DATE('{{ start_timestamp }}') AS max_date
+    SELECT DATE('{{ start_timestamp }}')
     {% endif %}
-)
--- Ingest data between 2 and 3 months ago from the latest available data date
-, filtered_data AS (
-    SELECT
-    *
-    FROM `{{ source }}`, latest_data_date
-    WHERE
-         DATE(trip_start_timestamp) BETWEEN
-         DATE_SUB(latest_data_date.max_date, INTERVAL 3 MONTH) AND
-         DATE_SUB(latest_data_date.max_date, INTERVAL 2 MONTH)
-)
--- Use the average trip_seconds as a replacement for NULL or 0 values
-, mean_time AS (
-    SELECT CAST(avg(trip_seconds) AS INT64) as avg_trip_seconds
-    FROM filtered_data
-)
+);
+SET window_start = DATE_SUB(latest_date, INTERVAL 3 MONTH);
+SET window_end = DATE_SUB(latest_date, INTERVAL 2 MONTH);
+
+SET new_days = ARRAY(
+    SELECT day
+    FROM UNNEST(GENERATE_DATE_ARRAY(window_start, window_end)) AS day
+    WHERE day NOT IN (
+        SELECT trip_date FROM `{{ dataset }}.{{ table_ }}_watermark`
+    )
+);
 
+-- Nothing to do until the window moves
+IF IFNULL(ARRAY_LENGTH(new_days), 0) = 0 THEN
+    RETURN;
+END IF;
+
+-- Evict the days which left the window
+DELETE FROM `{{ dataset }}.{{ table_ }}`
+WHERE trip_date NOT BETWEEN window_start AND window_end;
+
+DELETE FROM `{{ dataset }}.{{ table_ }}_watermark`
+WHERE trip_date NOT BETWEEN window_start AND window_end;
+
+-- Sums of the trip_seconds of the new days
+CREATE TEMP TABLE new_days_trip_seconds AS
+SELECT
+    DATE(trip_start_timestamp) AS trip_date,
+    SUM(trip_seconds) AS trip_seconds_sum,
+    COUNT(trip_seconds) AS trip_seconds_count
+FROM `{{ source }}`
+WHERE DATE(trip_start_timestamp) IN UNNEST(new_days)
+GROUP BY trip_date;
+
+-- Use the average trip_seconds of the whole window (not only of the new days)
+-- as a replacement for NULL or 0 values, from the sums of the ingested days
+SET mean_trip_seconds = (
+    SELECT CAST(SAFE_DIVIDE(SUM(trip_seconds_sum), SUM(trip_seconds_count)) AS INT64)
+    FROM (
+        SELECT trip_seconds_sum, trip_seconds_count
+        FROM `{{ dataset }}.{{ table_ }}_watermark`
+        UNION ALL
+        SELECT trip_seconds_sum, trip_seconds_count
+        FROM new_days_trip_seconds
+    )
+);
+
+INSERT INTO `{{ dataset }}.{{ table_ }}` (
+    dayofweek,
+    hourofday,
+    trip_distance,
+    trip_miles,
+    trip_seconds,
+    payment_type,
+    company,
+    {% if label %}
+    `{{ label }}`,
+    {% endif %}
+    split_key,
+    trip_date
+)
 SELECT
     CAST(EXTRACT(DAYOFWEEK FROM trip_start_timestamp) AS FLOAT64) AS dayofweek,
     CAST(EXTRACT(HOUR FROM trip_start_timestamp) AS FLOAT64) AS hourofday,
@@ -39,8 +137,8 @@ SELECT
         ST_GEOGPOINT(pickup_longitude, pickup_latitude),
         ST_GEOGPOINT(dropoff_longitude, dropoff_latitude)) AS trip_distance,
     trip_miles,
-    CAST(CASE WHEN trip_seconds IS NULL THEN m.avg_trip_seconds
-              WHEN trip_seconds <= 0 THEN m.avg_trip_seconds
+    CAST(CASE WHEN trip_seconds IS NULL THEN mean_trip_seconds
+              WHEN trip_seconds <= 0 THEN mean_trip_seconds
               ELSE trip_seconds
               END AS FLOAT64) AS trip_seconds,
     payment_type,
@@ -48,12 +146,34 @@ SELECT
     {% if label %}
     (fare + tips + tolls + extras) AS `{{ label }}`,
     {% endif %}
-FROM filtered_data AS t, mean_time AS m
+    -- Deterministic key of the trip, assigns it to a split (repeatable_splitting.sql)
+    FARM_FINGERPRINT(FORMAT('%t|%t|%t', unique_key, taxi_id, trip_start_timestamp))
+        AS split_key,
+    DATE(trip_start_timestamp) AS trip_date,
+FROM `{{ source }}`
 WHERE
-    trip_miles > 0 AND fare > 0 AND fare < 1500
+    DATE(trip_start_timestamp) IN UNNEST(new_days)
+    AND trip_miles > 0 AND fare > 0 AND fare < 1500
     {% for field in [
         'fare', 'trip_start_timestamp', 'pickup_longitude', 'pickup_latitude',
         'dropoff_longitude', 'dropoff_latitude','payment_type','company' ] %}
         AND `{{ field }}` IS NOT NULL
     {% endfor %}
-);
+;
+
+-- Record the ingested days, including the ones without valid trips
+INSERT INTO `{{ dataset }}.{{ table_ }}_watermark` (
+    trip_date,
+    max_date,
+    trip_seconds_sum,
+    trip_seconds_count,
+    ingested_at
+)
+SELECT
+    day,
+    latest_date,
+    IFNULL(trip_seconds_sum, 0),
+    IFNULL(trip_seconds_count, 0),
+    CURRENT_TIMESTAMP()
+FROM UNNEST(new_days) AS day
+LEFT JOIN new_days_trip_seconds ON trip_date = day;
@@ -1,6 +1,17 @@
-SELECT *
+-- Assign every row to one of {{ num_lots }} lots by its split key (see ingest.sql)
+-- in a single scan of the source table, partitioned by lot so that each split
+-- only reads its own lots
+CREATE OR REPLACE TABLE `{{ source_dataset }}.{{ source_table }}_lots`
+PARTITION BY RANGE_BUCKET(split_lot, GENERATE_ARRAY(0, {{ num_lots }}, 1))
+AS
+SELECT
+    *,
+    ABS(MOD(split_key, {{ num_lots }})) AS split_lot
 FROM
- `{{ source_project }}.{{ source_dataset }}.{{ source_table }}` AS t
-WHERE
-    MOD(ABS(FARM_FINGERPRINT(TO_JSON_STRING(t))),
-        {{ num_lots }}) IN {{ lots }}
+ `{{ source_dataset }}.{{ source_table }}`;
+{% for split, lots in splits.items() %}
+CREATE OR REPLACE TABLE `{{ source_dataset }}.{{ source_table }}_{{ split }}` AS
+SELECT * EXCEPT (trip_date, split_key, split_lot)
+FROM `{{ source_dataset }}.{{ source_table }}_lots`
+WHERE split_lot IN UNNEST({{ lots | list }});
+{% endfor %}
@@ -8,21 +8,21 @@ from components import (
     get_workerpool_spec_op,
     upload_best_model_op,
     get_hyperparameter_tuning_results_op,
+    lookup_model_op,
+    hyperparameter_tuning_job_op,
+    split_table_op,
 )
 
 from os import environ as env
 
 from google_cloud_pipeline_components.v1.bigquery import BigqueryQueryJobOp
 from google_cloud_pipeline_components.v1.custom_job import CustomTrainingJobOp
-from google_cloud_pipeline_components.v1.hyperparameter_tuning_job import (
-    HyperparameterTuningJobRunOp,
-)
 from google_cloud_pipeline_components.v1 import hyperparameter_tuning_job
 from google.cloud.aiplatform import hyperparameter_tuning as hpt
 
 from kfp import compiler, dsl
 
-from pipelines.utils.query import generate_query
+from pipelines.utils.query import check_pipeline_scan_budget, generate_query
 
 bq_source_uri = "bigquery-public-data.chicago_taxi_trips.taxi_trips"
 dataset = "prerocessing"
@@ -57,13 +57,26 @@ def pipeline(
     dataset: str = "taxi_trips_dataset",
     timestamp: str = "2022-12-01 00:00:00",  # Optional timestamp parameter
     use_latest_data: bool = True,  # Parameter to use the latest data or fixed timestamp
+    incremental_ingestion: bool = True,
     base_output_dir: str = "",
     training_job_display_name: str = "",
     model_name: str = "taxi-traffic-model",
+    data_format: str = "CSV",
+    extract_num_shards: int = 1,
+    warm_start: bool = False,
+    hypertune_max_trial_count: int = 6,
+    hypertune_epochs: int = 0,
+    hypertune_subsample_rate: float = 1.0,
+    hypertune_subsample_schedule: list = [],
+    hypertune_report_steps: int = 0,
+    hypertune_early_stopping: str = "",
+    hypertune_measurement_selection: str = "BEST_MEASUREMENT",
+    optimized_prune_fraction: float = 0.0,
+    optimized_model_tolerance: float = 0.01,
 ):
     """
     Training pipeline which:
-     1. Preprocesses data in BigQuery
+     1. Preprocesses the new days of data in BigQuery
      2. Extracts data to Cloud Storage
      3. Trains a model using a custom prebuilt container
      4. Uploads the model to Model Registry
@@ -81,9 +94,44 @@ def pipeline(
             (YYYY-MM-DDThh:mm:ss.sss±hh:mm or YYYY-MM-DDThh:mm:ss).
             If any time part is missing, it will be regarded as zero.
         use_latest_data (bool): Whether to use the latest available data
+        incremental_ingestion (bool): only preprocess the days which entered the
+            window since the last run, False recreates the preprocessed table
         base_output_dir (str): base output directory for the training job
         training_job_display_name (str): display name for the training job
         model_name (str): name of the model
+        data_format (str): format of the data extracted to Cloud Storage, CSV or
+            PARQUET. Parquet is read by the trainer without text parsing, but is
+            not supported as training dataset for model monitoring.
+        extract_num_shards (int): number of wildcard URIs each split is extracted
+            to, BigQuery writes as many files as needed behind each of them. 0
+            extracts each split to a single file, which fails for tables larger
+            than 1 GB.
+        warm_start (bool): initialize the model from the weights of the current
+            champion model (if any, and if its architecture matches) and train it
+            for fewer epochs (`warm_start_epochs` hyper-parameter). A champion
+            registered as its optimized variant warm starts from the full model
+            exported with it.
+        hypertune_max_trial_count (int): number of hyperparameter tuning trials
+        hypertune_epochs (int): number of epochs of each hyperparameter tuning
+            trial, 0 for the default of the trainer
+        hypertune_subsample_rate (float): fraction of the training data read in
+            each epoch of a hyperparameter tuning trial
+        hypertune_subsample_schedule (list): `[rate, epochs]` stages of each
+            hyperparameter tuning trial on growing fractions of the training
+            data, e.g. `[[0.1, 2], [0.3, 2], [1.0, 2]]`. Replaces
+            `hypertune_epochs` and `hypertune_subsample_rate`.
+        hypertune_report_steps (int): each trial reports an estimate of the
+            metric on a fixed validation subsample every N training steps, 0 to
+            only report the validation metric after each epoch
+        hypertune_early_stopping (str): automated stopping of unpromising trials
+            based on their reports, "MEDIAN", "DECAY_CURVE" or "" to disable
+        hypertune_measurement_selection (str): report of a trial compared to the
+            other trials, "BEST_MEASUREMENT" or "LAST_MEASUREMENT"
+        optimized_prune_fraction (float): fraction of the hidden units removed in
+            an optimized (pruned) variant of the model for CPU batch prediction,
+            0 to only train the model
+        optimized_model_tolerance (float): register the optimized variant if its
+            primary metric is worse by at most this fraction of the model's
     """
     PRIMARY_METRIC = "rootMeanSquaredError"
     queries_folder = pathlib.Path(__file__).parent / "queries"
@@ -117,6 +165,8 @@ def pipeline(
         label=label,
         start_timestamp=timestamp,
         use_latest_data=use_latest_data,
+        # a script variable, the parameter is only known at run time
+        incremental=incremental_ingestion,
     )
 
     prep_op = BigqueryQueryJobOp(
@@ -125,77 +175,44 @@ def pipeline(
         query=prep_query,
     ).set_display_name("Ingest & preprocess data")
 
-    split_train_query = generate_query(
+    # assign the rows to lots once and write the three splits in a single job
+    split_query = generate_query(
         input_file=queries_folder / "repeatable_splitting.sql",
         source_dataset=f"{project}.{dataset}",
         source_table=preprocessed_table,
         num_lots=10,
-        lots=tuple(range(8)),
-    )
-
-    split_valid_query = generate_query(
-        input_file=queries_folder / "repeatable_splitting.sql",
-        source_dataset=f"{project}.{dataset}",
-        source_table=preprocessed_table,
-        num_lots=10,
-        lots="(8)",
-    )
-
-    split_test_query = generate_query(
-        input_file=queries_folder / "repeatable_splitting.sql",
-        source_dataset=f"{project}.{dataset}",
-        source_table=preprocessed_table,
-        num_lots=10,
-        lots="(9)",
-    )
-
-    split_train_data = (
-        BigqueryQueryJobOp(
-            project=project,
-            location=bq_location,
-            query=split_train_query,
-        )
-        .after(prep_op)
-        .set_display_name("Split train data")
+        splits=dict(train=range(8), valid=[8], test=[9]),
     )
 
-    train_dataset = (
-        extract_table_to_gcs_op(bq_table=split_train_data.outputs["destination_table"])
-        .after(split_train_data)
-        .set_display_name("Extract training data from BigQuery to GCS")
-    )
-
-    split_valid_data = (
-        BigqueryQueryJobOp(
+    split_data = (
+        split_table_op(
             project=project,
             location=bq_location,
-            query=split_valid_query,
+            query=split_query,
+            dataset_id=f"{project}.{dataset}",
+            table_prefix=preprocessed_table,
         )
         .after(prep_op)
-        .set_display_name("Split valid data")
+        .set_display_name("Split train, valid & test data")
     )
 
-    valid_dataset = (
-        extract_table_to_gcs_op(bq_table=split_valid_data.outputs["destination_table"])
-        .after(split_valid_data)
-        .set_display_name("Extract validation data from BigQuery to GCS")
-    )
+    train_dataset = extract_table_to_gcs_op(
+        bq_table=split_data.outputs["train_table"],
+        destination_format=data_format,
+        num_shards=extract_num_shards,
+    ).set_display_name("Extract training data from BigQuery to GCS")
 
-    split_test_data = (
-        BigqueryQueryJobOp(
-            project=project,
-            location=bq_location,
-            query=split_test_query,
-        )
-        .after(prep_op)
-        .set_display_name("Split test data")
-    )
+    valid_dataset = extract_table_to_gcs_op(
+        bq_table=split_data.outputs["valid_table"],
+        destination_format=data_format,
+        num_shards=extract_num_shards,
+    ).set_display_name("Extract validation data from BigQuery to GCS")
 
-    test_dataset = (
-        extract_table_to_gcs_op(bq_table=split_test_data.outputs["destination_table"])
-        .after(split_test_data)
-        .set_display_name("Extract test data from BigQuery to GCS")
-    )
+    test_dataset = extract_table_to_gcs_op(
+        bq_table=split_data.outputs["test_table"],
+        destination_format=data_format,
+        num_shards=extract_num_shards,
+    ).set_display_name("Extract test data from BigQuery to GCS")
 
     # define training args
     args = dict(
@@ -205,9 +222,14 @@ def pipeline(
         hypertune=True,
     )
 
-    hypertune_args_step = get_training_args_dict_op(**args).set_display_name(
-        "Get-Hypertune-Args"
-    )
+    # trials train on a fraction of the data (low fidelity) to run more of them
+    hypertune_args_step = get_training_args_dict_op(
+        **args,
+        epochs=hypertune_epochs,
+        subsample_rate=hypertune_subsample_rate,
+        subsample_schedule=hypertune_subsample_schedule,
+        report_steps=hypertune_report_steps,
+    ).set_display_name("Get-Hypertune-Args")
 
     # create the workerpool spec for hyperparameter tuning
     # dont provide hyperparams, because they are defined in the PARAMETER_SPEC
@@ -218,8 +240,9 @@ def pipeline(
     ).set_display_name("Get-Hypertune-Worker-Pool-Spec")
 
     # create the actual hyperparameter tuning job
-    # here you can choose how many trials to do and how many to run in parallel
-    hypertune_step = HyperparameterTuningJobRunOp(
+    # here you can choose how many trials to do and how many to run in parallel,
+    # and stop trials early based on the metric they report during training
+    hypertune_step = hyperparameter_tuning_job_op(
         display_name="hypertune-job",
         project=project,
         location=location,
@@ -230,9 +253,11 @@ def pipeline(
         study_spec_parameters=hyperparameter_tuning_job.utils.serialize_parameters(
             PARAMETER_SPEC
         ),
-        max_trial_count=6,
+        max_trial_count=hypertune_max_trial_count,
         parallel_trial_count=2,
         base_output_directory=f"{base_output_dir}/hypertune-job",
+        study_spec_measurement_selection_type=hypertune_measurement_selection,
+        early_stopping=hypertune_early_stopping,
     ).set_display_name("Hypertune-Job")
 
     # now we can extract the results of the hyperparameter tuning job
@@ -245,13 +270,24 @@ def pipeline(
         ),
     ).set_display_name("Get-Hypertune-Results")
 
+    # look up the current champion to warm start the training from
+    champion_model = lookup_model_op(
+        model_name=model_name,
+        location=location,
+        project=project,
+        fail_on_model_not_found=False,
+    ).set_display_name("Look up champion model")
+
     # update our args dict for training
     args.update(dict(hypertune=False))
 
     # create the args dict
-    training_args_step = get_training_args_dict_op(**args).set_display_name(
-        "Get-Training-Args"
-    )
+    training_args_step = get_training_args_dict_op(
+        **args,
+        warm_start=warm_start,
+        champion_model=champion_model.outputs["model"],
+        optimized_prune_fraction=optimized_prune_fraction,
+    ).set_display_name("Get-Training-Args")
 
     # create the workerpool spec for training
     training_worker_pool_specs_step = get_workerpool_spec_op(
@@ -286,10 +322,12 @@ def pipeline(
         model_name=model_name,
         model_description="Predict price of a taxi trip.",
         pipeline_job_id="{{$.pipeline_job_name}}",
+        optimized_model_tolerance=optimized_model_tolerance,
     ).set_display_name("Upload model")
 
 
 if __name__ == "__main__":
+    check_pipeline_scan_budget(pipeline)
     compiler.Compiler().compile(
         pipeline_func=pipeline, package_path="taxifare-training-pipeline.yaml"
     )
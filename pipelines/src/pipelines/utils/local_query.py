@@ -0,0 +1,317 @@
+"""Run the BigQuery query templates locally on DuckDB.
+
+The BigQuery functions used by the queries are translated to DuckDB macros
+and the source tables are read from local Parquet samples, e.g. exported
+with `extract_table_to_gcs_op` or `bq extract --destination_format=PARQUET`:
+
+    python -m pipelines.utils.local_query \
+        --query_file=src/pipelines/queries/ingest.sql \
+        --source=bigquery-public-data.chicago_taxi_trips.taxi_trips=taxi_trips.parquet \
+        --param=dataset=local.taxi_trips_dataset --param=table_=preprocessed_data \
+        --param=label=total_fare --param=use_latest_data=true \
+        --database=local.duckdb
+
+BigQuery tables `project.dataset.table` are DuckDB tables of the same
+(quoted) name, so the tables of a query are the sources of the next one when
+the runs share `--database`. The results match BigQuery up to the values of
+`FARM_FINGERPRINT` (a different hash) and the formatting of `TO_JSON_STRING`.
+"""
+
+import argparse
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import duckdb
+
+from pipelines.utils.query import generate_query
+
+# DuckDB implementation of the BigQuery functions of the queries
+MACROS = {
+    "farm_fingerprint(x)": (
+        "CAST(CAST(hash(x) AS HUGEINT) - 9223372036854775808 AS BIGINT)"
+    ),
+    "to_json_string(x)": "CAST(to_json(x) AS VARCHAR)",
+    "st_geogpoint(longitude, latitude)": (
+        "{'longitude': longitude, 'latitude': latitude}"
+    ),
+    # haversine distance in meters on the sphere of BigQuery
+    "st_distance(a, b)": (
+        "2 * 6371008.8 * asin(sqrt("
+        "pow(sin(radians(b.latitude - a.latitude) / 2), 2)"
+        " + cos(radians(a.latitude)) * cos(radians(b.latitude))"
+        " * pow(sin(radians(b.longitude - a.longitude) / 2), 2)))"
+    ),
+    "date_sub(d, i)": "CAST(d - i AS DATE)",
+    "generate_date_array(a, b)": (
+        "list_transform(generate_series(CAST(a AS TIMESTAMP), CAST(b AS TIMESTAMP),"
+        " INTERVAL 1 DAY), d -> CAST(d AS DATE))"
+    ),
+    "bq_timestamp(x)": "CAST(x AS TIMESTAMP)",
+    "safe_divide(a, b)": "CASE WHEN b = 0 THEN NULL ELSE a / b END",
+    # BigQuery starts the week on Sunday = 1, DuckDB on Sunday = 0
+    "bq_dayofweek(x)": "dayofweek(x) + 1",
+}
+
+# BigQuery syntax without an equivalent macro
+REWRITES = [
+    (r"`", '"'),
+    (r"\bFLOAT64\b", "DOUBLE"),
+    (r"\bINT64\b", "BIGINT"),
+    (r"\bSTRING\b", "VARCHAR"),
+    (r"\bARRAY<(\w+)>", r"\1[]"),
+    (r"\*\s*EXCEPT\s*\(", "* EXCLUDE ("),
+    (r"\bEXTRACT\s*\(\s*DAYOFWEEK\s+FROM\s+", "bq_dayofweek("),
+    (r"\bTIMESTAMP\s*\(", "bq_timestamp("),
+    (r"\bCURRENT_TIMESTAMP\s*\(\s*\)", "CURRENT_TIMESTAMP"),
+    # columns of the tables of a dataset
+    (
+        r'"([^"]+)\.INFORMATION_SCHEMA\.COLUMNS"',
+        r"(SELECT replace(table_name, '\1.', '') AS table_name, column_name"
+        r" FROM information_schema.columns WHERE starts_with(table_name, '\1.'))",
+    ),
+    # storage options of the tables
+    (r"(?m)^\s*(PARTITION|CLUSTER)\s+BY\b.*$", ""),
+]
+
+
+def _split_arguments(sql: str, start: int) -> tuple:
+    """Arguments of the call whose opening parenthesis is at `start`, and the
+    index after its closing parenthesis."""
+    arguments, depth, begin, i = [], 0, start + 1, start
+    while i < len(sql):
+        char = sql[i]
+        if char == "'":
+            i = sql.index("'", i + 1)
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+            if depth == 0:
+                arguments.append(sql[begin:i].strip())
+                return arguments, i + 1
+        elif char == "," and depth == 1:
+            arguments.append(sql[begin:i].strip())
+            begin = i + 1
+        i += 1
+    raise ValueError(f"Unbalanced parentheses in {sql[start:]}")
+
+
+def _translate_format(sql: str) -> str:
+    """`FORMAT('%t', ...)` to `printf`, with the BigQuery rendering of NULL."""
+    while match := re.search(r"\bFORMAT\s*\(", sql, re.I):
+        (pattern, *values), end = _split_arguments(sql, match.end() - 1)
+        values = [f"COALESCE(CAST({v} AS VARCHAR), 'NULL')" for v in values]
+        printf = f"printf({', '.join([pattern.replace('%t', '%s'), *values])})"
+        sql = sql[: match.start()] + printf + sql[end:]
+    return sql
+
+
+def _translate_unnest(sql: str) -> str:
+    """`x IN UNNEST(array)` to a subquery, and name the column of
+    `UNNEST(array) AS name` like BigQuery does."""
+    position = 0
+    while match := re.compile(r"\bUNNEST\s*\(", re.I).search(sql, position):
+        _, end = _split_arguments(sql, match.end() - 1)
+        unnest = sql[match.start() : end]
+        alias = re.compile(r"\s+AS\s+(\w+)\b(?!\s*\()", re.I).match(sql, end)
+        before = re.search(r"\bIN\s*$", sql[: match.start()], re.I)
+        if before:
+            unnest = f"(SELECT {unnest})"
+        elif alias:
+            unnest += f"{alias.group(0)}({alias.group(1)})"
+            end = alias.end()
+        sql = sql[: match.start()] + unnest + sql[end:]
+        position = match.start() + len(unnest)
+    return sql
+
+
+def _split_condition(statement: str) -> tuple:
+    """Condition of `IF condition THEN statement` and the statement, if any."""
+    for then in re.finditer(r"\bTHEN\b", statement, re.I):
+        condition = statement[: then.start()]
+        if condition.count("(") == condition.count(")"):
+            return condition[2:].strip(), statement[then.end() :].strip()
+    raise ValueError(f"IF without THEN: {statement}")
+
+
+def translate_query(query: str) -> List[str]:
+    """
+    Translate a BigQuery script into DuckDB statements.
+
+    Script variables (`DECLARE`, `SET`) are DuckDB variables. The control flow
+    statements `IF condition THEN`, `END IF` and `RETURN` are left for
+    `run_query`, with the condition translated.
+
+    Args:
+        query (str): BigQuery query or script, e.g. from `generate_query`
+    Returns:
+        List[str]: DuckDB statements, without the `CREATE SCHEMA` statements
+            which only apply to BigQuery
+    """
+    query = re.sub(r"--[^\n]*", "", query)
+    variables = re.findall(r"^\s*DECLARE\s+(\w+(?:\s*,\s*\w+)*)\s", query, re.I | re.M)
+    variables = [name.strip() for names in variables for name in names.split(",")]
+
+    def translate(statement: str) -> str:
+        for pattern, replacement in REWRITES:
+            statement = re.sub(pattern, replacement, statement, flags=re.I)
+        for name in variables:
+            statement = re.sub(
+                rf"(?<![\w.\"'])\b{name}\b(?![\w\"'])",
+                f"getvariable('{name}')",
+                statement,
+            )
+        return _translate_unnest(_translate_format(statement)).strip()
+
+    statements = []
+    for statement in query.split(";"):
+        statement = statement.strip()
+        if re.match(r"IF\b", statement, re.I):
+            condition, statement = _split_condition(statement)
+            statements.append(f"IF {translate(condition)}")
+        if not statement or re.match(r"CREATE\s+SCHEMA\b", statement, re.I):
+            continue
+        declare = re.match(
+            r"DECLARE\s+(\w+(?:\s*,\s*\w+)*)\s+([\w<>]+)(?:\s+DEFAULT\s+(.*))?$",
+            statement,
+            re.I | re.S,
+        )
+        assign = re.match(r"SET\s+(\w+)\s*=\s*(.*)$", statement, re.I | re.S)
+        if declare:
+            names, data_type, default = declare.groups()
+            value = f"CAST(({translate(default or 'NULL')}) AS {translate(data_type)})"
+            statements += [
+                f"SET VARIABLE {name.strip()} = {value}" for name in names.split(",")
+            ]
+        elif assign:
+            statements.append(
+                f"SET VARIABLE {assign.group(1)} = {translate(assign.group(2))}"
+            )
+        elif re.match(r"(END\s+IF|RETURN)$", statement, re.I):
+            statements.append(" ".join(statement.upper().split()))
+        else:
+            statements.append(translate(statement))
+    return statements
+
+
+def connect(
+    database: str = ":memory:", sources: Dict[str, str] = None
+) -> duckdb.DuckDBPyConnection:
+    """
+    Connect to a DuckDB database which runs the translated queries.
+
+    Args:
+        database (str): DuckDB database file, in memory by default
+        sources (Dict[str, str]): Parquet file (or glob) of each source table,
+            by the `project.dataset.table` id of the BigQuery table
+    Returns:
+        duckdb.DuckDBPyConnection: connection with the macros of the BigQuery
+            functions and a view of each source
+    """
+    connection = duckdb.connect(database)
+    for signature, body in MACROS.items():
+        connection.execute(f"CREATE OR REPLACE MACRO {signature} AS {body}")
+    for table_id, path in (sources or {}).items():
+        connection.execute(
+            f'CREATE OR REPLACE VIEW "{table_id}" AS '
+            f"SELECT * FROM read_parquet('{path}')"
+        )
+    return connection
+
+
+def run_query(connection: duckdb.DuckDBPyConnection, query: str) -> dict:
+    """
+    Run a BigQuery query or script on DuckDB and time its statements.
+
+    The control flow statements of the script (`IF`, `RETURN`) are run here,
+    and temporary tables are dropped at the end, like the ones of a BigQuery
+    script.
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): connection from `connect`
+        query (str): BigQuery query or script, e.g. from `generate_query`
+    Returns:
+        dict: total `seconds`, and the `seconds` and `rows` produced (selected,
+            inserted, deleted or written) by each of the `statements`
+    """
+    report = dict(seconds=0.0, statements=[])
+    temporary = []
+    # depth of the IF blocks, and of the first one whose condition is false
+    depth, skipped = 0, 0
+    try:
+        for statement in translate_query(query):
+            if re.match(r"IF\b", statement):
+                depth += 1
+                if not skipped:
+                    (value,) = connection.execute(f"SELECT {statement[2:]}").fetchone()
+                    skipped = 0 if value else depth
+                continue
+            if statement == "END IF":
+                skipped = 0 if skipped == depth else skipped
+                depth -= 1
+                continue
+            if skipped:
+                continue
+            if statement == "RETURN":
+                break
+
+            start = time.perf_counter()
+            result = connection.execute(statement)
+            if re.match(r"(SELECT|WITH)\b", statement, re.I):
+                rows = len(result.fetchall())
+            else:
+                # row count of DML and CREATE TABLE AS, nothing for other DDL
+                count = result.fetchone() if result.description else None
+                rows = count[0] if count else 0
+            seconds = time.perf_counter() - start
+
+            report["seconds"] += seconds
+            report["statements"].append(
+                dict(
+                    statement=" ".join(statement.split()[:6]),
+                    seconds=seconds,
+                    rows=rows,
+                )
+            )
+            logging.info(f"{report['statements'][-1]}")
+            table = re.match(r"CREATE\s+TEMP(ORARY)?\s+TABLE\s+(\w+)", statement)
+            if table:
+                temporary.append(table.group(2))
+    finally:
+        for table in temporary:
+            connection.execute(f"DROP TABLE IF EXISTS {table}")
+    return report
+
+
+def _parse_value(value: str):
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--query_file", type=Path, required=True)
+    # <project>.<dataset>.<table>=<parquet file>
+    parser.add_argument("--source", type=str, action="append", default=[])
+    # <placeholder>=<value>, JSON values (numbers, booleans, lists...) are parsed
+    parser.add_argument("--param", type=str, action="append", default=[])
+    parser.add_argument("--database", type=str, default=":memory:")
+    parsed_args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+
+    sources = dict(source.split("=", 1) for source in parsed_args.source)
+    params = {
+        name: _parse_value(value)
+        for name, value in (param.split("=", 1) for param in parsed_args.param)
+    }
+    query = generate_query(parsed_args.query_file, **params)
+
+    report = run_query(connect(parsed_args.database, sources), query)
+    print(json.dumps(report, indent=2))
@@ -1,11 +1,40 @@
+import logging
+import re
+from functools import lru_cache
+from os import environ as env
 from pathlib import Path
-from jinja2 import Template
+from typing import Callable, Dict
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from google.protobuf.json_format import MessageToDict
+from jinja2 import Environment, FileSystemLoader
+
+# number of compiled templates kept by each environment, least recently used
+# templates are evicted first
+TEMPLATE_CACHE_SIZE = 64
+
+# placeholder of a pipeline parameter in the queries rendered at compile time
+PARAMETER_PLACEHOLDER = re.compile(
+    r"\{\{\$\.inputs\.parameters\['pipelinechannel--(\w+)'\]\}\}"
+)
+
+# dry run of a query, returns the estimated `bytes` it scans
+DryRun = Callable[[str], dict]
+
+
+@lru_cache(maxsize=None)
+def _environment(folder: str) -> Environment:
+    return Environment(loader=FileSystemLoader(folder), cache_size=TEMPLATE_CACHE_SIZE)
 
 
 def generate_query(input_file: Path, **replacements) -> str:
     """
     Read input file and replace placeholder using Jinja.
 
+    Templates are compiled once and cached, a template is only compiled again
+    when its file changes.
+
     Args:
         input_file (Path): input file to read
         replacements: keyword arguments to use to replace placeholders
@@ -13,7 +42,144 @@ def generate_query(input_file: Path, **replacements) -> str:
         str: replaced content of input file
     """
 
-    with open(input_file, "r") as f:
-        query_template = f.read()
+    input_file = Path(input_file)
+    template = _environment(str(input_file.parent)).get_template(input_file.name)
+
+    return template.render(**replacements)
+
+
+def bigquery_dry_run(project: str, location: str) -> DryRun:
+    """
+    Dry run of queries in BigQuery, which estimates the bytes they scan.
+
+    Queries which read tables that do not exist yet (e.g. created by a previous
+    step of the pipeline) cannot be estimated, their estimated bytes are None.
+
+    Args:
+        project (str): project id of the Google Cloud project
+        location (str): location of the BigQuery datasets
+    Returns:
+        DryRun: dry run of a query
+    """
+    client = bigquery.Client(project=project, location=location)
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+
+    def dry_run(query: str) -> dict:
+        try:
+            job = client.query(query, job_config=job_config)
+        except NotFound as e:
+            logging.warning(f"Query cannot be estimated: {e.message}")
+            return dict(bytes=None)
+        return dict(bytes=job.total_bytes_processed)
+
+    return dry_run
+
+
+def local_dry_run(table_bytes: Dict[str, int]) -> DryRun:
+    """
+    Dry run of queries without BigQuery, e.g. for tests.
+
+    A query is estimated to scan all the bytes of the tables it references, once
+    per reference. Tables missing from `table_bytes` (e.g. created by the query)
+    are not counted.
+
+    Args:
+        table_bytes (Dict[str, int]): size of each table by its
+            `project.dataset.table` id
+    Returns:
+        DryRun: dry run of a query
+    """
+
+    def dry_run(query: str) -> dict:
+        tables = re.findall(r"`([^`]+)`", query)
+        num_bytes = sum(table_bytes.get(table, 0) for table in tables)
+        return dict(bytes=num_bytes)
+
+    return dry_run
+
+
+def check_scan_budget(
+    pipeline_spec: dict, dry_run: DryRun, max_bytes: int
+) -> Dict[str, dict]:
+    """
+    Estimate the queries of a compiled pipeline and check they fit the budget.
+
+    The `query` inputs of the tasks are dry run with the pipeline parameters set
+    to their default values.
+
+    Args:
+        pipeline_spec (dict): compiled pipeline spec
+        dry_run (DryRun): dry run of a query, e.g. `bigquery_dry_run`
+        max_bytes (int): maximum number of bytes scanned by a query
+    Returns:
+        Dict[str, dict]: estimate of the query of each task by the task name
+    Raises:
+        ValueError: if a query is estimated to scan more than `max_bytes`
+    """
+    defaults = {
+        name: parameter["defaultValue"]
+        for name, parameter in pipeline_spec["root"]
+        .get("inputDefinitions", {})
+        .get("parameters", {})
+        .items()
+        if "defaultValue" in parameter
+    }
+
+    def default_value(match: re.Match) -> str:
+        return str(defaults.get(match.group(1), match.group(0)))
+
+    dags = [pipeline_spec["root"]["dag"]] + [
+        component["dag"]
+        for component in pipeline_spec.get("components", {}).values()
+        if "dag" in component
+    ]
+    estimates = {}
+    for dag in dags:
+        for name, task in dag["tasks"].items():
+            query = (
+                task.get("inputs", {})
+                .get("parameters", {})
+                .get("query", {})
+                .get("runtimeValue", {})
+                .get("constant")
+            )
+            if query:
+                estimates[name] = dry_run(
+                    PARAMETER_PLACEHOLDER.sub(default_value, query)
+                )
+                logging.info(f"Query of {name}: {estimates[name]}")
+
+    over_budget = {
+        name: estimate["bytes"]
+        for name, estimate in estimates.items()
+        if estimate["bytes"] is not None and estimate["bytes"] > max_bytes
+    }
+    if over_budget:
+        raise ValueError(
+            f"Queries estimated to scan more than {max_bytes} bytes: {over_budget}"
+        )
+    return estimates
+
+
+def check_pipeline_scan_budget(pipeline) -> None:
+    """
+    Check the queries of a pipeline in BigQuery before compiling it.
+
+    The budget (maximum bytes scanned by a query) is set by the
+    `QUERY_SCAN_BUDGET_BYTES` environment variable, nothing is checked if it
+    is not set.
+
+    Args:
+        pipeline: pipeline function decorated with `dsl.pipeline`
+    Raises:
+        ValueError: if a query is estimated to scan more than the budget
+    """
+    max_bytes = env.get("QUERY_SCAN_BUDGET_BYTES")
+    if not max_bytes:
+        return
 
-    return Template(query_template).render(**replacements)
+    check_scan_budget(
+        MessageToDict(pipeline.pipeline_spec),
+        bigquery_dry_run(env.get("VERTEX_PROJECT_ID"), env.get("BQ_LOCATION")),
+        int(max_bytes),
+    )
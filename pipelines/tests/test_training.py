@@ -0,0 +1,38 @@
+import ast
+import importlib
+from pathlib import Path
+
+from google.cloud.aiplatform_v1.types import StudySpec
+from google_cloud_pipeline_components.v1 import hyperparameter_tuning_job
+
+TUNING_MODULE = Path(__file__).parents[2] / "model" / "trainer" / "tuning.py"
+
+
+def trainer_parameter_spec() -> list:
+    """`PARAMETER_SPEC` of the trainer, read without the trainer packages"""
+    tree = ast.parse(TUNING_MODULE.read_text())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            getattr(target, "id", None) == "PARAMETER_SPEC" for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    raise AssertionError(f"no PARAMETER_SPEC in {TUNING_MODULE}")
+
+
+def test_parameter_spec_matches_trainer(monkeypatch):
+    # the pipeline is compiled on import, with the defaults of the environment
+    monkeypatch.setenv("VERTEX_PROJECT_ID", "test-project")
+    monkeypatch.setenv("VERTEX_LOCATION", "us-central1")
+    monkeypatch.setenv("BQ_LOCATION", "US")
+    monkeypatch.setenv("TRAINING_IMAGE", "test-image")
+    training = importlib.import_module("pipelines.training")
+
+    pipeline_spec = hyperparameter_tuning_job.serialize_parameters(
+        training.PARAMETER_SPEC
+    )
+    for spec in pipeline_spec:
+        assert not spec.pop("conditional_parameter_specs")
+        spec["scale_type"] = StudySpec.ParameterSpec.ScaleType(spec["scale_type"]).name
+
+    # the local Hyperband search of the trainer explores the same search space
+    assert pipeline_spec == trainer_parameter_spec()
@@ -0,0 +1,325 @@
+import datetime
+import pathlib
+
+import pytest
+
+from pipelines.utils.local_query import connect, run_query, translate_query
+from pipelines.utils.query import generate_query
+
+QUERIES = pathlib.Path(__file__).parents[2] / "src" / "pipelines" / "queries"
+SOURCE = "bigquery-public-data.chicago_taxi_trips.taxi_trips"
+DATASET = "test-project.taxi_trips_dataset"
+SPLITS = ["train", "valid", "test"]
+
+
+@pytest.fixture
+def taxi_trips(tmp_path):
+    """Parquet sample of taxi_trips, with trips from 2022-06-01 to 2022-12-12."""
+    path = tmp_path / "taxi_trips.parquet"
+    connection = connect()
+    connection.execute(f"""
+        COPY (
+            SELECT
+                'trip-' || i AS unique_key,
+                CASE WHEN i % 10 = 0 THEN NULL ELSE 'taxi-' || (i % 50) END
+                    AS taxi_id,
+                TIMESTAMP '2022-06-01' + to_minutes(i * 14) AS trip_start_timestamp,
+                CASE i % 4 WHEN 0 THEN NULL WHEN 1 THEN 0 ELSE 300 + i % 900 END
+                    AS trip_seconds,
+                (i % 97) / 10.0 AS trip_miles,
+                -87.7 + (i % 13) / 100.0 AS pickup_longitude,
+                41.8 + (i % 7) / 100.0 AS pickup_latitude,
+                -87.7 + (i % 11) / 100.0 AS dropoff_longitude,
+                41.8 + (i % 5) / 100.0 AS dropoff_latitude,
+                CASE WHEN i % 2 = 0 THEN 'Cash' ELSE 'Credit Card' END
+                    AS payment_type,
+                'Flash Cab' AS company,
+                (i % 50) + 3.25 AS fare,
+                1.0 AS tips,
+                0.0 AS tolls,
+                0.0 AS extras
+            FROM range(20000) AS t(i)
+        ) TO '{path}' (FORMAT PARQUET)
+        """)
+    return str(path)
+
+
+def ingest(connection, incremental: bool) -> dict:
+    query = generate_query(
+        QUERIES / "ingest.sql",
+        source=SOURCE,
+        location="US",
+        dataset=DATASET,
+        table_="preprocessed_data",
+        label="total_fare",
+        start_timestamp="",
+        use_latest_data=True,
+        incremental=incremental,
+    )
+    return run_query(connection, query)
+
+
+def rows(connection, table: str, exclude: str = "", where: str = "") -> list:
+    return connection.execute(
+        f'SELECT * {exclude} FROM "{DATASET}.{table}" {where} ORDER BY ALL'
+    ).fetchall()
+
+
+def statement_rows(report: dict, prefix: str) -> list:
+    """Rows of the statements of a report which start with `prefix`."""
+    return [
+        statement["rows"]
+        for statement in report["statements"]
+        if statement["statement"].startswith(prefix)
+    ]
+
+
+def test_translate_query():
+    statements = translate_query("""
+        -- comment; with a semicolon
+        CREATE SCHEMA IF NOT EXISTS `p.d` OPTIONS (location = 'US');
+        CREATE TABLE `p.d.t` (x INT64, y FLOAT64)
+        PARTITION BY RANGE_BUCKET(x, GENERATE_ARRAY(0, 10, 1));
+        SELECT * EXCEPT (x), FORMAT('%t|%t', x, CAST(y AS STRING)) AS key
+        FROM `p.d.t`
+        WHERE x IN UNNEST([0, 1]) AND EXTRACT(DAYOFWEEK FROM CURRENT_TIMESTAMP()) > 0
+        """)
+
+    assert statements == [
+        'CREATE TABLE "p.d.t" (x BIGINT, y DOUBLE)',
+        "SELECT * EXCLUDE (x), printf('%s|%s', "
+        "COALESCE(CAST(x AS VARCHAR), 'NULL'), "
+        "COALESCE(CAST(CAST(y AS VARCHAR) AS VARCHAR), 'NULL')) AS key\n"
+        '        FROM "p.d.t"\n'
+        "        WHERE x IN (SELECT UNNEST([0, 1])) "
+        "AND bq_dayofweek(CURRENT_TIMESTAMP) > 0",
+    ]
+
+
+def test_run_query_bigquery_functions():
+    connection = connect()
+    query = """
+        SELECT
+            EXTRACT(DAYOFWEEK FROM DATE '2024-01-07') AS sunday,
+            DATE_SUB(DATE '2024-05-31', INTERVAL 3 MONTH) AS end_of_february,
+            ROUND(ST_DISTANCE(ST_GEOGPOINT(0, 0), ST_GEOGPOINT(0, 1))) AS degree,
+            MOD(ABS(FARM_FINGERPRINT(TO_JSON_STRING(t))), 10) BETWEEN 0 AND 9 AS lot,
+            FORMAT('%t|%t', 'a', NULL) AS key
+        FROM (SELECT 1 AS x) AS t
+        """
+
+    (statement,) = translate_query(query)
+    result = connection.execute(statement).fetchall()
+    report = run_query(connection, query)
+
+    assert result == [(1, datetime.date(2024, 2, 29), 111195.0, True, "a|NULL")]
+    assert report["statements"][0]["rows"] == 1
+    assert report["seconds"] == report["statements"][0]["seconds"] > 0
+
+
+def test_run_query_ingest_and_split(taxi_trips):
+    connection = connect(sources={SOURCE: taxi_trips})
+
+    report = ingest(connection, incremental=False)
+    num_rows = len(rows(connection, "preprocessed_data"))
+    assert num_rows > 0
+    assert statement_rows(report, f'INSERT INTO "{DATASET}.preprocessed_data" (') == [
+        num_rows
+    ]
+
+    query = generate_query(
+        QUERIES / "repeatable_splitting.sql",
+        source_dataset=DATASET,
+        source_table="preprocessed_data",
+        num_lots=10,
+        splits=dict(train=range(8), valid=[8], test=[9]),
+    )
+    report = run_query(connection, query)
+
+    assert [statement["rows"] for statement in report["statements"]] == [
+        num_rows,
+        *(len(rows(connection, f"preprocessed_data_{split}")) for split in SPLITS),
+    ]
+    assert sum(len(rows(connection, f"preprocessed_data_{s}")) for s in SPLITS) == (
+        num_rows
+    )
+    # the split tables only have the columns read by the trainer
+    columns = connection.execute(
+        f'SELECT * FROM "{DATASET}.preprocessed_data_train" LIMIT 0'
+    ).description
+    assert [column[0] for column in columns] == [
+        "dayofweek",
+        "hourofday",
+        "trip_distance",
+        "trip_miles",
+        "trip_seconds",
+        "payment_type",
+        "company",
+        "total_fare",
+    ]
+    # temporary tables do not outlive the script
+    assert (
+        connection.execute("SELECT * FROM duckdb_tables() WHERE temporary").fetchall()
+        == []
+    )
+
+
+def test_translate_query_script():
+    statements = translate_query("""
+        DECLARE a, b DATE;
+        DECLARE days ARRAY<DATE> DEFAULT [];
+        SET a = DATE '2024-01-01';
+        SET days = ARRAY(SELECT day FROM UNNEST(GENERATE_DATE_ARRAY(a, b)) AS day);
+        IF ARRAY_LENGTH(days) = 0 THEN
+            RETURN;
+        END IF;
+        SELECT a FROM `p.d.t` WHERE b IN UNNEST(days)
+        """)
+
+    assert statements == [
+        "SET VARIABLE a = CAST((NULL) AS DATE)",
+        "SET VARIABLE b = CAST((NULL) AS DATE)",
+        "SET VARIABLE days = CAST(([]) AS DATE[])",
+        "SET VARIABLE a = DATE '2024-01-01'",
+        "SET VARIABLE days = ARRAY(SELECT day FROM UNNEST(GENERATE_DATE_ARRAY("
+        "getvariable('a'), getvariable('b'))) AS day(day))",
+        "IF ARRAY_LENGTH(getvariable('days')) = 0",
+        "RETURN",
+        "END IF",
+        "SELECT getvariable('a') FROM \"p.d.t\" "
+        "WHERE getvariable('b') IN (SELECT UNNEST(getvariable('days')))",
+    ]
+
+
+def test_run_query_control_flow():
+    connection = connect()
+    query = """
+        DECLARE v INT64 DEFAULT 1;
+        CREATE TABLE t (x INT64);
+        IF v = 1 THEN
+            INSERT INTO t VALUES (1);
+            IF v = 2 THEN
+                INSERT INTO t VALUES (2);
+            END IF;
+            INSERT INTO t VALUES (3);
+        END IF;
+        IF v = 2 THEN
+            RETURN;
+        END IF;
+        INSERT INTO t VALUES (4);
+        RETURN;
+        INSERT INTO t VALUES (5)
+        """
+
+    run_query(connection, query)
+
+    assert connection.execute("SELECT x FROM t ORDER BY x").fetchall() == [
+        (1,),
+        (3,),
+        (4,),
+    ]
+
+
+def test_run_query_incremental_ingestion(taxi_trips):
+    connection = connect(sources={SOURCE: taxi_trips})
+    # the data available on 2022-12-01
+    connection.execute(
+        f'CREATE OR REPLACE VIEW "{SOURCE}" AS '
+        f"SELECT * FROM read_parquet('{taxi_trips}') "
+        "WHERE trip_start_timestamp < TIMESTAMP '2022-12-01'"
+    )
+    ingest(connection, incremental=True)
+    first_days = rows(
+        connection, "preprocessed_data_watermark", "EXCLUDE (ingested_at)"
+    )
+
+    # no new data, nothing to ingest
+    report = ingest(connection, incremental=True)
+    assert statement_rows(report, "DELETE") == []
+    assert statement_rows(report, "INSERT") == []
+
+    # new data moves the window by 12 days
+    connection.execute(
+        f'CREATE OR REPLACE VIEW "{SOURCE}" AS '
+        f"SELECT * FROM read_parquet('{taxi_trips}')"
+    )
+    report = ingest(connection, incremental=True)
+    days = rows(connection, "preprocessed_data_watermark", "EXCLUDE (ingested_at)")
+    # the trip_seconds replacement of the days ingested by the first run is the
+    # mean of the first window
+    incremental = rows(connection, "preprocessed_data", "EXCLUDE (trip_seconds)")
+    new_days = "WHERE trip_date > DATE '2022-09-30'"
+    incremental_new_days = rows(connection, "preprocessed_data", where=new_days)
+
+    ingest(connection, incremental=False)
+    full = rows(connection, "preprocessed_data", "EXCLUDE (trip_seconds)")
+
+    assert incremental == full
+    assert incremental_new_days == rows(connection, "preprocessed_data", where=new_days)
+    assert (first_days[0][0], days[0][0]) == (
+        datetime.date(2022, 8, 30),
+        datetime.date(2022, 9, 12),
+    )
+    evicted, watermark_evicted = statement_rows(report, "DELETE")
+    (new_trips,) = statement_rows(
+        report, f'INSERT INTO "{DATASET}.preprocessed_data" ('
+    )
+    assert (evicted, watermark_evicted) > (0, 0)
+    assert 0 < new_trips < len(full)
+    # only the trip_seconds of the new days are summed from the source
+    assert statement_rows(report, "CREATE TEMP TABLE new_days_trip_seconds") == [
+        len(days) - len(first_days) + watermark_evicted
+    ]
+
+
+def test_run_query_ingestion_rebuilds_old_table(taxi_trips):
+    connection = connect(sources={SOURCE: taxi_trips})
+    # table of the full ingestion, before the trips had a date and split key
+    connection.execute(
+        f'CREATE TABLE "{DATASET}.preprocessed_data" AS '
+        "SELECT 1.0 AS dayofweek, 'Cash' AS payment_type"
+    )
+
+    ingest(connection, incremental=True)
+    incremental = rows(connection, "preprocessed_data")
+    ingest(connection, incremental=False)
+
+    assert len(incremental) > 0
+    assert incremental == rows(connection, "preprocessed_data")
+
+
+def test_run_query_full_ingestion_rebuilds_tables(taxi_trips):
+    connection = connect(sources={SOURCE: taxi_trips})
+    ingest(connection, incremental=True)
+    ingested = rows(connection, "preprocessed_data")
+    connection.execute(
+        f'DELETE FROM "{DATASET}.preprocessed_data" '
+        "WHERE trip_date = (SELECT MIN(trip_date) FROM "
+        f'"{DATASET}.preprocessed_data")'
+    )
+
+    # the incremental ingestion does not ingest the same days again
+    ingest(connection, incremental=True)
+    assert len(rows(connection, "preprocessed_data")) < len(ingested)
+
+    ingest(connection, incremental=False)
+    assert rows(connection, "preprocessed_data") == ingested
+
+
+def test_run_query_ingestion_rebuilds_old_watermark(taxi_trips):
+    connection = connect(sources={SOURCE: taxi_trips})
+    ingest(connection, incremental=True)
+    ingested = rows(connection, "preprocessed_data")
+    # watermark without the running sums of trip_seconds
+    connection.execute(
+        f'ALTER TABLE "{DATASET}.preprocessed_data_watermark" '
+        "DROP COLUMN trip_seconds_count"
+    )
+
+    ingest(connection, incremental=True)
+
+    assert rows(connection, "preprocessed_data") == ingested
+    columns = connection.execute(
+        f'SELECT * FROM "{DATASET}.preprocessed_data_watermark" LIMIT 0'
+    ).description
+    assert "trip_seconds_count" in [column[0] for column in columns]
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from pipelines.utils.query import (
+    _environment,
+    check_scan_budget,
+    generate_query,
+    local_dry_run,
+)
+
+QUERY = (
+    "SELECT * FROM `{{$.inputs.parameters['pipelinechannel--project']}}"
+    ".{{$.inputs.parameters['pipelinechannel--dataset']}}.preprocessed_data`"
+)
+
+
+def pipeline_spec(query: str) -> dict:
+    """Compiled pipeline spec with a query task in the root and a nested DAG."""
+    return {
+        "root": {
+            "inputDefinitions": {
+                "parameters": {
+                    "project": {"defaultValue": "test-project"},
+                    "dataset": {"defaultValue": "test-dataset"},
+                    "model_name": {"defaultValue": "test-model"},
+                }
+            },
+            "dag": {
+                "tasks": {
+                    "bigquery-query-job": {
+                        "inputs": {
+                            "parameters": {
+                                "query": {"runtimeValue": {"constant": query}}
+                            }
+                        }
+                    },
+                    "condition-1": {"inputs": {"parameters": {}}},
+                }
+            },
+        },
+        "components": {
+            "comp-condition-1": {
+                "dag": {
+                    "tasks": {
+                        "split-table-op": {
+                            "inputs": {
+                                "parameters": {
+                                    "query": {
+                                        "runtimeValue": {
+                                            "constant": "SELECT * FROM `source`"
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "comp-lookup-model-op": {"executorLabel": "exec-lookup-model-op"},
+        },
+    }
+
+
+def test_generate_query_compiles_templates_once(tmp_path, mocker):
+    template = tmp_path / "query.sql"
+    template.write_text("SELECT * FROM `{{ table }}`")
+    compile_spy = mocker.spy(_environment(str(tmp_path)), "compile")
+
+    queries = [generate_query(template, table=table) for table in ["a", "b", "a"]]
+
+    assert queries == ["SELECT * FROM `a`", "SELECT * FROM `b`", "SELECT * FROM `a`"]
+    assert compile_spy.call_count == 1
+
+
+def test_generate_query_reloads_changed_templates(tmp_path):
+    template = tmp_path / "query.sql"
+    template.write_text("SELECT 1")
+    assert generate_query(template) == "SELECT 1"
+
+    # the template is reloaded when its modification time changes
+    template.write_text("SELECT 2")
+    mtime = template.stat().st_mtime
+    os.utime(template, (mtime + 10, mtime + 10))
+
+    assert generate_query(template) == "SELECT 2"
+
+
+def test_local_dry_run():
+    dry_run = local_dry_run({"p.d.source": 1_000_000, "p.d.other": 10})
+
+    estimate = dry_run(
+        "CREATE TABLE `p.d.target` AS SELECT * FROM `p.d.source`;"
+        "INSERT INTO `p.d.target` SELECT * FROM `p.d.source`"
+    )
+
+    assert estimate == dict(bytes=2_000_000)
+
+
+def test_check_scan_budget():
+    dry_run = local_dry_run({"test-project.test-dataset.preprocessed_data": 100})
+
+    estimates = check_scan_budget(pipeline_spec(QUERY), dry_run, max_bytes=100)
+
+    # the placeholders of the pipeline parameters are set to the defaults
+    assert estimates == {
+        "bigquery-query-job": dict(bytes=100),
+        "split-table-op": dict(bytes=0),
+    }
+
+
+def test_check_scan_budget_over_budget():
+    dry_run = local_dry_run({"test-project.test-dataset.preprocessed_data": 101})
+
+    with pytest.raises(ValueError) as exc_info:
+        check_scan_budget(pipeline_spec(QUERY), dry_run, max_bytes=100)
+
+    assert str(exc_info.value) == (
+        "Queries estimated to scan more than 100 bytes: {'bigquery-query-job': 101}"
+    )
+
+
+def test_check_scan_budget_unknown_estimate():
+    def dry_run(query: str) -> dict:
+        return dict(bytes=None)
+
+    estimates = check_scan_budget(pipeline_spec(QUERY), dry_run, max_bytes=0)
+
+    assert estimates["bigquery-query-job"] == dict(bytes=None)